@@ -1,110 +1,46 @@
 import streamlit as st
-import json
-import re
-import google.generativeai as genai
-
-# Retrieve the API key from secrets
-api_key = st.secrets["api_key"]
-genai.configure(api_key=api_key)
-
-generation_config = {
-    "temperature": 0,
-    "top_p": 1.0,
-    "top_k": 34,
-    "max_output_tokens": 8192,
-    "response_mime_type": "text/plain",
-}
-
-model = genai.GenerativeModel(
-    model_name="gemini-1.5-flash",
-    generation_config=generation_config,
-)
 
-def extract_transcript_from_json(json_file):
-    """Extract recognizedText from the JSON file."""
-    transcript_text = ""
-    data = json.load(json_file)
-    
-    for transcript in data['transcripts']:
-        for turn in transcript['speakerTurns']:
-            for alt in turn['alternatives']:
-                transcript_text += alt['recognizedText'] + " "
-    
-    return transcript_text.strip()
-
-def generate_chart_notes_with_citations(transcript, template):
-    """Generate chart notes with citations using the model."""
-    prompt = f"""Create chart notes as per the {template} for the {transcript}. Include citations for specific information extracted from the transcript, strictly referencing all the exact statements throughout the transcript. The citations must follow these rules:
-    1. Number the references sequentially in the order they first appear in the text.
-    2. Use a unique citation number for each unique statement. If the same statement is cited again, use the existing citation number.
-    3. Format citations as: {{References: [1]: "citation text", [2]: "citation text"}}."""
-    
-    response = model.generate_content([prompt])
-    content_text = response.candidates[0].content.parts[0].text.strip()
-    return content_text
-
-def parse_chart_notes_for_citations(chart_notes):
-    """Parse the chart notes to extract sentences and associated citations, ensuring correct sequential numbering."""
-    citation_pattern = re.compile(r'\{References: ([^}]+)\}')
-    notes = []
-    citations_dict = {}
-    all_citations = {}
-    next_citation_number = 1
-
-    for line in chart_notes.splitlines():
-        citations = citation_pattern.findall(line)
-        clean_sentence = citation_pattern.sub('', line).strip()
-
-        if clean_sentence:
-            if citations:
-                notes.append(clean_sentence)
-        
-        if citations:
-            citation_texts = citations[0].split(', ')
-            for citation in citation_texts:
-                match = re.search(r'\[(\d+)\]:\s*"(.*?)"', citation)
-                if match:
-                    citation_number, citation_text = match.groups()
-                    
-                    if citation_text not in all_citations:
-                        all_citations[citation_text] = f"[{next_citation_number}]"
-                        next_citation_number += 1
-                    
-                    if clean_sentence in citations_dict:
-                        citations_dict[clean_sentence].append(f'{all_citations[citation_text]}: "{citation_text}"')
-                    else:
-                        citations_dict[clean_sentence] = [f'{all_citations[citation_text]}: "{citation_text}"']
-
-    return notes, citations_dict
-
-def highlight_citations(transcript, citations_dict, selected_note):
-    """Highlight all citations in the transcript based on the selected note."""
-    if selected_note in citations_dict:
-        citation_texts = [citation.split(": ")[1].strip('"') for citation in citations_dict[selected_note]]
-        for citation_text in citation_texts:
-            citation_text_escaped = re.escape(citation_text)
-            transcript = re.sub(citation_text_escaped, f"<mark style='background-color: yellow'>{citation_text}</mark>", transcript, flags=re.IGNORECASE)
-    return transcript
-
-def format_citations_dictionary(citations_dict):
-    """Format citations dictionary as a string for download."""
-    formatted_citations = []
-    for note, citations in citations_dict.items():
-        formatted_citations.append(f"Note: {note}")
-        for citation in citations:
-            formatted_citations.append(f"  {citation}")
-        formatted_citations.append("")  # Add a blank line between notes
-    return "\n".join(formatted_citations)
+from chart_notes.citations import format_citations_dictionary, numbered_citations
+from chart_notes.highlight import HighlightCache
+from chart_notes.metrics import new_trace_id
+from chart_notes.pipeline import GENERATION_CONFIG, ChartNotesPipeline
+from chart_notes.resources import PipelineResources
+from transcript_viewer import transcript_viewer
+
+@st.cache_resource
+def get_pipeline():
+    """Pipeline stages over the model backend, client, caches and metrics shared by every session."""
+    return ChartNotesPipeline(PipelineResources(st.secrets, GENERATION_CONFIG))
+
+pipeline = get_pipeline()
+resources = pipeline.resources
+metrics = pipeline.metrics
+# The spans recorded during one script run share a trace id
+trace_id = new_trace_id()
+
+def resolve_note_spans(prepared, citations_dict, note):
+    """Spans of one note's citations, for a note no longer in the highlight cache."""
+    return pipeline.resolve_spans(prepared, {note: citations_dict.get(note, [])}, trace_id, all_occurrences=True)[note]
+
+def show_transcript(prepared, citations_dict, selected_note):
+    """Transcript viewer with the selected note's citations highlighted; the text is sent once per upload."""
+    scored_spans = st.session_state.highlight_cache.get(
+        prepared.text_hash, selected_note, lambda note: resolve_note_spans(prepared, citations_dict, note))
+    spans = [span for span, _ in scored_spans]
+    with metrics.span("render", trace_id, transcript_chars=len(prepared.text), spans=len(spans)) as span:
+        span.set(text_sent=transcript_viewer(prepared.text, prepared.text_hash, spans, prepared.astral_offsets))
 
 # Initialize session state variables
-if "transcript" not in st.session_state:
-    st.session_state.transcript = ""
+if "prepared" not in st.session_state:
+    st.session_state.prepared = None
 if "chart_notes_with_citations" not in st.session_state:
     st.session_state.chart_notes_with_citations = ""
 if "notes" not in st.session_state:
     st.session_state.notes = []
 if "citations_dict" not in st.session_state:
     st.session_state.citations_dict = {}
+if "highlight_cache" not in st.session_state:
+    st.session_state.highlight_cache = HighlightCache()
 if "selected_note" not in st.session_state:
     st.session_state.selected_note = ""
 
@@ -114,20 +50,24 @@ uploaded_file = st.file_uploader("Upload a JSON or TXT file containing the trans
 if uploaded_file:
     template = st.text_area("Paste your template here:")
     
-    if uploaded_file.type == "application/json":
-        transcript = extract_transcript_from_json(uploaded_file)
-    elif uploaded_file.type == "text/plain":
-        transcript = uploaded_file.read().decode("utf-8")
+    with metrics.span("upload_decode", trace_id, content_type=uploaded_file.type) as span:
+        data = uploaded_file.getvalue()
+        span.set(upload_bytes=len(data))
 
-    st.session_state.transcript = transcript
+    # Parsed and indexed only when the uploaded bytes change; reruns reuse the prepared transcript
+    prepared, _ = pipeline.prepare_upload(data, uploaded_file.type, trace_id)
+    st.session_state.prepared = prepared
 
     if st.button("Generate Chart Notes"):
-        chart_notes_with_citations = generate_chart_notes_with_citations(transcript, template)
-        notes, citations_dict = parse_chart_notes_for_citations(chart_notes_with_citations)
+        chart_notes_with_citations, _ = pipeline.generate_chart_notes(prepared.transcript, template, trace_id)
+        # Parsed locally only: this view never made the citation-structuring model call
+        notes, citations_dict = pipeline.parse_citations(chart_notes_with_citations, trace_id, fallback=False)
         
         st.session_state.chart_notes_with_citations = chart_notes_with_citations
         st.session_state.notes = notes
         st.session_state.citations_dict = citations_dict
+        st.session_state.highlight_cache.put_all(
+            prepared.text_hash, pipeline.resolve_spans(prepared, citations_dict, trace_id, all_occurrences=True))
 
     if st.session_state.notes:
         col1, col2 = st.columns(2)
@@ -135,7 +75,6 @@ if uploaded_file:
         with col1:
             st.subheader("Transcript")
             transcript_area = st.empty()
-            transcript_area.markdown(st.session_state.transcript, unsafe_allow_html=True)
 
         with col2:
             st.subheader("Generated Chart Notes")
@@ -148,13 +87,21 @@ if uploaded_file:
 
                 # Display citations and highlight transcript
                 if selected_note and selected_note in st.session_state.citations_dict:
-                    citations = st.session_state.citations_dict[selected_note]
+                    citations = numbered_citations(st.session_state.citations_dict)[selected_note]
                     for i, citation in enumerate(citations):
                         st.text_area(f"Citation {i+1}", value=citation, height=100, key=f"citation_{i}")
-                    
-                    highlighted_transcript = highlight_citations(st.session_state.transcript, st.session_state.citations_dict, selected_note)
-                    transcript_area.markdown(highlighted_transcript, unsafe_allow_html=True)
+
+        # Highlight the selected note's citations in the transcript column
+        with transcript_area.container():
+            show_transcript(st.session_state.prepared, st.session_state.citations_dict, st.session_state.selected_note)
 
         st.download_button("Download Chart Notes", data=st.session_state.chart_notes_with_citations, file_name="chart_notes.txt", mime="text/plain")
-        citations_text = format_citations_dictionary(st.session_state.citations_dict)
+        citations_text = format_citations_dictionary(numbered_citations(st.session_state.citations_dict))
         st.download_button("Download Citations Dictionary", data=citations_text, file_name="citations_dictionary.txt", mime="text/plain")
+
+cache_stats = resources.response_cache.stats
+st.sidebar.caption(
+    f"Response cache: {cache_stats['memory_hits'] + cache_stats['disk_hits']} hits, {cache_stats['misses']} misses"
+)
+llm_stats = resources.llm_client.stats
+st.sidebar.caption(f"Prompt tokens: {llm_stats['prompt_tokens']} ({llm_stats['cached_tokens']} from cached templates)")
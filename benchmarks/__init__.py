@@ -0,0 +1 @@
+"""Benchmarks for the chart note pipeline. Run modules with ``python -m benchmarks.<name>``."""
@@ -0,0 +1,94 @@
+"""Citation alignment: exact regex matching vs the fuzzy token aligner across transcript lengths.
+
+    python -m benchmarks.bench_align --chars 1000 10000 100000 1000000 --citations 50
+"""
+
+import argparse
+import random
+import re
+import time
+
+from chart_notes.align import STOP_WORDS, CitationAligner
+from chart_notes.index import TOKEN_PATTERN, TranscriptIndex
+
+CONTENT_WORDS = ("pain chest left arm started two weeks ago walking worse night blood pressure "
+                 "medication lisinopril morning headache dizziness sleep diet exercise referral "
+                 "cardiology labs ordered swelling ankles shortness breath fever cough nausea").split()
+FILLER_WORDS = "um uh yeah you know like so the a and it is was I have been of to".split()
+
+
+def make_transcript(chars, seed=0):
+    """Doctor/patient turns mixing content words with fillers, about ``chars`` long."""
+    rng = random.Random(seed)
+    turns = []
+    length = 0
+    while length < chars:
+        words = [rng.choice(FILLER_WORDS if rng.random() < 0.4 else CONTENT_WORDS) for _ in range(rng.randint(6, 30))]
+        turn = f"{'Doctor' if len(turns) % 2 == 0 else 'Patient'}: {' '.join(words)}."
+        turns.append(turn)
+        length += len(turn) + 1
+    return " ".join(turns)[:chars]
+
+
+def make_references(transcript, count, seed=0):
+    """(reference, true start, true end) triples the way the model writes them.
+
+    Each reference is a transcript span with stop words and fillers removed and, half of
+    the time, one content word dropped or misspelt.
+    """
+    rng = random.Random(seed)
+    tokens = list(TOKEN_PATTERN.finditer(transcript))
+    references = []
+    while len(references) < count and len(tokens) > 16:
+        first = rng.randrange(len(tokens) - 16)
+        span = tokens[first:first + rng.randint(8, 16)]
+        words = [match.group() for match in span if match.group().lower() not in STOP_WORDS]
+        if len(words) < 4:
+            continue
+        if rng.random() < 0.5:
+            position = rng.randrange(len(words))
+            if rng.random() < 0.5:
+                del words[position]
+            else:
+                words[position] = words[position][:-1] or words[position]
+        references.append((" ".join(words), span[0].start(), span[-1].end()))
+    return references
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chars", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--citations", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'chars':>9} {'regex hit':>9} {'regex ms':>9} {'build s':>8} {'align ms':>9} {'found':>6} "
+          f"{'correct':>8} {'score':>6}")
+    for chars in args.chars:
+        transcript = make_transcript(chars)
+        references = make_references(transcript, args.citations)
+
+        start = time.perf_counter()
+        regex_hits = sum(
+            bool(re.search(re.escape(reference), transcript, flags=re.IGNORECASE)) for reference, _, _ in references
+        )
+        regex_time = (time.perf_counter() - start) / len(references)
+
+        start = time.perf_counter()
+        aligner = CitationAligner(TranscriptIndex(transcript))
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        alignments = [aligner.align(reference) for reference, _, _ in references]
+        align_time = (time.perf_counter() - start) / len(references)
+
+        found = [(alignment, true_start, true_end)
+                 for alignment, (_, true_start, true_end) in zip(alignments, references) if alignment]
+        correct = sum(alignment.start < true_end and true_start < alignment.end for alignment, true_start, true_end in found)
+        mean_score = sum(alignment.score for alignment, _, _ in found) / len(found) if found else 0.0
+        print(f"{chars:>9} {regex_hits / len(references):>9.2f} {regex_time * 1e3:>9.3f} {build_time:>8.3f} "
+              f"{align_time * 1e3:>9.3f} {len(found) / len(references):>6.2f} "
+              f"{correct / len(references):>8.2f} {mean_score:>6.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Compare transcript JSON ingestion: whole-document json.load vs the streaming parser.
+
+    python -m benchmarks.bench_ingest --turns 1000 10000 100000
+"""
+
+import argparse
+import io
+import json
+import random
+import time
+import tracemalloc
+
+from chart_notes.transcript import extract_transcript_text
+
+WORDS = ("pain chest left arm started two weeks ago after walking worse at night "
+         "blood pressure medication lisinopril morning headache dizziness sleep "
+         "diet exercise follow up referral cardiology labs ordered").split()
+
+
+def make_transcript_json(turns, seed=0):
+    """Build a synthetic transcript in the transcripts/speakerTurns/alternatives schema."""
+    rng = random.Random(seed)
+    speaker_turns = []
+    for i in range(turns):
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 40)))
+        speaker_turns.append({
+            "speakerId": "doctor" if i % 2 == 0 else "patient",
+            "alternatives": [{"recognizedText": text, "confidence": 0.9}],
+        })
+    return json.dumps({"transcripts": [{"speakerTurns": speaker_turns}]}).encode("utf-8")
+
+
+def legacy_extract(json_file):
+    """The original extract_transcript_from_json implementation."""
+    transcript_text = ""
+    data = json.load(json_file)
+
+    for transcript in data['transcripts']:
+        for turn in transcript['speakerTurns']:
+            for alt in turn['alternatives']:
+                transcript_text += alt['recognizedText'] + " "
+
+    return transcript_text.strip()
+
+
+def measure(func, payload):
+    """Return (seconds, peak traced bytes, result) for calls on fresh file objects.
+
+    Time and memory are taken from separate runs because tracemalloc slows allocation down.
+    """
+    start = time.perf_counter()
+    result = func(io.BytesIO(payload))
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    func(io.BytesIO(payload))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, nargs="+", default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    print(f"{'turns':>8} {'MB':>8} {'legacy s':>10} {'legacy MB':>10} {'stream s':>10} {'stream MB':>10}")
+    for turns in args.turns:
+        payload = make_transcript_json(turns)
+        legacy_time, legacy_peak, legacy_text = measure(legacy_extract, payload)
+        stream_time, stream_peak, stream_text = measure(extract_transcript_text, payload)
+        assert legacy_text == stream_text
+        print(f"{turns:>8} {len(payload) / 1e6:>8.2f} {legacy_time:>10.3f} {legacy_peak / 1e6:>10.2f} "
+              f"{stream_time:>10.3f} {stream_peak / 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
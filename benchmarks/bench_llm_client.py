@@ -0,0 +1,66 @@
+"""Throughput of serial model calls vs AsyncLLMClient against a stub backend that injects 429s.
+
+    python -m benchmarks.bench_llm_client --calls 60 --latency 0.2 --server-concurrency 6
+"""
+
+import argparse
+import asyncio
+import time
+
+from chart_notes.backends import StubBackend
+from chart_notes.llm import AsyncLLMClient, is_rate_limit_error
+
+
+def run_serial(model, prompts):
+    """The apps' original pattern: one blocking call after another."""
+    errors = 0
+    for prompt in prompts:
+        try:
+            model.generate([prompt])
+        except Exception as e:
+            if not is_rate_limit_error(e):
+                raise
+            errors += 1
+    return errors
+
+
+async def run_client(client, prompts):
+    results = await asyncio.gather(*(client.generate_text(prompt) for prompt in prompts), return_exceptions=True)
+    return sum(isinstance(result, Exception) for result in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=60)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--server-concurrency", type=int, default=6, help="Concurrent calls the stub accepts before 429.")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="Fraction of calls answered with a random 429.")
+    parser.add_argument("--rpm", type=int, default=None)
+    parser.add_argument("--tpm", type=int, default=None)
+    parser.add_argument("--max-concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    prompts = [f"Create chart notes for transcript {i}. " * 20 for i in range(args.calls)]
+
+    model = StubBackend(latency=args.latency, jitter=0.05, max_concurrent=args.server_concurrency,
+                        error_rate=args.error_rate)
+    start = time.perf_counter()
+    errors = run_serial(model, prompts)
+    serial_time = time.perf_counter() - start
+    print(f"serial: {serial_time:.2f}s, {args.calls / serial_time:.1f} calls/s, {errors} failed calls")
+
+    model = StubBackend(latency=args.latency, jitter=0.05, max_concurrent=args.server_concurrency,
+                        error_rate=args.error_rate)
+    client = AsyncLLMClient(model, requests_per_minute=args.rpm, tokens_per_minute=args.tpm,
+                            max_concurrency=args.max_concurrency, backoff=0.05)
+    start = time.perf_counter()
+    errors = asyncio.run(run_client(client, prompts))
+    client_time = time.perf_counter() - start
+    print(f"client: {client_time:.2f}s, {args.calls / client_time:.1f} calls/s, {errors} failed calls, "
+          f"{model.rejected} 429s absorbed, peak server concurrency {model.peak_in_flight}, "
+          f"final concurrency limit {client.concurrency_limit}")
+    print(f"client stats: {client.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Input tokens and latency of chart note calls with the template inline, as a system instruction, and cached.
+
+    python -m benchmarks.bench_prefix_cache --requests 20 --template-lines 200 --transcript-chars 8000
+"""
+
+import argparse
+import random
+import time
+
+from chart_notes.backends import StubBackend
+from chart_notes.llm import AsyncLLMClient
+from chart_notes.prefix_cache import TemplatePrefixCache
+from chart_notes.prompts import chart_notes_prompt, chart_notes_system_instruction, chart_notes_user_prompt
+
+from .bench_ingest import WORDS
+
+
+def make_template(lines, seed=0):
+    """A chart note template of ``lines`` section and instruction lines, like template_2."""
+    rng = random.Random(seed)
+    return "\n".join(
+        f"**Section {i}:** " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 12)))
+        for i in range(lines)
+    )
+
+
+def make_transcripts(count, chars, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(chars // 6))[:chars] for _ in range(count)]
+
+
+def run(client, calls):
+    """Mean latency per call and the client's token counts for ``calls`` (client, prompt) pairs."""
+    start = time.perf_counter()
+    for call_client, prompt in calls:
+        call_client.generate_text_sync(prompt)
+    elapsed = time.perf_counter() - start
+    return elapsed / len(calls), dict(client.stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--template-lines", type=int, default=200)
+    parser.add_argument("--transcript-chars", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--latency-per-token", type=float, default=0.00005,
+                        help="Seconds the stub backend spends per uncached prompt token.")
+    args = parser.parse_args()
+
+    template = make_template(args.template_lines)
+    transcripts = make_transcripts(args.requests, args.transcript_chars)
+    system_instruction = chart_notes_system_instruction(template)
+
+    def backend():
+        return StubBackend(latency=args.latency, latency_per_token=args.latency_per_token)
+
+    results = {}
+
+    client = AsyncLLMClient(backend())
+    results["inline template"] = run(client, [(client, chart_notes_prompt(t, template)) for t in transcripts])
+
+    for mode, cached in (("system instruction", False), ("cached content", True)):
+        base = backend()
+        client = AsyncLLMClient(base)
+        prefixes = TemplatePrefixCache(base, use_cached_content=cached)
+        calls = [(client.with_backend(prefixes.backend_for(system_instruction)), chart_notes_user_prompt(t))
+                 for t in transcripts]
+        results[mode] = run(client, calls)
+
+    print(f"{'mode':<20} {'prompt tok/req':>15} {'cached tok/req':>15} {'uncached tok/req':>17} {'latency ms':>11}")
+    for mode, (latency, stats) in results.items():
+        prompt_tokens = stats["prompt_tokens"] / args.requests
+        cached_tokens = stats["cached_tokens"] / args.requests
+        print(f"{mode:<20} {prompt_tokens:>15.0f} {cached_tokens:>15.0f} {prompt_tokens - cached_tokens:>17.0f} "
+              f"{latency * 1e3:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Time each local pipeline stage on synthetic transcripts from 1k to 1M characters.
+
+    python -m benchmarks.bench_stages --chars 1000 10000 100000 1000000 --json results.json
+    python -m benchmarks.bench_stages --json new.json --compare results.json
+
+Stages: transcript extraction from JSON, the lookup of an already prepared upload that
+replaces it on reruns, citation parsing (the app_1 regex parser, the local
+{References: ...} parser and the JSON response path), index construction, citation
+resolution, the scan for astral characters done once per upload and the viewer spans
+(merged, in UTF-16 offsets) sent for every note. Chart notes come from the offline stub
+backend, so no model is called. ``--json`` writes the results with the commit and
+interpreter they were measured on; ``--compare`` prints the change against an earlier
+results file.
+"""
+
+import argparse
+import io
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from chart_notes.align import CitationAligner
+from chart_notes.backends import StubBackend
+from chart_notes.citations import (
+    citations_from_note_citations,
+    extract_note_citations,
+    iter_note_citations,
+    json_generation_config,
+    parse_chart_notes_for_citations,
+)
+from chart_notes.highlight import astral_offsets, merge_spans, utf16_spans
+from chart_notes.index import TranscriptIndex, resolve_citations
+from chart_notes.prompts import chart_notes_system_instruction, chart_notes_user_prompt
+from chart_notes.transcript import Transcript
+from chart_notes.uploads import JSON_CONTENT_TYPE, UploadCache
+
+from .bench_prefix_cache import make_template
+from .synthetic import make_transcript_json_for_chars
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def timed(func, repeat):
+    """(min seconds, median seconds, last result) over ``repeat`` calls."""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), statistics.median(times), result
+
+
+def bench_size(chars, args):
+    """{stage: (min seconds, median seconds)} for one transcript size."""
+    payload = make_transcript_json_for_chars(chars, alternatives=args.alternatives, seed=args.seed)
+    results = {}
+
+    def stage(name, func):
+        best, median, result = timed(func, args.repeat)
+        results[name] = (best, median)
+        return result
+
+    transcript = stage("extract", lambda: Transcript.from_json(io.BytesIO(payload)))
+    text = transcript.text
+    uploads = UploadCache()
+    uploads.get_or_prepare(payload, JSON_CONTENT_TYPE)
+    stage("upload_rerun", lambda: uploads.get_or_prepare(payload, JSON_CONTENT_TYPE))
+
+    model = StubBackend(latency=0.0, jitter=0.0, notes_per_section=args.notes_per_section, seed=args.seed)
+    model = model.with_system_instruction(chart_notes_system_instruction(make_template(args.sections)))
+    chart_notes = model.reply(chart_notes_user_prompt(text))
+    json_response = model.reply(chart_notes, json_generation_config({}))
+
+    stage("parse_regex", lambda: parse_chart_notes_for_citations(chart_notes))
+    _, citations_dict = stage("parse_local", lambda: extract_note_citations(chart_notes))
+    stage("parse_json", lambda: citations_from_note_citations(iter_note_citations([json_response])))
+
+    def build_index():
+        index = TranscriptIndex(text)
+        return index, CitationAligner(index)
+
+    index, aligner = stage("index", build_index)
+    citation_spans = stage("resolve", lambda: resolve_citations(index, citations_dict, all_occurrences=True,
+                                                                aligner=aligner))
+    astral = stage("astral_scan", lambda: astral_offsets(text))
+    stage("viewer_spans", lambda: [utf16_spans(astral, merge_spans(span for span, _ in spans))
+                                          for spans in citation_spans.values()])
+
+    meta = {"chars": len(text), "turns": len(transcript), "json_bytes": len(payload), "notes": len(citations_dict),
+            "spans": sum(len(spans) for spans in citation_spans.values())}
+    return meta, results
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding="utf-8") as baseline_file:
+        baseline = json.load(baseline_file)
+    before = {(row["size"], row["stage"]): row["min_ms"] for row in baseline["results"]}
+    print(f"\ncompared with {baseline['meta'].get('commit')} ({baseline_path})")
+    print(f"{'size':>9} {'stage':<12} {'before ms':>10} {'after ms':>10} {'change':>8}")
+    for row in results:
+        old = before.get((row["size"], row["stage"]))
+        if old is None:
+            continue
+        change = f"{(row['min_ms'] - old) / old * 100:+.0f}%" if old else "n/a"
+        print(f"{row['size']:>9} {row['stage']:<12} {old:>10.2f} {row['min_ms']:>10.2f} {change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chars", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="Approximate transcript sizes in characters.")
+    parser.add_argument("--alternatives", type=int, default=1, help="Recognition alternatives per turn.")
+    parser.add_argument("--sections", type=int, default=12, help="Template sections in the chart notes.")
+    parser.add_argument("--notes-per-section", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", metavar="PATH", help="Write the results as JSON.")
+    parser.add_argument("--compare", metavar="PATH", help="Results JSON from an earlier run to compare against.")
+    args = parser.parse_args()
+
+    rows = []
+    print(f"{'size':>9} {'chars':>9} {'notes':>6} {'stage':<12} {'min ms':>10} {'median ms':>10}")
+    for size in args.chars:
+        meta, results = bench_size(size, args)
+        for stage, (best, median) in results.items():
+            rows.append({"size": size, **meta, "stage": stage, "min_ms": best * 1e3, "median_ms": median * 1e3})
+            print(f"{size:>9} {meta['chars']:>9} {meta['notes']:>6} {stage:<12} {best * 1e3:>10.2f} "
+                  f"{median * 1e3:>10.2f}")
+
+    if args.json:
+        report = {
+            "meta": {
+                "commit": git_commit(),
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "params": vars(args),
+            },
+            "results": rows,
+        }
+        with open(args.json, "w", encoding="utf-8") as json_file:
+            json.dump(report, json_file, indent=2)
+    if args.compare:
+        compare(rows, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Cold start and per-rerun overhead of the app setup, outside Streamlit.
+
+    python -m benchmarks.bench_startup --runs 5 --json startup.json
+
+Cold start is measured in fresh interpreters: importing the Streamlit-free chart_notes
+modules the apps import, then building the process-wide PipelineResources for the Gemini
+and stub backends. The google.generativeai import, which the Gemini backend defers to its
+first call, is timed separately when the library is installed. Per-rerun overhead is the
+work every script run repeats once the resources exist: looking up each resource.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+
+APP_IMPORTS = """
+import chart_notes.citations, chart_notes.metrics, chart_notes.pipeline, chart_notes.resources, chart_notes.templates
+"""
+BUILD_RESOURCES = """
+from chart_notes.resources import PipelineResources
+resources = PipelineResources({settings!r})
+for name in ("backend", "llm_client", "response_cache", "template_prefixes", "metrics"):
+    getattr(resources, name)
+"""
+GENAI_IMPORT = "import google.generativeai"
+
+
+def run_python(code, runs):
+    """Median and min wall seconds of ``python -c code`` over ``runs`` fresh interpreters, or None if it fails."""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True)
+        if result.returncode:
+            return None
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), min(times)
+
+
+def rerun_overhead(settings, number=10000):
+    """Seconds per script run spent looking up the already-created resources."""
+    from chart_notes.resources import PipelineResources
+
+    resources = PipelineResources(settings)
+    names = ("backend", "llm_client", "response_cache", "template_prefixes", "metrics")
+
+    def rerun():
+        for name in names:
+            getattr(resources, name)
+
+    rerun()
+    return timeit.timeit(rerun, number=number) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per measurement.")
+    parser.add_argument("--json", metavar="PATH", help="Write the results as JSON.")
+    args = parser.parse_args()
+
+    cases = {
+        "interpreter": "pass",
+        "app imports": APP_IMPORTS,
+        "imports + gemini resources": APP_IMPORTS + BUILD_RESOURCES.format(settings={"model_backend": "gemini"}),
+        "imports + stub resources": APP_IMPORTS + BUILD_RESOURCES.format(settings={"model_backend": "stub"}),
+        "google.generativeai import": GENAI_IMPORT,
+    }
+    results = {}
+    print(f"{'cold start':<30} {'median ms':>10} {'min ms':>10}")
+    for name, code in cases.items():
+        timing = run_python(code, args.runs)
+        results[name] = None if timing is None else {"median_ms": timing[0] * 1e3, "min_ms": timing[1] * 1e3}
+        if timing is None:
+            print(f"{name:<30} {'n/a':>10} {'n/a':>10}")
+        else:
+            print(f"{name:<30} {timing[0] * 1e3:>10.1f} {timing[1] * 1e3:>10.1f}")
+
+    rerun = rerun_overhead({"model_backend": "stub"})
+    results["rerun resource lookups"] = {"us": rerun * 1e6}
+    print(f"\nper-rerun resource lookups: {rerun * 1e6:.2f} us")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as json_file:
+            json.dump({"python": sys.version.split()[0], "runs": args.runs, "results": results}, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Synthetic transcripts in the transcripts/speakerTurns/alternatives/recognizedText schema."""
+
+import json
+import random
+
+CLINICAL_SENTENCES = (
+    "I have had chest pain on the left side for about three days",
+    "it gets worse when I walk up the stairs",
+    "the pain goes down my left arm sometimes",
+    "I take lisinopril every morning for my blood pressure",
+    "I have been getting headaches and some dizziness",
+    "I am not sleeping well at night",
+    "my father had a heart attack when he was sixty",
+    "I stopped smoking about five years ago",
+    "do you have any shortness of breath",
+    "any swelling in your ankles or legs",
+    "we will order some labs and an ECG today",
+    "I would like you to follow up with cardiology",
+    "let us check your blood pressure again",
+    "have you had any fever or cough",
+    "the nausea started after I changed my diet",
+)
+FILLERS = ("um", "uh", "yeah", "you know", "okay", "so", "like", "right")
+DEFAULT_SPEAKERS = ("doctor", "patient")
+
+
+def make_turn_text(rng, min_sentences=1, max_sentences=4, filler_rate=0.3):
+    """One turn of speech: a few clinical sentences with fillers, punctuated like ASR output."""
+    sentences = []
+    for _ in range(rng.randint(min_sentences, max_sentences)):
+        words = rng.choice(CLINICAL_SENTENCES).split()
+        if rng.random() < filler_rate:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(FILLERS))
+        sentence = " ".join(words)
+        sentences.append(sentence[0].upper() + sentence[1:] + rng.choice(".?." if "you" in words[:2] else ".."))
+    return " ".join(sentences)
+
+
+def make_transcript(turns=100, speakers=DEFAULT_SPEAKERS, alternatives=1, min_sentences=1, max_sentences=4,
+                    seed=0):
+    """A transcript document with ``turns`` speaker turns rotating through ``speakers``.
+
+    Each turn has ``alternatives`` recognition alternatives with decreasing confidence; all
+    of them are extracted, as with real exports. Turns carry start/end offsets.
+    """
+    if isinstance(speakers, int):
+        speakers = tuple(f"speaker{i + 1}" for i in range(speakers))
+    rng = random.Random(seed)
+    speaker_turns = []
+    clock = 0.0
+    for index in range(turns):
+        text = make_turn_text(rng, min_sentences, max_sentences)
+        duration = len(text.split()) * 0.4
+        speaker_turns.append({
+            "speakerId": speakers[index % len(speakers)],
+            "startTime": f"{clock:.1f}s",
+            "endTime": f"{clock + duration:.1f}s",
+            "alternatives": [
+                {"recognizedText": text if i == 0 else make_turn_text(rng, min_sentences, max_sentences),
+                 "confidence": round(0.95 - 0.1 * i, 2)}
+                for i in range(alternatives)
+            ],
+        })
+        clock += duration + 0.5
+    return {"transcripts": [{"speakerTurns": speaker_turns}]}
+
+
+def make_transcript_json(turns=100, speakers=DEFAULT_SPEAKERS, alternatives=1, min_sentences=1, max_sentences=4,
+                         seed=0):
+    """``make_transcript`` encoded as UTF-8 JSON bytes, as uploaded."""
+    return json.dumps(make_transcript(turns, speakers, alternatives, min_sentences, max_sentences, seed)).encode("utf-8")
+
+
+def make_transcript_json_for_chars(chars, speakers=DEFAULT_SPEAKERS, alternatives=1, seed=0):
+    """A transcript document whose extracted text is about ``chars`` characters long."""
+    # Turns average 2.5 sentences of about 45 characters per alternative.
+    turns = max(1, round(chars / (alternatives * 115)))
+    return make_transcript_json(turns, speakers, alternatives, seed=seed)
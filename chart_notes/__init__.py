@@ -0,0 +1 @@
+"""Chart note pipeline helpers shared by the Streamlit apps."""
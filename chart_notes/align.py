@@ -0,0 +1,168 @@
+"""Fuzzy alignment of citations to the transcript with a bounded token edit distance.
+
+The structuring prompt asks the model to drop stop words and fillers from references, so
+a reference is usually not a verbatim substring of the transcript. Both sides are reduced
+to content tokens and the reference is aligned to its best-matching transcript window
+(semi-global edit distance over tokens). A counting filter discards transcript regions
+that cannot hold a match within the bound, and each DP row over the remaining regions is
+computed with NumPy.
+"""
+
+import numpy as np
+
+from .index import tokenize
+
+DEFAULT_MAX_ERROR_RATE = 0.34
+# Lowest alignment score accepted as a highlight (see index.resolve_citations).
+DEFAULT_MIN_SCORE = 0.75
+
+STOP_WORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being
+below between both but by can could did do does doing down during each few for from further
+had has have having he her here hers herself him himself his how i if in into is it its
+itself just me more most my myself no nor not of off on once only or other our ours
+ourselves out over own same she should so some such than that thats the their theirs them
+themselves then there these they this those through to too under until up very was we were
+what when where which while who whom why will with would you your yours yourself
+yourselves im ive id ill youre youve weve theyre dont didnt doesnt isnt wasnt cant
+um uh uhm umm hmm mm mhm er ah oh yeah yep okay ok like well know mean kind sort really
+actually basically right alright
+""".split())
+
+
+class Alignment:
+    """Character span of the best transcript match for a citation, with its score.
+
+    ``score`` is 1 - distance / reference tokens, so 1.0 is an exact content-token match.
+    """
+
+    __slots__ = ('start', 'end', 'score', 'distance')
+
+    def __init__(self, start, end, score, distance):
+        self.start = start
+        self.end = end
+        self.score = score
+        self.distance = distance
+
+    def __repr__(self):
+        return f"Alignment(start={self.start}, end={self.end}, score={self.score:.2f}, distance={self.distance})"
+
+    @property
+    def span(self):
+        return self.start, self.end
+
+
+def _align_row(row_costs, previous, previous_starts, columns, row_number):
+    """One DP row: min of diagonal (match/substitute), up (skip reference token) and left (skip transcript token)."""
+    up = previous + 1
+    diagonal = previous[:-1] + row_costs
+    best = np.empty_like(previous)
+    best[0] = row_number
+    best[1:] = np.minimum(diagonal, up[1:])
+    starts = np.empty_like(previous_starts)
+    starts[0] = previous_starts[0]
+    starts[1:] = np.where(diagonal <= up[1:], previous_starts[:-1], previous_starts[1:])
+
+    # Left moves cost one per skipped transcript token: D[j] = min over k <= j of best[k] + (j - k).
+    shifted = best - columns
+    running = np.minimum.accumulate(shifted)
+    origin = np.maximum.accumulate(np.where(shifted == running, columns, 0))
+    return running + columns, starts[origin]
+
+
+def align_tokens(text_ids, reference_ids, max_distance):
+    """Best (distance, start, end) alignment of ``reference_ids`` to a window of ``text_ids``.
+
+    Returns None when every window is more than ``max_distance`` edits away.
+    """
+    length = len(text_ids)
+    columns = np.arange(length + 1, dtype=np.int32)
+    row = np.zeros(length + 1, dtype=np.int32)
+    starts = columns.copy()
+    for row_number, token_id in enumerate(reference_ids, 1):
+        row, starts = _align_row((text_ids != token_id).astype(np.int32), row, starts, columns, row_number)
+        if row.min() > max_distance:
+            return None
+    # The last of equally good ends prefers a substituted final token over dropping it.
+    end = length - int(row[::-1].argmin())
+    distance = int(row[end])
+    if distance > max_distance:
+        return None
+    return distance, int(starts[end]), end
+
+
+class CitationAligner:
+    """Aligns citations to the content tokens of a TranscriptIndex.
+
+    ``max_error_rate`` bounds the edit distance to that fraction of the reference's
+    content tokens.
+    """
+
+    def __init__(self, index, max_error_rate=DEFAULT_MAX_ERROR_RATE, stop_words=STOP_WORDS):
+        self.index = index
+        self.max_error_rate = max_error_rate
+        self.stop_words = stop_words
+        self.vocabulary = {}
+        positions = []
+        ids = []
+        for position, token in enumerate(index.tokens):
+            if token not in stop_words:
+                positions.append(position)
+                ids.append(self.vocabulary.setdefault(token, len(self.vocabulary)))
+        self.positions = np.array(positions, dtype=np.int64)
+        self.ids = np.array(ids, dtype=np.int32)
+
+    def content_ids(self, text):
+        """Vocabulary ids of the content tokens of ``text``; unknown tokens get -1."""
+        return [self.vocabulary.get(token, -1) for token in tokenize(text) if token not in self.stop_words]
+
+    def _regions(self, reference_ids, max_distance):
+        """Transcript regions that can contain an alignment within ``max_distance``.
+
+        A match with at most k edits covers at most m + k transcript tokens, of which at
+        least m - k are reference tokens, so windows with fewer hits are skipped.
+        """
+        count = len(self.ids)
+        width = len(reference_ids) + max_distance
+        hits = np.isin(self.ids, [token_id for token_id in reference_ids if token_id >= 0])
+        cumulative = np.concatenate(([0], np.cumsum(hits)))
+        window_starts = np.arange(count)
+        window_hits = cumulative[np.minimum(window_starts + width, count)] - cumulative[:count]
+        candidates = np.flatnonzero(window_hits >= len(reference_ids) - max_distance)
+
+        regions = []
+        for start in candidates.tolist():
+            end = min(start + width, count)
+            if regions and start <= regions[-1][1]:
+                regions[-1][1] = end
+            else:
+                regions.append([start, end])
+        return regions
+
+    def align(self, citation):
+        """Best Alignment of ``citation`` in the transcript, or None if nothing is close enough."""
+        span = self.index.find(citation)
+        if span is not None:
+            return Alignment(span[0], span[1], 1.0, 0)
+
+        reference_ids = self.content_ids(citation)
+        if not reference_ids or not len(self.ids):
+            return None
+        max_distance = int(len(reference_ids) * self.max_error_rate)
+
+        best = None
+        for region_start, region_end in self._regions(reference_ids, max_distance):
+            found = align_tokens(self.ids[region_start:region_end], reference_ids, max_distance)
+            if found is not None and (best is None or found[0] < best[0]):
+                best = (found[0], region_start + found[1], region_start + found[2])
+                max_distance = found[0]
+        if best is None:
+            return None
+
+        distance, first, end = best
+        if first >= end:
+            return None
+        start_char = self.index.starts[int(self.positions[first])]
+        end_char = self.index.ends[int(self.positions[end - 1])]
+        return Alignment(start_char, end_char, 1.0 - distance / len(reference_ids), distance)
+
@@ -0,0 +1,384 @@
+"""Model backends: the operations the pipeline needs from a generative model.
+
+A backend has ``generate(contents)`` returning a response with ``candidates`` and
+``usage_metadata`` (the shape of a Gemini response), ``stream(contents)`` yielding chunks
+with ``.text`` (the last one may carry ``usage_metadata``), and ``count_tokens(contents)``.
+``generate_async`` and ``stream_async`` default to running the blocking calls in a thread.
+``with_system_instruction`` and ``with_cached_content`` return a backend that carries a
+prompt prefix (see prefix_cache.TemplatePrefixCache).
+
+GeminiBackend talks to the Gemini API. StubBackend answers offline and deterministically
+with template-shaped notes that cite the transcript, so the apps, CLI and benchmarks can
+run without an API key or network.
+"""
+
+import asyncio
+import collections
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from types import SimpleNamespace
+
+from .transcript import Transcript
+
+DEFAULT_MODEL_NAME = "gemini-1.5-flash"
+
+
+def text_response(text, usage=None):
+    """A response object shaped like Gemini's, for backends that do not call the API."""
+    candidate = SimpleNamespace(content=SimpleNamespace(parts=[SimpleNamespace(text=text)]))
+    return SimpleNamespace(candidates=[candidate], usage_metadata=usage, text=text)
+
+
+class ModelBackend:
+    """Interface of a generative model backend."""
+
+    model_name = None
+
+    def generate(self, contents, **kwargs):
+        raise NotImplementedError
+
+    def stream(self, contents, **kwargs):
+        raise NotImplementedError
+
+    def count_tokens(self, contents):
+        raise NotImplementedError
+
+    async def generate_async(self, contents, **kwargs):
+        return await asyncio.to_thread(self.generate, contents, **kwargs)
+
+    async def stream_async(self, contents, **kwargs):
+        """Async iterator over the chunks of ``stream``, each fetched in a worker thread."""
+        chunks = await asyncio.to_thread(lambda: iter(self.stream(contents, **kwargs)))
+        end = object()
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, end)
+            if chunk is end:
+                return
+            yield chunk
+
+    def with_system_instruction(self, system_instruction):
+        raise NotImplementedError
+
+    def with_cached_content(self, system_instruction, ttl):
+        raise NotImplementedError
+
+
+class GeminiBackend(ModelBackend):
+    """A ``genai.GenerativeModel``, created (and google.generativeai imported) on the first call.
+
+    Constructing the backend is cheap, so apps can build it at startup without paying for
+    the client library import until a model call is made.
+    """
+
+    def __init__(self, model_name=DEFAULT_MODEL_NAME, generation_config=None, api_key=None,
+                 system_instruction=None, model=None):
+        self.generation_config = generation_config or {}
+        self.api_key = api_key
+        self.system_instruction = system_instruction
+        # genai reports model names with the "models/" prefix; keep that form for cache keys.
+        self.model_name = model_name if model_name.startswith("models/") else f"models/{model_name}"
+        self._model = model
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    import google.generativeai as genai
+
+                    if self.api_key is not None:
+                        genai.configure(api_key=self.api_key)
+                    self._model = genai.GenerativeModel(
+                        model_name=self.model_name,
+                        generation_config=self.generation_config,
+                        system_instruction=self.system_instruction,
+                    )
+        return self._model
+
+    def generate(self, contents, **kwargs):
+        return self.model.generate_content(contents, **kwargs)
+
+    async def generate_async(self, contents, **kwargs):
+        return await self.model.generate_content_async(contents, **kwargs)
+
+    def stream(self, contents, **kwargs):
+        return iter(self.model.generate_content(contents, stream=True, **kwargs))
+
+    async def stream_async(self, contents, **kwargs):
+        response = await self.model.generate_content_async(contents, stream=True, **kwargs)
+        async for chunk in response:
+            yield chunk
+
+    def count_tokens(self, contents):
+        return self.model.count_tokens(contents).total_tokens
+
+    def with_system_instruction(self, system_instruction):
+        return GeminiBackend(self.model_name, self.generation_config, self.api_key, system_instruction)
+
+    def with_cached_content(self, system_instruction, ttl):
+        """The prefix stored with the Gemini context caching API; fails below the minimum cacheable size."""
+        import datetime
+
+        import google.generativeai as genai
+        from google.generativeai import caching
+
+        from .prefix_cache import template_version
+
+        if self.api_key is not None:
+            genai.configure(api_key=self.api_key)
+        cached_content = caching.CachedContent.create(
+            model=self.model_name,
+            display_name=f"chart-notes-{template_version(system_instruction)}",
+            system_instruction=system_instruction,
+            ttl=datetime.timedelta(seconds=ttl),
+        )
+        model = genai.GenerativeModel.from_cached_content(cached_content, generation_config=self.generation_config)
+        return GeminiBackend(self.model_name, self.generation_config, self.api_key, model=model)
+
+
+def make_backend(name="gemini", model_name=DEFAULT_MODEL_NAME, generation_config=None, api_key=None,
+                 record=None, replay=None, replay_latency="original", **stub_options):
+    """The "gemini" or "stub" backend, optionally recording calls to the cassette file ``record``.
+
+    With ``replay`` set to a cassette file, calls are answered from it instead and ``name``
+    is ignored.
+    """
+    from .cassette import Cassette, RecordingBackend, ReplayBackend
+
+    if replay:
+        return ReplayBackend(Cassette(replay), latency=replay_latency)
+    if name == "stub":
+        backend = StubBackend(**stub_options)
+    else:
+        backend = GeminiBackend(model_name, generation_config, api_key=api_key)
+    if record:
+        return RecordingBackend(backend, Cassette(record))
+    return backend
+
+
+class StubRateLimitError(Exception):
+    """Injected by StubBackend; looks like a 429 to llm.is_rate_limit_error."""
+
+    code = 429
+
+
+# Where the transcript sits in each prompt the pipeline sends, tried in order.
+TRANSCRIPT_MARKERS = (
+    re.compile(r'(?:\A|\n)Transcript: (.*)\Z', re.S),
+    re.compile(r'information in this part: (.*?)\n\s*Leave out sections', re.S),
+)
+TEMPLATE_SECTION_PATTERN = re.compile(
+    r'\*\*([A-Z][^*:\n]{2,60}?):?\*\*|^[ \t]*(?:[-*•][ \t]+)?([A-Z][A-Za-z/&(),\' -]{2,60}?):', re.M
+)
+PROMPT_LABELS = ("Template", "Transcript")
+SENTENCE_BREAK_PATTERN = re.compile(r'(?<=[.?!])\s+')
+MIN_SENTENCE_CHARS = 20
+INLINE_LABEL_PATTERN = re.compile(r'^(?:[A-Z][A-Za-z]*(?: [A-Z0-9][A-Za-z0-9]*){0,2}:\s*)+')
+PARTIAL_NOTES_PATTERN = re.compile(r'Partial chart notes \d+:\n(.*?)(?=\n\nPartial chart notes \d+:|\Z)', re.S)
+DEFAULT_SECTIONS = ("Chief Complaint", "History of Present Illness", "Assessment", "Plan")
+
+
+class StubBackend(ModelBackend):
+    """Offline backend answering with chart notes shaped like the template, citing the transcript.
+
+    Notes reuse transcript sentences and cite them verbatim in ``{References: ...}`` blocks,
+    so citation parsing and highlighting behave as with real output. Requests for JSON
+    (``response_mime_type`` application/json) get the notes and references of the chart
+    notes in the prompt. Output depends only on the prompt and ``seed``.
+
+    Each call waits ``latency`` seconds plus up to ``jitter`` and ``latency_per_token`` per
+    uncached prompt token; streams then emit ``chunk_chars`` characters every
+    ``chunk_interval`` seconds. Like a rate-limited service, calls beyond
+    ``max_concurrent`` in flight or ``requests_per_minute`` raise ``error`` (by default a
+    429), as does a random fraction ``error_rate`` of calls. ``calls``, ``rejected``,
+    ``in_flight`` and ``peak_in_flight`` count what the backend has seen.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, latency_per_token=0.0, chunk_chars=40, chunk_interval=0.0,
+                 error_rate=0.0, error=StubRateLimitError, seed=0, notes_per_section=2,
+                 system_instruction=None, cached_content=False, model_name="stub", max_concurrent=None,
+                 requests_per_minute=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.latency_per_token = latency_per_token
+        self.chunk_chars = chunk_chars
+        self.chunk_interval = chunk_interval
+        self.error_rate = error_rate
+        self.error = error
+        self.seed = seed
+        self.notes_per_section = notes_per_section
+        self.system_instruction = system_instruction
+        self.cached_content = cached_content
+        self.model_name = model_name
+        self.max_concurrent = max_concurrent
+        self.requests_per_minute = requests_per_minute
+        self.calls = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._random = random.Random(seed)
+        self._recent = collections.deque()
+        self._lock = threading.Lock()
+
+    def with_system_instruction(self, system_instruction):
+        return self._with_prefix(system_instruction, cached_content=False)
+
+    def with_cached_content(self, system_instruction, ttl):
+        return self._with_prefix(system_instruction, cached_content=True)
+
+    def _with_prefix(self, system_instruction, cached_content):
+        backend = StubBackend(self.latency, self.jitter, self.latency_per_token, self.chunk_chars, self.chunk_interval,
+                              self.error_rate, self.error, self.seed, self.notes_per_section,
+                              system_instruction, cached_content, self.model_name, self.max_concurrent,
+                              self.requests_per_minute)
+        backend._random = self._random
+        backend._lock = self._lock
+        return backend
+
+    def count_tokens(self, contents):
+        text = " ".join(part for part in contents if isinstance(part, str))
+        return (len(text) + len(self.system_instruction or "")) // 4
+
+    def _prompt(self, contents):
+        return " ".join(part for part in contents if isinstance(part, str))
+
+    def _admit(self, prompt):
+        """Start a call and return how long it takes, or raise ``error`` as a service over its limits would."""
+        with self._lock:
+            self.calls += 1
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] >= 60:
+                self._recent.popleft()
+            over_limit = ((self.max_concurrent is not None and self.in_flight >= self.max_concurrent)
+                          or (self.requests_per_minute is not None and len(self._recent) >= self.requests_per_minute))
+            if over_limit or (self.error_rate and self._random.random() < self.error_rate):
+                self.rejected += 1
+                raise self.error("429 Resource has been exhausted (stub backend).")
+            self._recent.append(now)
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            jitter = self._random.uniform(0, self.jitter)
+        uncached_tokens = len(prompt) // 4 + (0 if self.cached_content else len(self.system_instruction or "") // 4)
+        return self.latency + jitter + self.latency_per_token * uncached_tokens
+
+    def _finish(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _usage(self, prompt, reply):
+        prefix_tokens = len(self.system_instruction or "") // 4
+        prompt_tokens = len(prompt) // 4 + prefix_tokens
+        return SimpleNamespace(prompt_token_count=prompt_tokens,
+                               cached_content_token_count=prefix_tokens if self.cached_content else 0,
+                               candidates_token_count=len(reply) // 4,
+                               total_token_count=prompt_tokens + len(reply) // 4)
+
+    def _response(self, prompt, reply):
+        return text_response(reply, self._usage(prompt, reply))
+
+    def _chunks(self, prompt, reply):
+        chunks = [SimpleNamespace(text=reply[i:i + self.chunk_chars]) for i in range(0, len(reply), self.chunk_chars)]
+        if chunks:
+            chunks[-1].usage_metadata = self._usage(prompt, reply)
+        return chunks
+
+    def generate(self, contents, generation_config=None, **kwargs):
+        prompt = self._prompt(contents)
+        delay = self._admit(prompt)
+        try:
+            time.sleep(delay)
+            return self._response(prompt, self.reply(prompt, generation_config))
+        finally:
+            self._finish()
+
+    async def generate_async(self, contents, generation_config=None, **kwargs):
+        prompt = self._prompt(contents)
+        delay = self._admit(prompt)
+        try:
+            await asyncio.sleep(delay)
+            return self._response(prompt, self.reply(prompt, generation_config))
+        finally:
+            self._finish()
+
+    def stream(self, contents, generation_config=None, **kwargs):
+        prompt = self._prompt(contents)
+        delay = self._admit(prompt)
+        try:
+            time.sleep(delay)
+            for chunk in self._chunks(prompt, self.reply(prompt, generation_config)):
+                yield chunk
+                if self.chunk_interval:
+                    time.sleep(self.chunk_interval)
+        finally:
+            self._finish()
+
+    async def stream_async(self, contents, generation_config=None, **kwargs):
+        prompt = self._prompt(contents)
+        delay = self._admit(prompt)
+        try:
+            await asyncio.sleep(delay)
+            for chunk in self._chunks(prompt, self.reply(prompt, generation_config)):
+                yield chunk
+                await asyncio.sleep(self.chunk_interval)
+        finally:
+            self._finish()
+
+    def reply(self, prompt, generation_config=None):
+        """The deterministic answer to ``prompt``."""
+        if (generation_config or {}).get("response_mime_type") == "application/json":
+            return self._json_reply(prompt)
+        partial_notes = PARTIAL_NOTES_PATTERN.findall(prompt)
+        if partial_notes:
+            return "\n\n".join(notes.strip() for notes in partial_notes)
+        return self._notes_reply(prompt)
+
+    def _notes_reply(self, prompt):
+        full_prompt = f"{self.system_instruction}\n{prompt}" if self.system_instruction else prompt
+        transcript = prompt
+        for marker in TRANSCRIPT_MARKERS:
+            match = marker.search(prompt)
+            if match:
+                transcript = match.group(1)
+                break
+        template = full_prompt.replace(transcript, "")
+        sections = [bold or plain for bold, plain in TEMPLATE_SECTION_PATTERN.findall(template)]
+        sections = [section.strip() for section in dict.fromkeys(sections) if section not in PROMPT_LABELS]
+        sentences = []
+        for turn in Transcript.from_text(transcript):
+            for sentence in SENTENCE_BREAK_PATTERN.split(turn.text):
+                sentence = INLINE_LABEL_PATTERN.sub('', sentence.strip())
+                if len(sentence) >= MIN_SENTENCE_CHARS and sentence[-1] in '.?!':
+                    sentences.append(sentence)
+        if not sentences and transcript.strip():
+            words = transcript.split()
+            sentences = [" ".join(words[i:i + 12]) for i in range(0, len(words), 12)]
+
+        rng = random.Random(self.seed ^ zlib.crc32(full_prompt.encode("utf-8")))
+        rng.shuffle(sentences)
+        lines = []
+        numbers = {}
+        next_sentence = 0
+        for section in sections or DEFAULT_SECTIONS:
+            lines.append(f"**{section}:**")
+            if not sentences:
+                lines.append("- Not discussed.")
+                continue
+            for _ in range(min(self.notes_per_section, len(sentences))):
+                sentence = sentences[next_sentence % len(sentences)]
+                next_sentence += 1
+                number = numbers.setdefault(sentence, len(numbers) + 1)
+                note = sentence.rstrip(".?!")
+                lines.append(f'- {note[:1].upper()}{note[1:]}. {{References: [{number}]: "{sentence}"}}')
+            lines.append("")
+        return "\n".join(lines).strip()
+
+    def _json_reply(self, prompt):
+        from .citations import extract_note_citations
+
+        notes, citations_dict = extract_note_citations(prompt)
+        return json.dumps([{"note": note, "Reference": citations_dict[note]} for note in notes])
@@ -0,0 +1,182 @@
+"""Content-addressed cache for model responses, with an in-process LRU tier and an on-disk tier."""
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+def is_cacheable(generation_config):
+    """Only deterministic generation configs (temperature 0) may be served from the cache."""
+    return generation_config is not None and generation_config.get("temperature") == 0
+
+
+def content_hash(*parts):
+    """SHA-256 of a JSON-serialisable tuple, used as a cache key."""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """Thread-safe mapping that keeps at most ``max_entries`` recently used items."""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class DiskCache:
+    """Gzipped files under ``directory``, evicting the least recently used beyond ``max_bytes``."""
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._sizes = {}
+        for name in os.listdir(directory):
+            if name.endswith(".json.gz"):
+                self._sizes[name] = os.path.getsize(os.path.join(directory, name))
+        self.total_bytes = sum(self._sizes.values())
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json.gz")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as cache_file:
+                value = json.load(cache_file)["value"]
+        except (OSError, ValueError, KeyError):
+            return None
+        os.utime(path)  # mtime doubles as the last-used time for eviction
+        return value
+
+    def put(self, key, value):
+        data = gzip.compress(json.dumps({"value": value}, ensure_ascii=False).encode("utf-8"))
+        name = os.path.basename(self._path(key))
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_path, self._path(key))
+        with self._lock:
+            self.total_bytes += len(data) - self._sizes.get(name, 0)
+            self._sizes[name] = len(data)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        def last_used(name):
+            try:
+                return os.path.getmtime(os.path.join(self.directory, name))
+            except OSError:
+                return 0
+
+        for name in sorted(self._sizes, key=last_used):
+            if self.total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            self.total_bytes -= self._sizes.pop(name)
+
+
+class ResponseCache:
+    """Model response cache keyed by (kind, prompt inputs, model name, generation_config).
+
+    ``key`` returns None for non-deterministic configs; ``get`` and ``put`` treat a None key
+    as uncacheable, so callers can use the same code path either way.
+    """
+
+    def __init__(self, memory_entries=256, directory=None, max_disk_bytes=256 * 1024 * 1024):
+        self.memory = LRUCache(memory_entries)
+        self.disk = DiskCache(directory, max_disk_bytes) if directory else None
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "uncacheable": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def key(self, kind, inputs, model_name, generation_config):
+        if not is_cacheable(generation_config):
+            return None
+        return content_hash(kind, inputs, model_name, generation_config)
+
+    def get(self, key):
+        if key is None:
+            self._count("uncacheable")
+            return None
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("memory_hits")
+            return value
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.put(key, value)
+                self._count("disk_hits")
+                return value
+        self._count("misses")
+        return None
+
+    def put(self, key, value):
+        if key is None or value is None:
+            return
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+        self._count("stores")
+
+    def get_or_generate(self, kind, inputs, model_name, generation_config, generate):
+        """Return the cached value for these inputs, calling ``generate()`` on a miss."""
+        key = self.key(kind, inputs, model_name, generation_config)
+        value = self.get(key)
+        if value is None:
+            value = generate()
+            self.put(key, value)
+        return value
+
+    def iter_cached(self, key, stream):
+        """Yield the cached value as one chunk, or the chunks of ``stream()`` while caching their concatenation.
+
+        The streamed text is stored only once the stream has been consumed to the end.
+        """
+        value = self.get(key)
+        if value is not None:
+            yield value
+            return
+        received = []
+        for chunk in stream():
+            received.append(chunk)
+            yield chunk
+        self.put(key, "".join(received))
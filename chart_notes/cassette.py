@@ -0,0 +1,255 @@
+"""Record model calls to gzipped cassettes and replay them, for reproducible runs without the API.
+
+RecordingBackend wraps a backend and appends every completed call to a Cassette.
+ReplayBackend serves the recorded responses back, either with the recorded timings (time
+to first chunk, chunk spacing, total latency) or with zero latency, so the local stages
+can be benchmarked and load tested against fixed model output.
+"""
+
+import asyncio
+import gzip
+import json
+import os
+import threading
+import time
+import zlib
+from types import SimpleNamespace
+
+from .backends import ModelBackend, text_response
+from .cache import content_hash
+
+USAGE_FIELDS = ('prompt_token_count', 'cached_content_token_count', 'candidates_token_count', 'total_token_count')
+REPLAY_LATENCIES = ('original', 'zero')
+READ_CHUNK_BYTES = 1 << 16
+
+
+def call_key(system_instruction, contents, kwargs):
+    """Identity of a model call: its prefix, prompt parts and generation config."""
+    prompt = [part for part in contents if isinstance(part, str)]
+    return content_hash("call", system_instruction, prompt, kwargs.get("generation_config"))
+
+
+def _usage_dict(usage):
+    if usage is None:
+        return None
+    return {field: getattr(usage, field, None) for field in USAGE_FIELDS}
+
+
+def _usage_namespace(usage):
+    return SimpleNamespace(**usage) if usage else None
+
+
+def _response_text(response):
+    return response.candidates[0].content.parts[0].text
+
+
+class CassetteMiss(KeyError):
+    """No recorded call matches the request being replayed."""
+
+
+class Cassette:
+    """Recorded model calls in a gzipped JSON-lines file.
+
+    Each line holds one call: its key, prompt, system instruction and generation config,
+    the response text and usage metadata, ``latency`` (seconds until the response was
+    complete) and, for streamed calls, ``chunks`` as [seconds since the call started, text]
+    pairs. Every recorded call is appended as its own gzip member, so a recording that is
+    interrupted keeps the calls completed before it. Calls with the same key replay in
+    recorded order, repeating the last one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._replayed = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        # Each read1 returns data from one gzip member, so a truncated last member ends the
+        # read without losing the calls completed before it; a partial last line is dropped.
+        pending = b""
+        with gzip.open(self.path, 'rb') as cassette_file:
+            while True:
+                try:
+                    data = cassette_file.read1(READ_CHUNK_BYTES)
+                except (EOFError, gzip.BadGzipFile, zlib.error):
+                    break
+                if not data:
+                    break
+                *lines, pending = (pending + data).split(b"\n")
+                for line in lines:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries.setdefault(entry["key"], []).append(entry)
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.entries.values())
+
+    @property
+    def model_name(self):
+        for entries in self.entries.values():
+            return entries[0].get("model_name")
+        return None
+
+    def append(self, entry):
+        with self._lock:
+            self.entries.setdefault(entry["key"], []).append(entry)
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with gzip.open(self.path, 'at', encoding='utf-8') as cassette_file:
+                cassette_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def peek(self, key):
+        entries = self.entries.get(key)
+        return entries[0] if entries else None
+
+    def next_entry(self, key):
+        """The next recorded call for ``key``; raises CassetteMiss if it was never recorded."""
+        with self._lock:
+            entries = self.entries.get(key)
+            if not entries:
+                raise CassetteMiss(key)
+            index = self._replayed.get(key, 0)
+            self._replayed[key] = index + 1
+            return entries[min(index, len(entries) - 1)]
+
+
+class RecordingBackend(ModelBackend):
+    """Passes calls through to ``backend`` and records each completed call in ``cassette``."""
+
+    def __init__(self, backend, cassette, system_instruction=None):
+        self.backend = backend
+        self.cassette = cassette
+        self.system_instruction = system_instruction
+        self.model_name = backend.model_name
+
+    def with_system_instruction(self, system_instruction):
+        return RecordingBackend(self.backend.with_system_instruction(system_instruction), self.cassette,
+                                system_instruction)
+
+    def with_cached_content(self, system_instruction, ttl):
+        return RecordingBackend(self.backend.with_cached_content(system_instruction, ttl), self.cassette,
+                                system_instruction)
+
+    def count_tokens(self, contents):
+        return self.backend.count_tokens(contents)
+
+    def _record(self, contents, kwargs, text, usage, latency, chunks=None):
+        self.cassette.append({
+            "key": call_key(self.system_instruction, contents, kwargs),
+            "model_name": self.model_name,
+            "system_instruction": self.system_instruction,
+            "contents": [part for part in contents if isinstance(part, str)],
+            "generation_config": kwargs.get("generation_config"),
+            "recorded_at": time.time(),
+            "text": text,
+            "usage": _usage_dict(usage),
+            "latency": latency,
+            "chunks": chunks,
+        })
+
+    def generate(self, contents, **kwargs):
+        start = time.perf_counter()
+        response = self.backend.generate(contents, **kwargs)
+        self._record(contents, kwargs, _response_text(response), getattr(response, 'usage_metadata', None),
+                     time.perf_counter() - start)
+        return response
+
+    async def generate_async(self, contents, **kwargs):
+        start = time.perf_counter()
+        response = await self.backend.generate_async(contents, **kwargs)
+        self._record(contents, kwargs, _response_text(response), getattr(response, 'usage_metadata', None),
+                     time.perf_counter() - start)
+        return response
+
+    def stream(self, contents, **kwargs):
+        start = time.perf_counter()
+        chunks = []
+        usage = None
+        for chunk in self.backend.stream(contents, **kwargs):
+            chunks.append([time.perf_counter() - start, chunk.text])
+            usage = getattr(chunk, 'usage_metadata', None) or usage
+            yield chunk
+        self._record(contents, kwargs, "".join(text for _, text in chunks), usage, time.perf_counter() - start, chunks)
+
+    async def stream_async(self, contents, **kwargs):
+        start = time.perf_counter()
+        chunks = []
+        usage = None
+        async for chunk in self.backend.stream_async(contents, **kwargs):
+            chunks.append([time.perf_counter() - start, chunk.text])
+            usage = getattr(chunk, 'usage_metadata', None) or usage
+            yield chunk
+        self._record(contents, kwargs, "".join(text for _, text in chunks), usage, time.perf_counter() - start, chunks)
+
+
+class ReplayBackend(ModelBackend):
+    """Answers from ``cassette`` with the recorded timings (``latency="original"``) or none (``"zero"``).
+
+    Calls that were not recorded raise CassetteMiss. A call recorded as a stream can be
+    replayed as a single response and vice versa.
+    """
+
+    def __init__(self, cassette, latency="original", system_instruction=None):
+        if latency not in REPLAY_LATENCIES:
+            raise ValueError(f"latency must be one of {REPLAY_LATENCIES}, not {latency!r}")
+        self.cassette = cassette
+        self.latency = latency
+        self.system_instruction = system_instruction
+        self.model_name = cassette.model_name or "replay"
+
+    def with_system_instruction(self, system_instruction):
+        return ReplayBackend(self.cassette, self.latency, system_instruction)
+
+    def with_cached_content(self, system_instruction, ttl):
+        return ReplayBackend(self.cassette, self.latency, system_instruction)
+
+    def count_tokens(self, contents):
+        entry = self.cassette.peek(call_key(self.system_instruction, contents, {}))
+        if entry and entry["usage"] and entry["usage"].get("prompt_token_count") is not None:
+            return entry["usage"]["prompt_token_count"]
+        return sum(len(part) for part in contents if isinstance(part, str)) // 4
+
+    def _entry(self, contents, kwargs):
+        return self.cassette.next_entry(call_key(self.system_instruction, contents, kwargs))
+
+    def _delay(self, seconds):
+        return seconds if self.latency == "original" else 0.0
+
+    def _chunks(self, entry):
+        """[(seconds since the call started, chunk)] with the usage on the last chunk."""
+        recorded = entry["chunks"] or [[entry["latency"], entry["text"]]]
+        chunks = [(offset, SimpleNamespace(text=text)) for offset, text in recorded]
+        chunks[-1][1].usage_metadata = _usage_namespace(entry["usage"])
+        return chunks
+
+    def generate(self, contents, **kwargs):
+        entry = self._entry(contents, kwargs)
+        time.sleep(self._delay(entry["latency"]))
+        return text_response(entry["text"], _usage_namespace(entry["usage"]))
+
+    async def generate_async(self, contents, **kwargs):
+        entry = self._entry(contents, kwargs)
+        await asyncio.sleep(self._delay(entry["latency"]))
+        return text_response(entry["text"], _usage_namespace(entry["usage"]))
+
+    def stream(self, contents, **kwargs):
+        entry = self._entry(contents, kwargs)
+        start = time.perf_counter()
+        for offset, chunk in self._chunks(entry):
+            wait = self._delay(offset) - (time.perf_counter() - start)
+            if wait > 0:
+                time.sleep(wait)
+            yield chunk
+
+    async def stream_async(self, contents, **kwargs):
+        entry = self._entry(contents, kwargs)
+        start = time.perf_counter()
+        for offset, chunk in self._chunks(entry):
+            wait = self._delay(offset) - (time.perf_counter() - start)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            yield chunk
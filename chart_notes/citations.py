@@ -0,0 +1,285 @@
+"""Citation blocks in generated chart notes."""
+
+import re
+import threading
+
+from .jsonstream import ItemParser
+
+CITATION_BLOCK_PATTERN = re.compile(r'\{References:\s*([^}]*)\}')
+CITATION_PATTERN = re.compile(r'\[(\d+)\]:\s*"(.*?)"')
+LINE_CITATIONS_PATTERN = re.compile(r'\{References: ([^}]+)\}')
+REFERENCES_BLOCK_PATTERN = re.compile(r'[ \t]*\{References:[^}]*\}')
+# Leading bullets and the "**Subheading:**" labels the templates emit, which the notes are
+# stripped of. Plain "Label: value" text such as "Blood pressure: 120/80" is note content.
+NOTE_PREFIX_PATTERN = re.compile(r'^(?:[-*\u2022]\s+|\d+[.)]\s+)?(?:\*\*[^*\n]+:\*\*|\*\*[^*\n]+\*\*:)?\s*')
+
+MAX_REFERENCES_PER_NOTE = 5
+
+# Response schema for the citation-structuring call (generation_config["response_schema"]).
+NOTE_CITATIONS_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "note": {"type": "STRING"},
+            "Reference": {"type": "ARRAY", "items": {"type": "STRING"}},
+        },
+        "required": ["note", "Reference"],
+    },
+}
+
+
+class CitationRegistry:
+    """Assigns one global number per unique citation text, in order of first appearance."""
+
+    def __init__(self):
+        self.numbers = {}
+
+    def number(self, citation_text):
+        if citation_text not in self.numbers:
+            self.numbers[citation_text] = len(self.numbers) + 1
+        return self.numbers[citation_text]
+
+
+def renumber_citations(chart_notes, registry=None):
+    """Rewrite every {References: ...} block with numbers from ``registry``.
+
+    The same citation text always gets the same number, so notes generated separately
+    (for example per transcript window) can share one sequential numbering.
+    """
+    if registry is None:
+        registry = CitationRegistry()
+
+    def rewrite(block):
+        citations = []
+        for _, citation_text in CITATION_PATTERN.findall(block.group(1)):
+            citation = f'[{registry.number(citation_text)}]: "{citation_text}"'
+            if citation not in citations:
+                citations.append(citation)
+        if not citations:
+            return block.group(0)
+        return "{References: " + ", ".join(citations) + "}"
+
+    return CITATION_BLOCK_PATTERN.sub(rewrite, chart_notes)
+
+
+def parse_chart_notes_for_citations(chart_notes):
+    """Parse the chart notes to extract sentences and associated citations, ensuring correct sequential numbering."""
+    notes = []
+    citations_dict = {}
+    all_citations = {}
+    next_citation_number = 1
+
+    for line in chart_notes.splitlines():
+        citations = LINE_CITATIONS_PATTERN.findall(line)
+        clean_sentence = LINE_CITATIONS_PATTERN.sub('', line).strip()
+
+        if clean_sentence:
+            if citations:
+                notes.append(clean_sentence)
+        
+        if citations:
+            citation_texts = citations[0].split(', ')
+            for citation in citation_texts:
+                match = CITATION_PATTERN.search(citation)
+                if match:
+                    citation_number, citation_text = match.groups()
+                    
+                    if citation_text not in all_citations:
+                        all_citations[citation_text] = f"[{next_citation_number}]"
+                        next_citation_number += 1
+                    
+                    if clean_sentence in citations_dict:
+                        citations_dict[clean_sentence].append(f'{all_citations[citation_text]}: "{citation_text}"')
+                    else:
+                        citations_dict[clean_sentence] = [f'{all_citations[citation_text]}: "{citation_text}"']
+
+    return notes, citations_dict
+
+
+def format_citations_dictionary(citations_dict):
+    """Format citations dictionary as a string for download."""
+    formatted_citations = []
+    for note, citations in citations_dict.items():
+        formatted_citations.append(f"Note: {note}")
+        for citation in citations:
+            formatted_citations.append(f"  {citation}")
+        formatted_citations.append("")  # Add a blank line between notes
+    return "\n".join(formatted_citations)
+
+
+def numbered_citations(citations_dict, registry=None):
+    """Each note's reference texts as '[n]: "text"' citations, numbered from ``registry``.
+
+    Numbers follow the order in which the texts first appear across the notes, as
+    renumber_citations numbers them in the chart notes.
+    """
+    if registry is None:
+        registry = CitationRegistry()
+    return {
+        note: [f'[{registry.number(reference)}]: "{reference}"' for reference in references]
+        for note, references in citations_dict.items()
+    }
+
+
+def reference_text(citation):
+    """Quoted text of a '[n]: "text"' citation; plain reference texts are returned stripped."""
+    match = CITATION_PATTERN.fullmatch(citation.strip())
+    return match.group(2) if match else citation.strip()
+
+
+def strip_references(chart_notes):
+    """Remove every {References: ...} block, leaving the chart notes text only."""
+    return REFERENCES_BLOCK_PATTERN.sub('', chart_notes)
+
+
+def extract_note_citations(chart_notes, max_references=MAX_REFERENCES_PER_NOTE):
+    """Parse notes and their references locally from the {References: [n]: "..."} format.
+
+    Returns (notes, citations_dict) in the shape the citation-structuring prompt produces:
+    each note (subheadings and bullets removed) maps to at most ``max_references``
+    reference texts. Each reference keeps its own quoted text: a number the model reuses for
+    a different text counts as a new citation, as renumber_citations would number it. A
+    reference appears once per note; single-word references are dropped. Returns ([], {})
+    when the chart notes contain no usable citations.
+    """
+    notes = []
+    citations_dict = {}
+    previous_end = 0
+    previous_note = ""
+
+    for block in CITATION_BLOCK_PATTERN.finditer(chart_notes):
+        line_start = chart_notes.rfind('\n', 0, block.start()) + 1
+        segment_start = max(line_start, previous_end)
+        note = clean_note(chart_notes[segment_start:block.start()])
+        if not note:
+            # A block on a line of its own cites the closest line of text before it.
+            earlier_lines = [clean_note(line) for line in chart_notes[previous_end:line_start].splitlines()]
+            note = next((line for line in reversed(earlier_lines) if line), previous_note)
+        previous_end = block.end()
+        previous_note = note
+
+        references = []
+        for _, citation_text in CITATION_PATTERN.findall(block.group(1)):
+            citation_text = citation_text.strip()
+            if citation_text not in references and len(citation_text.split()) >= 2:
+                references.append(citation_text)
+
+        if note and references:
+            if note not in citations_dict:
+                notes.append(note)
+                citations_dict[note] = []
+            for reference in references:
+                if reference not in citations_dict[note] and len(citations_dict[note]) < max_references:
+                    citations_dict[note].append(reference)
+
+    return notes, citations_dict
+
+
+def clean_note(text):
+    """Strip a bullet, a leading "**Subheading:**" label and punctuation left around a note."""
+    text = text.strip().strip('.;,').strip()
+    stripped = NOTE_PREFIX_PATTERN.sub('', text, count=1).strip()
+    return (stripped or text.replace('*', '')).strip(' .;,:')
+
+
+class CitationParseStats:
+    """Counts how often citations were parsed locally versus by the LLM fallback."""
+
+    def __init__(self):
+        self.local = 0
+        self.llm_fallback = 0
+        self._lock = threading.Lock()
+
+    def record(self, fallback):
+        with self._lock:
+            if fallback:
+                self.llm_fallback += 1
+            else:
+                self.local += 1
+
+    @property
+    def fallback_rate(self):
+        total = self.local + self.llm_fallback
+        return self.llm_fallback / total if total else 0.0
+
+
+parse_stats = CitationParseStats()
+
+
+def json_generation_config(generation_config):
+    """The generation_config with JSON output constrained to NOTE_CITATIONS_SCHEMA."""
+    return {
+        **generation_config,
+        "response_mime_type": "application/json",
+        "response_schema": NOTE_CITATIONS_SCHEMA,
+    }
+
+
+class NoteCitation:
+    """One note and the transcript references that support it."""
+
+    __slots__ = ('note', 'references')
+
+    def __init__(self, note, references):
+        self.note = note
+        self.references = references
+
+    @classmethod
+    def from_json(cls, item, max_references=MAX_REFERENCES_PER_NOTE):
+        """Build from a decoded {"note": ..., "Reference": [...]} object, or None if it has no usable note."""
+        if not isinstance(item, dict) or not isinstance(item.get("note"), str):
+            return None
+        references = item.get("Reference") or []
+        if isinstance(references, str):
+            references = [references]
+        cleaned = []
+        for reference in references:
+            if isinstance(reference, str) and reference.strip() and reference.strip() not in cleaned:
+                cleaned.append(reference.strip())
+        note = item["note"].strip()
+        if not note or not cleaned:
+            return None
+        return cls(note, cleaned[:max_references])
+
+    def __repr__(self):
+        return f"NoteCitation({self.note!r}, {self.references!r})"
+
+
+def iter_note_citations(chunks, errors=None):
+    """Yield NoteCitations from chunks of a JSON array as each object completes.
+
+    Text around the array (such as a markdown code fence) is ignored. When the JSON
+    breaks off or is malformed, the notes completed before that point are still yielded
+    and the error is appended to ``errors`` if given, otherwise raised.
+    """
+    parser = ItemParser('item', lenient=True)
+    try:
+        for chunk in chunks:
+            for item in parser.feed(chunk):
+                note_citation = NoteCitation.from_json(item)
+                if note_citation is not None:
+                    yield note_citation
+        for item in parser.close():
+            note_citation = NoteCitation.from_json(item)
+            if note_citation is not None:
+                yield note_citation
+    except ValueError as e:
+        if errors is None:
+            raise
+        errors.append(e)
+
+
+def citations_from_note_citations(note_citations):
+    """(notes, citations_dict) from parsed NoteCitations, merging repeated notes."""
+    notes = []
+    citations_dict = {}
+    for note_citation in note_citations:
+        if note_citation.note not in citations_dict:
+            notes.append(note_citation.note)
+            citations_dict[note_citation.note] = []
+        references = citations_dict[note_citation.note]
+        for reference in note_citation.references:
+            if reference not in references and len(references) < MAX_REFERENCES_PER_NOTE:
+                references.append(reference)
+    return notes, citations_dict
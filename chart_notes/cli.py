@@ -0,0 +1,332 @@
+"""Headless command line entry point.
+
+    python -m chart_notes batch transcripts/ --template template.txt --out notes/ --workers 8
+    python -m chart_notes serve --port 8000 --max-in-flight 4 --queue-size 16
+    python -m chart_notes jobs backfill.db add transcripts/ --template template.txt
+    python -m chart_notes jobs backfill.db work --workers 8
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .align import DEFAULT_MIN_SCORE
+from .backends import DEFAULT_MODEL_NAME
+from .citations import format_citations_dictionary, strip_references
+from .jobs import DEFAULT_LEASE_SECONDS, DEFAULT_MAX_ATTEMPTS, JobStore, read_upload, work
+from .llm import DEFAULT_TIMEOUT
+from .metrics import new_trace_id, percentile
+from .pipeline import GENERATION_CONFIG, ChartNotesPipeline
+from .resources import DEFAULT_RESPONSE_CACHE_DIR, PipelineResources
+from .service import DEFAULT_MAX_IN_FLIGHT, DEFAULT_QUEUE_SIZE, ChartNotesService
+
+TRANSCRIPT_EXTENSIONS = ('.json', '.txt')
+
+
+def collect_transcripts(inputs):
+    """Expand directories and glob patterns into a sorted list of transcript files."""
+    paths = set()
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            for root, _, files in os.walk(pattern):
+                paths.update(os.path.join(root, name) for name in files)
+        else:
+            paths.update(glob.glob(pattern, recursive=True))
+    return sorted(path for path in paths if path.lower().endswith(TRANSCRIPT_EXTENSIONS) and os.path.isfile(path))
+
+
+def output_names(paths):
+    """Map each transcript path to a unique output name based on its file stem."""
+    names = {}
+    used = set()
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        name, counter = stem, 2
+        while name in used:
+            name = f"{stem}-{counter}"
+            counter += 1
+        used.add(name)
+        names[path] = name
+    return names
+
+
+def process_file(path, name, template, pipeline, out_dir):
+    """Prepare, generate and parse one transcript with ``pipeline``, writing its three output files.
+
+    The stages are recorded as spans in the pipeline's StageMetrics.
+    """
+    trace_id = new_trace_id()
+    start_time = time.perf_counter()
+    data, content_type = read_upload(path)
+    prepared, _ = pipeline.prepare_upload(data, content_type, trace_id)
+    chart_notes, _ = pipeline.generate_chart_notes(prepared.transcript, template, trace_id)
+    notes, citations_dict = pipeline.parse_citations(chart_notes, trace_id)
+
+    write_outputs(out_dir, name, chart_notes, citations_dict)
+
+    return {
+        "file": path,
+        "status": "ok",
+        "seconds": round(time.perf_counter() - start_time, 3),
+        "transcript_chars": len(prepared.text),
+        "notes": len(notes),
+    }
+
+
+def write_outputs(out_dir, name, chart_notes, citations_dict):
+    """Write the chart notes with and without references and the citations of one transcript."""
+    outputs = {
+        f"{name}.chart_notes_with_references.txt": chart_notes,
+        f"{name}.chart_notes_without_references.txt": strip_references(chart_notes),
+        f"{name}.citations.txt": format_citations_dictionary(citations_dict),
+    }
+    for file_name, content in outputs.items():
+        with open(os.path.join(out_dir, file_name), 'w', encoding='utf-8') as out_file:
+            out_file.write(content)
+
+
+def run_batch(paths, template, pipeline, out_dir, workers=4, skip_existing=False, log=None):
+    """Process transcripts with a pool of ``workers`` threads and return the batch summary."""
+    os.makedirs(out_dir, exist_ok=True)
+    names = output_names(paths)
+    if skip_existing:
+        paths = [path for path in paths
+                 if not os.path.exists(os.path.join(out_dir, f"{names[path]}.citations.txt"))]
+
+    results = []
+    batch_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(process_file, path, names[path], template, pipeline, out_dir): path
+            for path in paths
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"file": path, "status": "failed", "error": f"{type(e).__name__}: {e}"}
+            results.append(result)
+            if log:
+                log(f"[{len(results)}/{len(paths)}] {result['status']} {path}")
+
+    latencies = [result["seconds"] for result in results if result["status"] == "ok"]
+    return {
+        "files": len(results),
+        "succeeded": len(latencies),
+        "failed": len(results) - len(latencies),
+        "wall_seconds": round(time.perf_counter() - batch_start, 3),
+        "latency_p50": percentile(latencies, 0.5),
+        "latency_p95": percentile(latencies, 0.95),
+        "latency_max": max(latencies, default=None),
+        "results": sorted(results, key=lambda result: result["file"]),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m chart_notes", description="Generate chart notes without the Streamlit UI.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    batch = commands.add_parser("batch", help="Process a directory or glob of .json/.txt transcripts.")
+    batch.add_argument("inputs", nargs="+", help="Transcript directories, files or glob patterns.")
+    batch.add_argument("--template", required=True, help="Path to a text file holding the chart note template.")
+    batch.add_argument("--out", required=True, help="Directory for the generated files and summary.json.")
+    batch.add_argument("--workers", type=int, default=4, help="Number of transcripts processed concurrently.")
+    batch.add_argument("--skip-existing", action="store_true", help="Skip transcripts whose outputs already exist.")
+    add_pipeline_arguments(batch)
+    batch.add_argument("--replay-latency", choices=("original", "zero"), default="original",
+                       help="Replay with the recorded timings or without any delay.")
+    batch.add_argument("--max-concurrency", type=int, default=8,
+                       help="Upper bound for in-flight model calls; lowered automatically on 429s.")
+    batch.add_argument("--metrics-prom", metavar="PATH",
+                       help="Write per-stage latency and token metrics to PATH in the Prometheus text format.")
+
+    serve = commands.add_parser("serve", help="Serve chart note generation over HTTP (requires uvicorn).")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8000)
+    add_pipeline_arguments(serve)
+    serve.add_argument("--max-in-flight", type=int, default=DEFAULT_MAX_IN_FLIGHT,
+                       help="Transcripts processed at once; also the upper bound for in-flight model calls.")
+    serve.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                       help="Transcripts waiting for a worker before submissions are answered with 429.")
+
+    jobs = commands.add_parser("jobs", help="Persistent job queue for backfills that resume after a crash.")
+    jobs.add_argument("database", help="SQLite file holding the jobs and their stage checkpoints.")
+    jobs.add_argument("--lease-seconds", type=float, default=DEFAULT_LEASE_SECONDS,
+                      help="How long a job stays leased to a worker that stops renewing it.")
+    jobs.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS,
+                      help="Attempts per job before it is marked failed.")
+    job_commands = jobs.add_subparsers(dest="job_command", required=True)
+    add = job_commands.add_parser("add", help="Queue .json/.txt transcripts; files already queued are skipped.")
+    add.add_argument("inputs", nargs="+", help="Transcript directories, files or glob patterns.")
+    add.add_argument("--template", required=True, help="Path to a text file holding the chart note template.")
+    job_work = job_commands.add_parser("work", help="Lease and process jobs until the queue is empty.")
+    add_pipeline_arguments(job_work)
+    job_work.add_argument("--workers", type=int, default=4, help="Jobs processed concurrently by this process.")
+    job_work.add_argument("--wait", action="store_true", help="Keep polling for new jobs instead of exiting.")
+    job_commands.add_parser("status", help="Print job counts by status and stage, and the failures.")
+    job_commands.add_parser("retry-failed", help="Queue failed jobs again with a fresh attempt budget.")
+    export = job_commands.add_parser("export", help="Write the outputs of finished jobs like the batch command.")
+    export.add_argument("--out", required=True, help="Directory for the generated files.")
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        return run_service(parser, args)
+    if args.command == "jobs":
+        return run_jobs(parser, args)
+
+    paths = collect_transcripts(args.inputs)
+    if not paths:
+        parser.error("no .json or .txt transcripts found")
+    pipeline = build_pipeline(parser, args, args.max_concurrency, replay_latency=args.replay_latency,
+                              metrics_prometheus_file=args.metrics_prom)
+    with open(args.template, encoding='utf-8') as template_file:
+        template = template_file.read()
+
+    summary = run_batch(paths, template, pipeline, args.out, workers=args.workers,
+                        skip_existing=args.skip_existing, log=lambda line: print(line, file=sys.stderr))
+    pipeline.metrics.flush()
+
+    with open(os.path.join(args.out, "summary.json"), 'w', encoding='utf-8') as summary_file:
+        json.dump(summary, summary_file, indent=2)
+    print(f"{summary['succeeded']}/{summary['files']} succeeded in {summary['wall_seconds']}s "
+          f"(p50 {summary['latency_p50']}s, p95 {summary['latency_p95']}s)")
+    return 1 if summary["failed"] else 0
+
+
+def add_pipeline_arguments(command):
+    """Model and cache options of the commands that run a ChartNotesPipeline."""
+    command.add_argument("--api-key", default=os.environ.get("GOOGLE_API_KEY"),
+                         help="Gemini API key (default: $GOOGLE_API_KEY).")
+    command.add_argument("--model", default=DEFAULT_MODEL_NAME)
+    command.add_argument("--backend", choices=("gemini", "stub"), default="gemini",
+                         help="Model backend; 'stub' answers offline with deterministic notes.")
+    command.add_argument("--stub-latency", type=float, default=0.5, help="Seconds the stub backend waits per call.")
+    command.add_argument("--record", metavar="CASSETTE", help="Record every model call to this .jsonl.gz cassette.")
+    command.add_argument("--replay", metavar="CASSETTE", help="Answer model calls from this cassette instead of a backend.")
+    command.add_argument("--rpm", type=int, default=None, help="Model requests-per-minute budget.")
+    command.add_argument("--tpm", type=int, default=None, help="Model tokens-per-minute budget.")
+    add_call_arguments(command)
+    command.add_argument("--context-tokens", type=int, default=None,
+                         help="Input token limit of the model (default: looked up by --model).")
+    command.add_argument("--long-transcript-chars", type=int, default=None,
+                         help="Generate transcripts longer than this in map-reduce mode "
+                              "(default: half the model's context, at 4 characters per token).")
+    command.add_argument("--window-chars", type=int, default=None,
+                         help="Largest map-reduce window in characters (default: half of --long-transcript-chars).")
+    command.add_argument("--min-citation-score", type=float, default=None,
+                         help=f"Lowest score (0-1) of a fuzzily aligned citation that is highlighted "
+                              f"(default {DEFAULT_MIN_SCORE}).")
+    command.add_argument("--response-cache-dir", default=DEFAULT_RESPONSE_CACHE_DIR,
+                         help="Directory for cached model responses.")
+    command.add_argument("--metrics-jsonl", metavar="PATH", help="Append a JSON line per pipeline stage span to PATH.")
+
+
+def add_call_arguments(command):
+    """Timeout, retry and hedging options for each model call."""
+    command.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT,
+                         help="Seconds one model call attempt (or the wait for the next streamed chunk) may take.")
+    command.add_argument("--deadline", type=float, default=None,
+                         help="Seconds a model call may take in total, retries included.")
+    command.add_argument("--max-retries", type=int, default=5,
+                         help="Retries of a model call after timeouts, rate limits and transient errors.")
+    command.add_argument("--hedge", action="store_true",
+                         help="Send a duplicate of a model call slower than the p95 of recent calls; the first answer wins.")
+    command.add_argument("--hedge-delay", type=float, default=None,
+                         help="Seconds before hedging until enough call latencies have been seen.")
+
+
+def build_pipeline(parser, args, max_concurrency, **extra_settings):
+    """A ChartNotesPipeline configured from the add_pipeline_arguments options and ``extra_settings``."""
+    if args.backend == "gemini" and not args.replay and not args.api_key:
+        parser.error("an API key is required (--api-key or $GOOGLE_API_KEY)")
+    settings = {
+        "model_backend": args.backend,
+        "api_key": args.api_key,
+        "stub_latency": args.stub_latency,
+        "record_cassette": args.record,
+        "replay_cassette": args.replay,
+        "requests_per_minute": args.rpm,
+        "tokens_per_minute": args.tpm,
+        "max_concurrency": max_concurrency,
+        "call_timeout": args.timeout,
+        "call_deadline": args.deadline,
+        "max_retries": args.max_retries,
+        "hedge_requests": args.hedge,
+        "hedge_delay": args.hedge_delay,
+        "response_cache_dir": args.response_cache_dir,
+        "model_context_tokens": args.context_tokens,
+        "long_transcript_chars": args.long_transcript_chars,
+        "window_chars": args.window_chars,
+        "citation_min_score": args.min_citation_score,
+        "metrics_jsonl": args.metrics_jsonl,
+        **extra_settings,
+    }
+    resources = PipelineResources({name: value for name, value in settings.items() if value is not None},
+                                  GENERATION_CONFIG, model_name=args.model)
+    return ChartNotesPipeline(resources)
+
+
+def run_service(parser, args):
+    """Build the pipeline from the command line settings and serve it with uvicorn until interrupted."""
+    try:
+        import uvicorn
+    except ImportError:
+        parser.error("the serve command requires uvicorn (pip install uvicorn)")
+    try:
+        service = ChartNotesService(build_pipeline(parser, args, args.max_in_flight),
+                                    max_in_flight=args.max_in_flight, queue_size=args.queue_size)
+    except ValueError as e:
+        parser.error(str(e))
+    uvicorn.run(service, host=args.host, port=args.port, log_level="warning")
+    return 0
+
+
+def run_jobs(parser, args):
+    """The ``jobs`` subcommands over the SQLite job store."""
+    store = JobStore(args.database, lease_seconds=args.lease_seconds, max_attempts=args.max_attempts)
+
+    if args.job_command == "add":
+        paths = collect_transcripts(args.inputs)
+        if not paths:
+            parser.error("no .json or .txt transcripts found")
+        with open(args.template, encoding='utf-8') as template_file:
+            template = template_file.read()
+        added = sum(store.add(path, template)[1] for path in paths)
+        print(f"queued {added} new jobs ({len(paths) - added} already queued)")
+        return 0
+
+    if args.job_command == "work":
+        pipeline = build_pipeline(parser, args, args.workers)
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            futures = [
+                executor.submit(work, store, pipeline, wait=args.wait, log=lambda line: print(line, file=sys.stderr))
+                for _ in range(args.workers)
+            ]
+            totals = [future.result() for future in futures]
+        done, failed = sum(total[0] for total in totals), sum(total[1] for total in totals)
+        print(f"{done} jobs done, {failed} attempts failed")
+        return 1 if failed else 0
+
+    if args.job_command == "retry-failed":
+        print(f"queued {store.retry_failed()} failed jobs again")
+        return 0
+
+    if args.job_command == "export":
+        os.makedirs(args.out, exist_ok=True)
+        results = list(store.results())
+        names = output_names([source for source, _, _ in results])
+        for source, generated, structured in results:
+            write_outputs(args.out, names[source], generated["chart_notes"], structured["citations"])
+        print(f"exported {len(results)} jobs to {args.out}")
+        return 0
+
+    # status
+    print(json.dumps(store.counts(), indent=2))
+    for source, attempts, error in store.failures():
+        print(f"failed after {attempts} attempts: {source}: {error}")
+    return 0
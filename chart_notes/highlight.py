@@ -0,0 +1,134 @@
+"""Citation matching and the span offsets the transcript viewer highlights."""
+
+import re
+from bisect import bisect_left
+
+from .cache import LRUCache
+
+HIGHLIGHT_CACHE_ENTRIES = 128
+# Characters outside the Basic Multilingual Plane, which take two UTF-16 code units.
+ASTRAL_CHARACTER_PATTERN = re.compile('[\U00010000-\U0010FFFF]')
+
+
+def fold_case(text):
+    """Lower-case ``text`` without changing its length, so offsets stay valid for the original."""
+    folded = text.lower()
+    if len(folded) == len(text):
+        return folded
+    return "".join(char if len(char.lower()) != 1 else char.lower() for char in text)
+
+
+class CitationMatcher:
+    """Aho-Corasick automaton over case-folded citation texts.
+
+    ``find`` reports every occurrence of every pattern in one pass over the text, so the
+    cost is O(text + matches) however many citations there are.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = []
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for pattern in patterns:
+            self.add(pattern)
+        self._build()
+
+    def add(self, pattern):
+        folded = fold_case(pattern.strip())
+        if not folded:
+            return
+        node = 0
+        for char in folded:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = next_node
+        self._output[node].append((len(self.patterns), len(folded)))
+        self.patterns.append(pattern)
+
+    def _build(self):
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def find(self, text):
+        """(pattern index, start, end) for every case-insensitive occurrence, by end offset."""
+        return self.find_folded(fold_case(text))
+
+    def find_folded(self, folded_text):
+        """``find`` for text already passed through fold_case (e.g. TranscriptIndex.folded_text)."""
+        goto, fail, output = self._goto, self._fail, self._output
+        matches = []
+        node = 0
+        for position, char in enumerate(folded_text, 1):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for pattern_index, length in output[node]:
+                matches.append((pattern_index, position - length, position))
+        return matches
+
+
+def merge_spans(spans):
+    """Sort (start, end) spans and merge those that overlap or touch."""
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def astral_offsets(text):
+    """Offsets of the characters of ``text`` that take two UTF-16 code units, in order."""
+    return [match.start() for match in ASTRAL_CHARACTER_PATTERN.finditer(text)]
+
+
+def utf16_spans(astral, spans):
+    """(start, end) code point offsets as UTF-16 code unit offsets, as JavaScript indexes strings.
+
+    ``astral`` is astral_offsets of the text, computed once per transcript (see
+    uploads.PreparedTranscript), so the conversion costs O(spans x log astral characters).
+    """
+    if not astral:
+        return list(spans)
+    return [(start + bisect_left(astral, start), end + bisect_left(astral, end)) for start, end in spans]
+
+
+class HighlightCache:
+    """Resolved spans (see index.resolve_citations) per (transcript hash, note), kept for the most recently used notes.
+
+    ``put_all`` stores the spans of every note once its citations are resolved, so switching
+    notes is a lookup. A note evicted since is resolved again by ``get`` on selection.
+    """
+
+    def __init__(self, max_entries=HIGHLIGHT_CACHE_ENTRIES):
+        self.spans = LRUCache(max_entries)
+
+    def put_all(self, text_hash, citation_spans):
+        """Replace the cached spans with those of ``citation_spans`` (note -> spans) for the transcript."""
+        self.spans.clear()
+        for note, spans in citation_spans.items():
+            self.spans.put((text_hash, note), spans)
+
+    def get(self, text_hash, note, resolve):
+        """The spans of ``note``, from the cache or from ``resolve(note)``."""
+        key = (text_hash, note)
+        spans = self.spans.get(key)
+        if spans is None:
+            spans = resolve(note)
+            self.spans.put(key, spans)
+        return spans
@@ -0,0 +1,139 @@
+"""Inverted n-gram index over a transcript for resolving citations to character spans."""
+
+import re
+from array import array
+
+from .highlight import CitationMatcher, fold_case
+
+TOKEN_PATTERN = re.compile(r"\w+(?:'\w+)*")
+
+
+def normalize_token(token):
+    """Case- and apostrophe-insensitive form of a token ("I've" -> "ive")."""
+    return token.lower().replace("'", "")
+
+
+def tokenize(text):
+    """Normalized tokens of ``text``."""
+    return [normalize_token(match.group()) for match in TOKEN_PATTERN.finditer(text)]
+
+
+def _add(table, key, position):
+    # Most n-grams occur once, so a bare int is stored until a second position turns up.
+    positions = table.get(key)
+    if positions is None:
+        table[key] = position
+    elif isinstance(positions, int):
+        table[key] = [positions, position]
+    else:
+        positions.append(position)
+
+
+def _positions(table, key):
+    positions = table.get(key)
+    if positions is None:
+        return ()
+    if isinstance(positions, int):
+        return (positions,)
+    return positions
+
+
+class TranscriptIndex:
+    """Normalized tokens of a transcript with their character offsets and an n-gram index.
+
+    Built once per transcript in O(tokens). ``find`` looks up the rarest n-gram of a
+    citation and verifies the few candidate positions, so resolving a citation costs
+    O(candidates x citation length) instead of a scan over the whole transcript.
+    ``folded_text`` is the case-folded transcript that CitationMatcher scans.
+    """
+
+    __slots__ = ('text', 'folded_text', 'n', 'tokens', 'starts', 'ends', 'unigrams', 'ngrams')
+
+    def __init__(self, text, n=3):
+        self.text = text
+        self.folded_text = fold_case(text)
+        self.n = n
+        self.tokens = []
+        self.starts = array('q')
+        self.ends = array('q')
+        self.unigrams = {}
+        self.ngrams = {}
+
+        for position, match in enumerate(TOKEN_PATTERN.finditer(text)):
+            token = normalize_token(match.group())
+            self.tokens.append(token)
+            self.starts.append(match.start())
+            self.ends.append(match.end())
+            _add(self.unigrams, token, position)
+            if position >= n - 1:
+                _add(self.ngrams, hash(tuple(self.tokens[position - n + 1:position + 1])), position - n + 1)
+
+    def _candidates(self, citation_tokens):
+        """(offset into the citation, candidate token positions) for its rarest n-gram or token."""
+        if len(citation_tokens) >= self.n:
+            options = (
+                (offset, _positions(self.ngrams, hash(tuple(citation_tokens[offset:offset + self.n]))))
+                for offset in range(len(citation_tokens) - self.n + 1)
+            )
+        else:
+            options = ((offset, _positions(self.unigrams, token)) for offset, token in enumerate(citation_tokens))
+        return min(options, key=lambda option: len(option[1]))
+
+    def find_all(self, citation, limit=None):
+        """Character spans of the occurrences of ``citation``, in transcript order."""
+        citation_tokens = tokenize(citation)
+        if not citation_tokens:
+            return []
+        offset, positions = self._candidates(citation_tokens)
+        length = len(citation_tokens)
+        spans = []
+        for position in positions:
+            start = position - offset
+            if start >= 0 and self.tokens[start:start + length] == citation_tokens:
+                spans.append((self.starts[start], self.ends[start + length - 1]))
+                if limit is not None and len(spans) >= limit:
+                    break
+        return spans
+
+    def find(self, citation):
+        """Character span of the first occurrence of ``citation``, or None."""
+        spans = self.find_all(citation, limit=1)
+        return spans[0] if spans else None
+
+
+def resolve_citations(index, citations_dict, all_occurrences=False, aligner=None, min_score=None):
+    """Map each note to ((start, end), score) pairs for the transcript spans of its citations, by start.
+
+    Citations may be plain reference texts or '[n]: "text"' entries. With ``all_occurrences``
+    every case-insensitive occurrence is found by one Aho-Corasick pass over the transcript
+    for all notes; otherwise the first occurrence comes from the index. Verbatim matches
+    score 1.0. Citations that do not occur verbatim are aligned fuzzily when an ``aligner``
+    (a CitationAligner) is given and kept if their Alignment.score is at least
+    ``min_score`` (align.DEFAULT_MIN_SCORE by default); otherwise they are left out.
+    """
+    from .align import DEFAULT_MIN_SCORE
+    from .citations import reference_text
+
+    if min_score is None:
+        min_score = DEFAULT_MIN_SCORE
+
+    texts = {note: [reference_text(citation) for citation in citations] for note, citations in citations_dict.items()}
+    if all_occurrences:
+        matcher = CitationMatcher({text for note_texts in texts.values() for text in note_texts})
+        occurrences = {}
+        for pattern_index, start, end in matcher.find_folded(index.folded_text):
+            occurrences.setdefault(matcher.patterns[pattern_index], []).append((start, end))
+
+    citation_spans = {}
+    for note, note_texts in texts.items():
+        spans = []
+        for text in note_texts:
+            found = occurrences.get(text, []) if all_occurrences else index.find_all(text, limit=1)
+            if found:
+                spans.extend((span, 1.0) for span in found)
+            elif aligner is not None:
+                alignment = aligner.align(text)
+                if alignment is not None and alignment.score >= min_score:
+                    spans.append((alignment.span, alignment.score))
+        citation_spans[note] = sorted(spans)
+    return citation_spans
@@ -0,0 +1,363 @@
+"""Persistent, resumable job queue for bulk transcript processing, stored in SQLite.
+
+    python -m chart_notes jobs backfill.db add transcripts/ --template template.txt
+    python -m chart_notes jobs backfill.db work --workers 8      # in as many processes as wanted
+    python -m chart_notes jobs backfill.db status
+    python -m chart_notes jobs backfill.db export --out notes/
+
+Each transcript file becomes a job, identified by its path and template, so adding the
+same files again does nothing. A job passes through four stages and stores a
+checkpoint after each one. The checkpoints are the transcript (extracted), the chart
+notes (generated), the notes and their references (structured) and the transcript
+spans with their match scores (aligned). Workers lease one job at a time. A lease that is not renewed expires,
+and the job goes back to the queue. Whoever runs the job next resumes after its last
+checkpoint, so a crash or a restart never repeats the model call of a finished stage.
+Every checkpoint write is conditional on still holding the lease, and writing one
+twice stores the same row, so retries are idempotent.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from .cache import content_hash
+from .metrics import new_trace_id
+from .prefix_cache import template_version
+from .prompts import chart_notes_system_instruction
+from .transcript import Transcript
+from .uploads import JSON_CONTENT_TYPE, PreparedTranscript, upload_hash
+
+STAGES = ('extracted', 'generated', 'structured', 'aligned')
+DEFAULT_LEASE_SECONDS = 300
+DEFAULT_MAX_ATTEMPTS = 3
+POLL_SECONDS = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS templates (
+    id TEXT PRIMARY KEY,
+    text TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    template_id TEXT NOT NULL REFERENCES templates (id),
+    status TEXT NOT NULL DEFAULT 'pending',
+    stage TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, created);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    job_id TEXT NOT NULL REFERENCES jobs (id),
+    stage TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (job_id, stage)
+);
+"""
+
+
+class LeaseLost(Exception):
+    """The job's lease expired and another worker may own it now."""
+
+
+class Job:
+    """One leased job: its source file, template and the checkpoints stored so far."""
+
+    __slots__ = ('id', 'source', 'template_id', 'template', 'attempts', 'checkpoints')
+
+    def __init__(self, id, source, template_id, template, attempts, checkpoints):
+        self.id = id
+        self.source = source
+        self.template_id = template_id
+        self.template = template
+        self.attempts = attempts
+        self.checkpoints = checkpoints
+
+    @property
+    def stage(self):
+        """The last completed stage, or None."""
+        return next((stage for stage in reversed(STAGES) if stage in self.checkpoints), None)
+
+    def __repr__(self):
+        return f"Job({self.id!r}, {self.source!r}, stage={self.stage!r})"
+
+
+class JobStore:
+    """Jobs and their stage checkpoints in one SQLite file, shared by any number of worker processes.
+
+    Each thread gets its own connection. The database runs in WAL mode, so readers do
+    not block the worker writing a checkpoint. Leases are taken in an IMMEDIATE
+    transaction, so two workers never lease the same job.
+    """
+
+    def __init__(self, path, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        self.connection.executescript(SCHEMA)
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _transaction(self):
+        return _Transaction(self.connection)
+
+    def add(self, source, template):
+        """Queue ``source`` (a transcript file) for ``template``; returns the job id and whether it is new."""
+        source = os.path.abspath(source)
+        template_id = template_version(chart_notes_system_instruction(template))
+        job_id = content_hash("job", source, template_id)[:32]
+        now = time.time()
+        with self._transaction() as connection:
+            connection.execute("INSERT OR IGNORE INTO templates (id, text) VALUES (?, ?)", (template_id, template))
+            added = connection.execute(
+                "INSERT OR IGNORE INTO jobs (id, source, template_id, created, updated) VALUES (?, ?, ?, ?, ?)",
+                (job_id, source, template_id, now, now),
+            ).rowcount
+        return job_id, bool(added)
+
+    def lease(self, owner):
+        """Lease the oldest pending job (or one whose lease expired) to ``owner``; None when there is none.
+
+        A job whose lease expired after ``max_attempts`` attempts is marked failed instead.
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = 'failed', error = 'lease expired after the last attempt', "
+                "lease_owner = NULL, updated = ? WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, now, self.max_attempts),
+            )
+            row = connection.execute(
+                "SELECT id FROM jobs WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) "
+                "ORDER BY created, id LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1, "
+                "updated = ? WHERE id = ?",
+                (owner, now + self.lease_seconds, now, row[0]),
+            )
+            return self._load(connection, row[0])
+
+    def _load(self, connection, job_id):
+        source, template_id, template, attempts = connection.execute(
+            "SELECT jobs.source, jobs.template_id, templates.text, jobs.attempts "
+            "FROM jobs JOIN templates ON templates.id = jobs.template_id WHERE jobs.id = ?",
+            (job_id,),
+        ).fetchone()
+        checkpoints = {
+            stage: json.loads(payload)
+            for stage, payload in connection.execute(
+                "SELECT stage, payload FROM checkpoints WHERE job_id = ?", (job_id,)
+            )
+        }
+        return Job(job_id, source, template_id, template, attempts, checkpoints)
+
+    def _owned(self, connection, job_id, owner, **changes):
+        """Apply ``changes`` to the job if ``owner`` still holds its lease, else raise LeaseLost."""
+        assignments = ", ".join(f"{column} = ?" for column in changes)
+        updated = connection.execute(
+            f"UPDATE jobs SET {assignments}, updated = ? WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+            (*changes.values(), time.time(), job_id, owner),
+        ).rowcount
+        if not updated:
+            raise LeaseLost(job_id)
+
+    def renew(self, job_id, owner):
+        """Extend the lease by ``lease_seconds``."""
+        with self._transaction() as connection:
+            self._owned(connection, job_id, owner, lease_expires=time.time() + self.lease_seconds)
+
+    def checkpoint(self, job, owner, stage, payload):
+        """Store the result of ``stage`` and extend the lease; storing the same stage again replaces it."""
+        with self._transaction() as connection:
+            self._owned(connection, job.id, owner, stage=stage, lease_expires=time.time() + self.lease_seconds)
+            connection.execute(
+                "INSERT OR REPLACE INTO checkpoints (job_id, stage, payload, created) VALUES (?, ?, ?, ?)",
+                (job.id, stage, json.dumps(payload, ensure_ascii=False), time.time()),
+            )
+        job.checkpoints[stage] = payload
+
+    def complete(self, job_id, owner):
+        with self._transaction() as connection:
+            self._owned(connection, job_id, owner, status="done", lease_owner=None, lease_expires=None, error=None)
+
+    def fail(self, job_id, owner, error):
+        """Record ``error``; the job is queued again until it has used ``max_attempts`` attempts."""
+        with self._transaction() as connection:
+            attempts = connection.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+            status = "failed" if attempts >= self.max_attempts else "pending"
+            self._owned(connection, job_id, owner, status=status, lease_owner=None, lease_expires=None, error=error)
+
+    def retry_failed(self):
+        """Queue every failed job again with a fresh attempt budget and no error or lease; returns how many."""
+        with self._transaction() as connection:
+            return connection.execute(
+                "UPDATE jobs SET status = 'pending', attempts = 0, error = NULL, lease_owner = NULL, "
+                "lease_expires = NULL, updated = ? WHERE status = 'failed'",
+                (time.time(),),
+            ).rowcount
+
+    def counts(self):
+        """Number of jobs by status and, for unfinished jobs, by last completed stage."""
+        connection = self.connection
+        counts = {"status": dict(connection.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"))}
+        counts["stage"] = {
+            stage or "queued": count
+            for stage, count in connection.execute(
+                "SELECT stage, COUNT(*) FROM jobs WHERE status != 'done' GROUP BY stage"
+            )
+        }
+        return counts
+
+    def failures(self):
+        """(source, attempts, error) of each failed job."""
+        return self.connection.execute(
+            "SELECT source, attempts, error FROM jobs WHERE status = 'failed' ORDER BY source"
+        ).fetchall()
+
+    def results(self):
+        """(source, generated, structured) checkpoints of each finished job, by source path."""
+        rows = self.connection.execute(
+            "SELECT jobs.source, generated.payload, structured.payload FROM jobs "
+            "JOIN checkpoints generated ON generated.job_id = jobs.id AND generated.stage = 'generated' "
+            "JOIN checkpoints structured ON structured.job_id = jobs.id AND structured.stage = 'structured' "
+            "WHERE jobs.status = 'done' ORDER BY jobs.source"
+        )
+        for source, generated, structured in rows:
+            yield source, json.loads(generated), json.loads(structured)
+
+
+class _Transaction:
+    """``with`` block running as one IMMEDIATE transaction, committed on success and rolled back on error."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.connection.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+def read_upload(path):
+    """The bytes of a transcript file and how to read them (JSON or text), like an upload."""
+    with open(path, 'rb') as transcript_file:
+        data = transcript_file.read()
+    return data, JSON_CONTENT_TYPE if path.lower().endswith('.json') else "text/plain"
+
+
+def run_job(store, pipeline, job, owner):
+    """Run the stages of ``job`` after its last checkpoint, storing a checkpoint after each."""
+    trace_id = new_trace_id()
+    checkpoints = job.checkpoints
+
+    if "extracted" in checkpoints:
+        transcript = Transcript.from_dict(checkpoints["extracted"]["transcript"])
+        prepared = PreparedTranscript(checkpoints["extracted"]["upload_hash"], transcript)
+    else:
+        data, content_type = read_upload(job.source)
+        prepared, _ = pipeline.prepare_upload(data, content_type, trace_id)
+        store.checkpoint(job, owner, "extracted", {
+            "upload_hash": upload_hash(data, content_type),
+            "transcript": prepared.transcript.as_dict(),
+        })
+
+    if "generated" not in checkpoints:
+        chart_notes, timings = pipeline.generate_chart_notes(prepared.transcript, job.template, trace_id)
+        store.checkpoint(job, owner, "generated", {"chart_notes": chart_notes, "timings": timings.as_dict()})
+    chart_notes = checkpoints["generated"]["chart_notes"]
+
+    if "structured" not in checkpoints:
+        notes, citations_dict = pipeline.parse_citations(chart_notes, trace_id)
+        store.checkpoint(job, owner, "structured", {"notes": notes, "citations": citations_dict})
+    citations_dict = checkpoints["structured"]["citations"]
+
+    if "aligned" not in checkpoints:
+        citation_spans = pipeline.resolve_spans(prepared, citations_dict, trace_id)
+        store.checkpoint(job, owner, "aligned", {
+            note: [[start, end, score] for (start, end), score in spans] for note, spans in citation_spans.items()
+        })
+
+
+class _Heartbeat:
+    """Renews a job's lease from a background thread while a stage (such as a model call) runs."""
+
+    def __init__(self, store, job_id, owner):
+        self.store = store
+        self.job_id = job_id
+        self.owner = owner
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=f"lease-{job_id[:8]}", daemon=True)
+
+    def _run(self):
+        while not self.stopped.wait(self.store.lease_seconds / 3):
+            try:
+                self.store.renew(self.job_id, self.owner)
+            except LeaseLost:
+                # The next checkpoint raises LeaseLost and stops the job.
+                return
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.stopped.set()
+        self.thread.join()
+        return False
+
+
+def work(store, pipeline, owner=None, wait=False, log=None):
+    """Lease and run jobs until none are left (or forever with ``wait``); returns (done, failed) counts."""
+    owner = owner or f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    done = failed = 0
+    while True:
+        job = store.lease(owner)
+        if job is None:
+            if not wait:
+                return done, failed
+            time.sleep(POLL_SECONDS)
+            continue
+        resumed = job.stage
+        try:
+            with _Heartbeat(store, job.id, owner):
+                run_job(store, pipeline, job, owner)
+            store.complete(job.id, owner)
+            done += 1
+            status = "done"
+        except LeaseLost:
+            # Another worker owns the job now; its checkpoints carry on from ours.
+            status = "lease lost"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            try:
+                store.fail(job.id, owner, error)
+            except LeaseLost:
+                pass
+            failed += 1
+            status = f"failed ({error})"
+        if log:
+            log(f"{status} {job.source}" + (f" (resumed after {resumed})" if resumed else ""))
@@ -0,0 +1,192 @@
+"""Incremental JSON decoding for large uploads and streamed model output."""
+
+import codecs
+import json
+import re
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_STRING = re.compile(r'"(?:[^"\\]|\\.)*"', re.DOTALL)
+_SCALAR = re.compile(r'-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][-+]?\d+)?|true|false|null')
+_DELIMITERS = ',}] \t\n\r'
+
+
+def _scalar_complete(buf, value_end, final):
+    # A number such as "0." or "12e" cut at a chunk boundary matches as a shorter number;
+    # it is only complete once a delimiter follows it (or the input has ended).
+    return final or (value_end < len(buf) and buf[value_end] in _DELIMITERS)
+
+
+class ItemParser:
+    """Push parser that returns the values found at a dotted path as soon as they are complete.
+
+    Array elements are addressed with ``item``, e.g. ``"transcripts.item.speakerTurns.item"``.
+    Only the unconsumed tail of the input and the value currently being decoded are kept
+    in memory. With ``lenient=True`` any text before the first ``[``/``{`` (such as a
+    markdown code fence) and after the top-level value is ignored.
+    """
+
+    def __init__(self, path, lenient=False):
+        self.path = tuple(path.split('.')) if path else ()
+        self.lenient = lenient
+        self._buf = ''
+        self._pos = 0
+        self._target = list(self.path)
+        self._stack = []  # 'map' or 'array' for every open container
+        self._keys = []  # path of the current position, kept in step with the stack
+        self._state = 'value'
+
+    def feed(self, data):
+        """Add text to the parser and return the values completed by it."""
+        self._buf = self._buf[self._pos:] + data
+        self._pos = 0
+        return self._parse(final=False)
+
+    def close(self):
+        """Signal end of input and return any remaining values."""
+        items = self._parse(final=True)
+        if self._state != 'end' and not (self.lenient and self._state == 'value' and not self._stack):
+            raise ValueError("Incomplete JSON document")
+        return items
+
+    def _after_value(self):
+        self._state = 'comma' if self._stack else 'end'
+
+    def _parse(self, final):
+        items = []
+        buf = self._buf
+        pos = self._pos
+        end = len(buf)
+
+        while True:
+            pos = _WHITESPACE.match(buf, pos).end()
+            if pos >= end:
+                break
+            state = self._state
+            char = buf[pos]
+
+            if state == 'end':
+                if not self.lenient:
+                    raise ValueError(f"Unexpected data after JSON document at {pos}")
+                pos = end
+                break
+
+            if state == 'value' or state == 'value_or_end':
+                if state == 'value_or_end' and char == ']':
+                    self._stack.pop()
+                    self._keys.pop()
+                    pos += 1
+                    self._after_value()
+                    continue
+
+                if self.lenient and not self._stack and char not in '[{':
+                    # Skip preamble such as ```json before the document starts.
+                    next_open = min((i for i in (buf.find('[', pos), buf.find('{', pos)) if i != -1), default=-1)
+                    if next_open == -1:
+                        pos = end
+                        break
+                    pos = next_open
+                    continue
+
+                if self._keys == self._target:
+                    try:
+                        value, value_end = _decoder.raw_decode(buf, pos)
+                    except json.JSONDecodeError:
+                        if final:
+                            raise
+                        break
+                    if char not in '{["' and not _scalar_complete(buf, value_end, final):
+                        break
+                    items.append(value)
+                    pos = value_end
+                    self._after_value()
+                elif char == '{':
+                    self._stack.append('map')
+                    self._keys.append(None)
+                    pos += 1
+                    self._state = 'key_or_end'
+                elif char == '[':
+                    self._stack.append('array')
+                    self._keys.append('item')
+                    pos += 1
+                    self._state = 'value_or_end'
+                elif char == '"':
+                    match = _STRING.match(buf, pos)
+                    if not match:
+                        if final:
+                            raise ValueError(f"Unterminated string at {pos}")
+                        break
+                    pos = match.end()
+                    self._after_value()
+                else:
+                    match = _SCALAR.match(buf, pos)
+                    if not match:
+                        if final or end - pos > 5:
+                            raise ValueError(f"Unexpected character {char!r} at {pos}")
+                        break
+                    if not _scalar_complete(buf, match.end(), final):
+                        break
+                    pos = match.end()
+                    self._after_value()
+
+            elif state == 'key_or_end' or state == 'key':
+                if state == 'key_or_end' and char == '}':
+                    self._stack.pop()
+                    self._keys.pop()
+                    pos += 1
+                    self._after_value()
+                    continue
+                if char != '"':
+                    raise ValueError(f"Expected object key at {pos}")
+                match = _STRING.match(buf, pos)
+                if not match:
+                    if final:
+                        raise ValueError(f"Unterminated string at {pos}")
+                    break
+                token = match.group()
+                self._keys[-1] = json.loads(token) if '\\' in token else token[1:-1]
+                pos = match.end()
+                self._state = 'colon'
+
+            elif state == 'colon':
+                if char != ':':
+                    raise ValueError(f"Expected ':' at {pos}")
+                pos += 1
+                self._state = 'value'
+
+            elif state == 'comma':
+                kind = self._stack[-1]
+                if char == ',':
+                    pos += 1
+                    self._state = 'key' if kind == 'map' else 'value'
+                elif (kind == 'map' and char == '}') or (kind == 'array' and char == ']'):
+                    self._stack.pop()
+                    self._keys.pop()
+                    pos += 1
+                    self._after_value()
+                else:
+                    raise ValueError(f"Expected ',' at {pos}")
+
+        self._buf = buf
+        self._pos = pos
+        return items
+
+
+def iter_items(fp, path, chunk_size=65536, lenient=False):
+    """Yield the values at ``path`` from a text or binary file object, reading it in chunks."""
+    parser = ItemParser(path, lenient=lenient)
+    decoder = None
+
+    while True:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            break
+        if isinstance(chunk, bytes):
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder('utf-8-sig')()
+            chunk = decoder.decode(chunk)
+        yield from parser.feed(chunk)
+
+    if decoder is not None:
+        yield from parser.feed(decoder.decode(b'', final=True))
+    yield from parser.close()
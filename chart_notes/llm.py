@@ -0,0 +1,471 @@
+"""Asyncio client around a generative model with quota-based rate limiting and adaptive concurrency."""
+
+import asyncio
+import collections
+import copy
+import queue
+import random
+import threading
+import time
+
+from .metrics import percentile
+
+RATE_LIMIT_ERROR_NAMES = ('ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable', 'RateLimitError')
+RATE_LIMIT_STATUS_CODES = (429, 503)
+TRANSIENT_ERROR_NAMES = ('DeadlineExceeded', 'InternalServerError', 'BadGateway', 'GatewayTimeout', 'InternalError')
+TRANSIENT_STATUS_CODES = (500, 502, 504)
+
+DEFAULT_TIMEOUT = 120.0
+HEDGE_QUANTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_BUDGET = 0.1
+LATENCY_SAMPLES = 200
+
+_loop = None
+_loop_lock = threading.Lock()
+_STREAM_END = object()
+
+
+def background_loop():
+    """Return the process-wide event loop that clients run on, starting its thread on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="chart-notes-llm", daemon=True).start()
+    return _loop
+
+
+def is_rate_limit_error(error):
+    """True for quota (429) and overload (503) errors raised by the model API."""
+    if type(error).__name__ in RATE_LIMIT_ERROR_NAMES:
+        return True
+    code = getattr(error, 'code', None)
+    try:
+        return int(code) in RATE_LIMIT_STATUS_CODES
+    except (TypeError, ValueError):
+        return False
+
+
+def is_retryable_error(error):
+    """True for errors worth another attempt: rate limits, timeouts, dropped connections and 5xx errors."""
+    if is_rate_limit_error(error) or isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in TRANSIENT_ERROR_NAMES:
+        return True
+    code = getattr(error, 'code', None)
+    try:
+        return int(code) in TRANSIENT_STATUS_CODES
+    except (TypeError, ValueError):
+        return False
+
+
+def estimate_tokens(text):
+    """Rough token count used for budgeting before the model reports actual usage."""
+    return len(text) // 4 + 1
+
+
+def response_text(response):
+    """Text of the first candidate of a generate_content response."""
+    return response.candidates[0].content.parts[0].text.strip()
+
+
+class TokenBucket:
+    """Refills ``per_minute`` tokens per minute, holding at most one minute's worth."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        """Wait until ``amount`` tokens are available and take them.
+
+        Requests larger than the capacity wait for a full bucket and then overdraw it.
+        """
+        amount = min(float(amount), self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def adjust(self, amount):
+        """Charge (or refund, when negative) tokens after the actual usage is known."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class AdaptiveConcurrency:
+    """AIMD limit on in-flight calls: +1 per window of successes, halved on overload.
+
+    Calls that fail for other reasons leave the limit unchanged.
+    """
+
+    def __init__(self, initial, minimum=1, maximum=32, decrease_factor=0.5):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    def try_acquire(self):
+        """Take a slot if one is free right now, without waiting for one."""
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+        return False
+
+    async def release(self, succeeded=False, overloaded=False):
+        async with self._condition:
+            self.in_flight -= 1
+            if overloaded:
+                self.limit = max(self.minimum, self.limit * self.decrease_factor)
+            elif succeeded:
+                self.limit = min(self.maximum, self.limit + 1.0 / int(self.limit))
+            self._condition.notify_all()
+
+
+class _Attempt:
+    """Limits of one attempt at a call: its timeout, quota admission, concurrency limit and per-call event counts."""
+
+    def __init__(self, client, timeout, admit, concurrency, call_stats):
+        self.client = client
+        self.timeout = timeout
+        self.admit = admit
+        self.concurrency = concurrency
+        self.call_stats = call_stats
+
+    def count(self, name):
+        self.client._count(name, self.call_stats)
+
+
+async def _within(awaitable, timeout):
+    if timeout is None:
+        return await awaitable
+    return await asyncio.wait_for(awaitable, max(0.0, timeout))
+
+
+async def _aclose(stream):
+    try:
+        await stream.aclose()
+    except Exception:
+        pass
+
+
+class AsyncLLMClient:
+    """Rate-limited, adaptively concurrent access to a model backend (see backends.ModelBackend).
+
+    Calls are admitted by a requests-per-minute and a tokens-per-minute bucket (either may
+    be None for no limit) and by an AIMD concurrency limit that backs off when the service
+    answers with rate-limit or overload errors or times out. Each attempt has a ``timeout`` (for streams,
+    the longest wait for the next chunk) and the call as a whole an optional ``deadline``;
+    retryable errors (see is_retryable_error) are retried with jittered exponential backoff.
+    With ``hedge`` on, an attempt still running after the ``hedge_quantile`` of recent
+    latencies (or ``hedge_delay`` until enough have been seen) is duplicated, the first
+    response wins and the other is cancelled; at most ``hedge_budget`` of the requests are
+    hedged. All clients run on one background event loop, so the client can be awaited
+    from any event loop and called from plain threads with ``generate_content_sync``.
+    """
+
+    def __init__(self, backend, requests_per_minute=None, tokens_per_minute=None, max_concurrency=8,
+                 min_concurrency=1, initial_concurrency=None, max_retries=5, backoff=1.0,
+                 expected_output_tokens=1024, timeout=DEFAULT_TIMEOUT, deadline=None, hedge=False,
+                 hedge_delay=None, hedge_quantile=HEDGE_QUANTILE, hedge_budget=HEDGE_BUDGET):
+        self.backend = backend
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.initial_concurrency = initial_concurrency or max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.expected_output_tokens = expected_output_tokens
+        self.timeout = timeout
+        self.deadline = deadline
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.hedge_quantile = hedge_quantile
+        self.hedge_budget = hedge_budget
+        self.stats = {"requests": 0, "succeeded": 0, "failed": 0, "rate_limited": 0, "retries": 0,
+                      "timeouts": 0, "hedges": 0, "hedge_wins": 0,
+                      "prompt_tokens": 0, "cached_tokens": 0, "output_tokens": 0}
+        self._limits = []
+        self._latencies = {}
+
+    def _ensure_limits(self):
+        # asyncio primitives are created on the background loop that uses them. The list is
+        # shared with the clients returned by with_backend.
+        if not self._limits:
+            self._limits.append((
+                TokenBucket(self.requests_per_minute) if self.requests_per_minute else None,
+                TokenBucket(self.tokens_per_minute) if self.tokens_per_minute else None,
+                AdaptiveConcurrency(self.initial_concurrency, self.min_concurrency, self.max_concurrency),
+            ))
+        return self._limits[0]
+
+    @property
+    def concurrency_limit(self):
+        return int(self._limits[0][2].limit) if self._limits else self.initial_concurrency
+
+    def with_backend(self, backend):
+        """A client for ``backend`` (e.g. one with a system instruction) sharing this client's limits and stats."""
+        client = copy.copy(self)
+        client.backend = backend
+        return client
+
+    def hedge_delay_for(self, kind):
+        """Seconds to wait for a ``kind`` of call ("generate" or "stream") before hedging it, or None."""
+        if not self.hedge:
+            return None
+        samples = self._latencies.get(kind)
+        if samples and len(samples) >= HEDGE_MIN_SAMPLES:
+            return percentile(samples, self.hedge_quantile)
+        return self.hedge_delay
+
+    def _count(self, name, call_stats=None):
+        self.stats[name] += 1
+        if call_stats is not None:
+            call_stats[name] = call_stats.get(name, 0) + 1
+
+    def _record_latency(self, kind, seconds):
+        samples = self._latencies.get(kind)
+        if samples is None:
+            samples = self._latencies[kind] = collections.deque(maxlen=LATENCY_SAMPLES)
+        samples.append(seconds)
+
+    def _record_usage(self, usage, usage_sink=None):
+        if usage is None:
+            return
+        if usage_sink is not None:
+            usage_sink.append(usage)
+        self.stats["prompt_tokens"] += getattr(usage, 'prompt_token_count', 0) or 0
+        self.stats["cached_tokens"] += getattr(usage, 'cached_content_token_count', 0) or 0
+        self.stats["output_tokens"] += getattr(usage, 'candidates_token_count', 0) or 0
+
+    async def generate_content(self, contents, usage=None, call_stats=None, **kwargs):
+        """Async ``backend.generate(contents)`` subject to the quota and concurrency limits.
+
+        When ``usage`` is a list, the response's usage metadata is appended to it. When
+        ``call_stats`` is a dict, the call's "retries", "timeouts" and "hedges" are counted in it.
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self._generate(contents, kwargs, usage_sink=usage, call_stats=call_stats), background_loop())
+        return await asyncio.wrap_future(future)
+
+    def generate_content_sync(self, contents, usage=None, call_stats=None, **kwargs):
+        """Blocking ``backend.generate(contents)`` for threads without an event loop."""
+        return asyncio.run_coroutine_threadsafe(
+            self._generate(contents, kwargs, usage_sink=usage, call_stats=call_stats), background_loop()).result()
+
+    async def generate_text(self, prompt, usage=None, call_stats=None, **kwargs):
+        return response_text(await self.generate_content([prompt], usage, call_stats, **kwargs))
+
+    def generate_text_sync(self, prompt, usage=None, call_stats=None, **kwargs):
+        return response_text(self.generate_content_sync([prompt], usage, call_stats, **kwargs))
+
+    def stream_text_sync(self, prompt, usage=None, call_stats=None, **kwargs):
+        """Yield response text chunks as the model streams them, for threads without an event loop.
+
+        Errors are retried, and the first chunk hedged, only until the first chunk has
+        arrived. When ``usage`` is a list, the final usage metadata is appended to it once the
+        stream has ended; ``call_stats`` is as for generate_content. Closing the generator
+        early (a Streamlit rerun, ``close()``) cancels the model call and frees its slot.
+        """
+        chunks = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(self._stream([prompt], kwargs, chunks.put, usage, call_stats),
+                                                  background_loop())
+        future.add_done_callback(lambda _: chunks.put(_STREAM_END))
+        ended = False
+        try:
+            while True:
+                chunk = chunks.get()
+                if chunk is _STREAM_END:
+                    ended = True
+                    break
+                yield chunk
+        finally:
+            if not ended:
+                future.cancel()
+        future.result()
+
+    async def _stream(self, contents, kwargs, sink, usage_sink=None, call_stats=None):
+        received = []
+        usage = []
+
+        def forward(response_chunk):
+            # Streamed chunks carry the running usage; the last one has the totals.
+            chunk_usage = getattr(response_chunk, 'usage_metadata', None)
+            if chunk_usage is not None:
+                usage[:] = [chunk_usage]
+            text = response_chunk.text
+            if text:
+                received.append(text)
+                sink(text)
+
+        async def open_stream(contents, kwargs):
+            # The stream and its first chunk (None for an empty stream), so hedged streams race on the first chunk.
+            stream = self.backend.stream_async(contents, **kwargs)
+            try:
+                return await stream.__anext__(), stream
+            except StopAsyncIteration:
+                return None, stream
+            except BaseException:
+                await _aclose(stream)
+                raise
+
+        async def call(contents, kwargs, attempt):
+            first, stream = await self._hedged("stream", lambda: open_stream(contents, kwargs), attempt,
+                                               discard=lambda opened: _aclose(opened[1]))
+            try:
+                if first is not None:
+                    forward(first)
+                    while True:
+                        try:
+                            response_chunk = await _within(stream.__anext__(), attempt.timeout)
+                        except StopAsyncIteration:
+                            break
+                        forward(response_chunk)
+            finally:
+                await _aclose(stream)
+            return None
+
+        await self._generate(contents, kwargs, call=call, retryable=lambda: not received, call_stats=call_stats)
+        self._record_usage(usage[0] if usage else None, usage_sink)
+
+    async def _generate(self, contents, kwargs, call=None, retryable=None, usage_sink=None, call_stats=None):
+        requests, tokens, concurrency = self._ensure_limits()
+        prompt_text = " ".join(part for part in contents if isinstance(part, str))
+        estimated_tokens = estimate_tokens(prompt_text) + self.expected_output_tokens
+        self.stats["requests"] += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline if self.deadline else None
+
+        async def admit():
+            if requests:
+                await requests.acquire(1)
+            if tokens:
+                await tokens.acquire(estimated_tokens)
+
+        for attempt in range(self.max_retries + 1):
+            timeout = self.timeout
+            if deadline is not None:
+                remaining = deadline - loop.time()
+                timeout = remaining if timeout is None else min(timeout, remaining)
+            await concurrency.acquire()
+            succeeded = overloaded = False
+            try:
+                await admit()
+                limits = _Attempt(self, timeout, admit, concurrency, call_stats)
+                response = await (call or self._call)(contents, kwargs, limits)
+            except Exception as e:
+                rate_limited = is_rate_limit_error(e)
+                timed_out = isinstance(e, (TimeoutError, asyncio.TimeoutError))
+                # A slow service is as saturated as one answering 429, so both shrink the limit.
+                overloaded = rate_limited or timed_out
+                if timed_out:
+                    self._count("timeouts", call_stats)
+                delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.0)
+                if (not is_retryable_error(e) or attempt == self.max_retries or (retryable and not retryable())
+                        or (deadline is not None and loop.time() + delay >= deadline)):
+                    self.stats["failed"] += 1
+                    raise
+                if rate_limited:
+                    self.stats["rate_limited"] += 1
+                self._count("retries", call_stats)
+            else:
+                succeeded = True
+                usage = getattr(response, 'usage_metadata', None)
+                if tokens:
+                    actual_tokens = getattr(usage, 'total_token_count', None)
+                    if actual_tokens:
+                        tokens.adjust(actual_tokens - estimated_tokens)
+                self._record_usage(usage, usage_sink)
+                self.stats["succeeded"] += 1
+                return response
+            finally:
+                await concurrency.release(succeeded=succeeded, overloaded=overloaded)
+            await asyncio.sleep(delay)
+
+    async def _call(self, contents, kwargs, attempt):
+        return await self._hedged("generate", lambda: self.backend.generate_async(contents, **kwargs), attempt)
+
+    async def _hedged(self, kind, start, attempt, discard=None):
+        """Await ``start()`` within the attempt's timeout, sending a duplicate if it is slow to answer.
+
+        The duplicate is only sent if a concurrency slot is free, holds that slot until it
+        ends, is admitted by the same quotas as any request and gets the rest of the
+        attempt's timeout. The first to succeed wins; the other is cancelled, and passed to
+        ``discard`` if it succeeded too. If both fail, the first error is raised.
+        """
+        async def timed(timeout):
+            began = time.monotonic()
+            try:
+                result = await _within(start(), timeout)
+            except asyncio.CancelledError:
+                # A cancelled loser took at least this long; leaving it out would pull the quantile down.
+                self._record_latency(kind, time.monotonic() - began)
+                raise
+            self._record_latency(kind, time.monotonic() - began)
+            return result
+
+        async def hedge(timeout):
+            try:
+                return await timed(timeout)
+            finally:
+                await attempt.concurrency.release()
+
+        began = time.monotonic()
+        tasks = [asyncio.ensure_future(timed(attempt.timeout))]
+        winner = None
+        try:
+            delay = self.hedge_delay_for(kind)
+            if (delay is not None and (attempt.timeout is None or delay < attempt.timeout)
+                    and self.stats["hedges"] < self.hedge_budget * self.stats["requests"]):
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and attempt.concurrency.try_acquire():
+                    try:
+                        await attempt.admit()
+                    except BaseException:
+                        await attempt.concurrency.release()
+                        raise
+                    attempt.count("hedges")
+                    remaining = None if attempt.timeout is None else attempt.timeout - (time.monotonic() - began)
+                    tasks.append(asyncio.ensure_future(hedge(remaining)))
+            pending = set(tasks)
+            while winner is None and pending:
+                _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in tasks if task.done() and not task.cancelled()
+                               and task.exception() is None), None)
+        finally:
+            for task in tasks:
+                if task is not winner:
+                    task.cancel()
+            for task in tasks:
+                if task is not winner:
+                    try:
+                        result = await task
+                    except (asyncio.CancelledError, Exception):
+                        continue
+                    if discard is not None:
+                        await discard(result)
+        if winner is None:
+            raise tasks[0].exception()
+        if winner is not tasks[0]:
+            self.stats["hedge_wins"] += 1
+        return winner.result()
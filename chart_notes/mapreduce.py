@@ -0,0 +1,97 @@
+"""Chunked (map-reduce) chart note generation for transcripts that exceed the model context."""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .citations import CitationRegistry, renumber_citations
+from .prompts import chart_notes_prompt, merge_chart_notes_prompt, partial_chart_notes_prompt
+from .transcript import Transcript
+
+# Input token limits of the models the apps use; others get DEFAULT_CONTEXT_TOKENS.
+CONTEXT_TOKENS = {
+    "gemini-1.5-flash": 1048576,
+    "gemini-1.5-pro": 2097152,
+}
+DEFAULT_CONTEXT_TOKENS = 1048576
+# Characters per token, as llm.estimate_tokens counts them.
+CHARS_PER_TOKEN = 4
+# Share of the context a transcript may fill before it is generated in chunks; the rest is
+# left for the template, the instructions and a margin for the token estimate.
+TRANSCRIPT_CONTEXT_SHARE = 0.5
+DEFAULT_OVERLAP_TURNS = 2
+DEFAULT_MAX_WORKERS = 4
+
+
+def context_tokens(model_name):
+    """Input token limit of ``model_name`` (with or without the "models/" prefix)."""
+    name = model_name[len("models/"):] if model_name.startswith("models/") else model_name
+    return CONTEXT_TOKENS.get(name, DEFAULT_CONTEXT_TOKENS)
+
+
+def long_transcript_chars(tokens):
+    """Transcript length in characters above which a model with ``tokens`` of context gets map-reduce mode."""
+    return int(tokens * TRANSCRIPT_CONTEXT_SHARE * CHARS_PER_TOKEN)
+
+
+DEFAULT_LONG_TRANSCRIPT_CHARS = long_transcript_chars(DEFAULT_CONTEXT_TOKENS)
+DEFAULT_WINDOW_CHARS = DEFAULT_LONG_TRANSCRIPT_CHARS // 2
+
+
+def split_windows(transcript, max_chars=DEFAULT_WINDOW_CHARS, overlap_turns=DEFAULT_OVERLAP_TURNS):
+    """Split a transcript at speaker-turn boundaries into overlapping (start, end) character windows.
+
+    ``transcript`` is a Transcript or plain text. Each window holds as many whole turns as
+    fit in ``max_chars`` and repeats the last ``overlap_turns`` turns of the previous
+    window. A single turn longer than ``max_chars`` is split at whitespace.
+    """
+    if isinstance(transcript, str):
+        transcript = Transcript.from_text(transcript)
+    text = transcript.text
+
+    units = []
+    for start, end in zip(transcript.starts, transcript.ends):
+        while end - start > max_chars:
+            cut = text.rfind(' ', start + 1, start + max_chars)
+            if cut == -1:
+                cut = start + max_chars
+            units.append((start, cut))
+            start = cut + 1 if text[cut:cut + 1] == ' ' else cut
+        if end > start:
+            units.append((start, end))
+
+    windows = []
+    first = 0
+    while first < len(units):
+        last = first
+        while last + 1 < len(units) and units[last + 1][1] - units[first][0] <= max_chars:
+            last += 1
+        windows.append((units[first][0], units[last][1]))
+        if last + 1 >= len(units):
+            break
+        first = max(last + 1 - overlap_turns, first + 1)
+    return windows
+
+
+def generate_chart_notes_map_reduce(transcript, template, generate, max_chars=DEFAULT_WINDOW_CHARS,
+                                    overlap_turns=DEFAULT_OVERLAP_TURNS, max_workers=DEFAULT_MAX_WORKERS):
+    """Generate chart notes window by window, then merge them into one note following the template.
+
+    ``generate`` sends one prompt to the model and returns its text. Partial notes are
+    generated concurrently; their citations are renumbered globally before the merge and
+    once more afterwards, so the final note numbers citations in order of first appearance.
+    """
+    windows = split_windows(transcript, max_chars=max_chars, overlap_turns=overlap_turns)
+    text = transcript if isinstance(transcript, str) else transcript.text
+    if len(windows) <= 1:
+        return generate(chart_notes_prompt(text, template))
+
+    prompts = [
+        partial_chart_notes_prompt(text[start:end], template, i, len(windows))
+        for i, (start, end) in enumerate(windows, start=1)
+    ]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        partial_notes = list(executor.map(generate, prompts))
+
+    registry = CitationRegistry()
+    partial_notes = [renumber_citations(notes, registry) for notes in partial_notes]
+    merged = generate(merge_chart_notes_prompt(partial_notes, template))
+    return renumber_citations(merged)
@@ -0,0 +1,300 @@
+"""Per-stage spans for the chart note pipeline, exported as JSON lines and Prometheus text.
+
+Each stage (upload decode, transcript extraction, prompt build, model call, citation
+parsing, highlighting, rendering) is timed as a Span carrying the token counts, model call
+retries, hedges and timeouts, template id and transcript size that explain its duration.
+StageMetrics appends every span to a JSON-lines file and aggregates them into Prometheus
+histograms and counters, which can be written to a file (for the node exporter's textfile
+collector) or served from a local ``/metrics`` endpoint.
+"""
+
+import collections
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+STAGES = ('upload_decode', 'extract', 'prompt_build', 'model_call', 'citation_parse', 'highlight', 'render')
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+TOKEN_ATTRIBUTES = ('prompt_tokens', 'cached_tokens', 'response_tokens')
+# Span attribute -> event label of the call-stats counted by llm.AsyncLLMClient
+CALL_EVENT_ATTRIBUTES = {'retries': 'retry', 'hedges': 'hedge', 'timeouts': 'timeout'}
+METRIC_PREFIX = "chart_notes"
+RECENT_SPANS = 1000
+PROMETHEUS_WRITE_SECONDS = 1.0
+
+
+def new_trace_id():
+    """Identifier shared by the spans of one transcript's pass through the pipeline."""
+    return uuid.uuid4().hex[:16]
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a collection of numbers, or None when it is empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    # The epsilon keeps products such as 0.95 * 20 from rounding up past their rank.
+    return ordered[max(0, math.ceil(fraction * len(ordered) - 1e-9) - 1)]
+
+
+def usage_tokens(usages):
+    """{prompt_tokens, cached_tokens, response_tokens} summed over usage_metadata objects."""
+    totals = dict.fromkeys(TOKEN_ATTRIBUTES, 0)
+    for usage in usages:
+        if usage is None:
+            continue
+        totals["prompt_tokens"] += getattr(usage, 'prompt_token_count', 0) or 0
+        totals["cached_tokens"] += getattr(usage, 'cached_content_token_count', 0) or 0
+        totals["response_tokens"] += getattr(usage, 'candidates_token_count', 0) or 0
+    return totals
+
+
+class Span:
+    """One timed stage. ``attributes`` holds the token counts, template id, transcript size and so on."""
+
+    __slots__ = ('name', 'trace_id', 'start', 'started', 'duration', 'attributes', 'error')
+
+    def __init__(self, name, trace_id=None, **attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.start = time.time()
+        self.started = time.perf_counter()
+        self.duration = None
+        self.attributes = {}
+        self.error = None
+        self.set(**attributes)
+
+    def set(self, **attributes):
+        """Add attributes; None values are ignored."""
+        self.attributes.update((key, value) for key, value in attributes.items() if value is not None)
+
+    def first_token(self):
+        """Mark the arrival of the first response chunk (time_to_first_token), once."""
+        if "time_to_first_token" not in self.attributes:
+            self.attributes["time_to_first_token"] = time.perf_counter() - self.started
+
+    def finish(self):
+        if self.duration is None:
+            self.duration = time.perf_counter() - self.started
+
+    def as_dict(self):
+        return {
+            "stage": self.name,
+            "trace_id": self.trace_id,
+            "start": round(self.start, 6),
+            "duration": self.duration,
+            "error": self.error,
+            **self.attributes,
+        }
+
+    def __repr__(self):
+        return f"Span({self.name!r}, duration={self.duration!r}, {self.attributes!r})"
+
+
+class _Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, buckets, value):
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return ",".join(f'{key}="{_label_value(value)}"' for key, value in labels.items())
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class StageMetrics:
+    """Collects finished spans and aggregates them per (stage, template id).
+
+    ``jsonl_path`` receives one JSON line per span and ``prometheus_path`` is rewritten
+    with the current aggregates at most every ``prometheus_interval`` seconds (call
+    ``flush`` for a final write). The most recent spans are kept in ``recent``. One
+    instance is meant to be shared by the whole process.
+    """
+
+    def __init__(self, jsonl_path=None, prometheus_path=None, buckets=LATENCY_BUCKETS, recent=RECENT_SPANS,
+                 prometheus_interval=PROMETHEUS_WRITE_SECONDS):
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.prometheus_interval = prometheus_interval
+        self.buckets = tuple(buckets)
+        self.recent = collections.deque(maxlen=recent)
+        self._durations = {}
+        self._first_tokens = {}
+        self._errors = collections.Counter()
+        self._tokens = collections.Counter()
+        self._call_events = collections.Counter()
+        self._transcript_chars = collections.Counter()
+        self._lock = threading.Lock()
+        # File writes happen under their own lock, so workers recording spans never wait on disk I/O
+        # while holding the aggregates.
+        self._write_lock = threading.Lock()
+        self._version = 0
+        self._written_version = 0
+        self._prometheus_due = 0.0
+        self._server = None
+
+    @contextmanager
+    def span(self, name, trace_id=None, **attributes):
+        """Time the enclosed block as stage ``name``; the yielded Span takes attributes as they become known.
+
+        An exception inside the block is recorded on the span (``error``) and re-raised.
+        """
+        span = Span(name, trace_id, **attributes)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            span.finish()
+            self.record(span)
+
+    def record(self, span):
+        span.finish()
+        key = (span.name, span.attributes.get("template_id", ""))
+        with self._lock:
+            self.recent.append(span)
+            self._durations.setdefault(key, _Histogram(self.buckets)).observe(self.buckets, span.duration)
+            first_token = span.attributes.get("time_to_first_token")
+            if first_token is not None:
+                self._first_tokens.setdefault(key, _Histogram(self.buckets)).observe(self.buckets, first_token)
+            if span.error:
+                self._errors[key] += 1
+            for attribute in TOKEN_ATTRIBUTES:
+                if span.attributes.get(attribute):
+                    self._tokens[key + (attribute[:-len("_tokens")],)] += span.attributes[attribute]
+            for attribute, event in CALL_EVENT_ATTRIBUTES.items():
+                if span.attributes.get(attribute):
+                    self._call_events[key + (event,)] += span.attributes[attribute]
+            if span.attributes.get("transcript_chars"):
+                self._transcript_chars[key] += span.attributes["transcript_chars"]
+            self._version += 1
+            prometheus = None
+            if self.prometheus_path and time.monotonic() >= self._prometheus_due:
+                self._prometheus_due = time.monotonic() + self.prometheus_interval
+                prometheus = (self._version, self._prometheus_text())
+        if self.jsonl_path:
+            line = json.dumps(span.as_dict(), ensure_ascii=False) + "\n"
+            with self._write_lock, open(self.jsonl_path, 'a', encoding='utf-8') as jsonl_file:
+                jsonl_file.write(line)
+        if prometheus:
+            self._write_prometheus(self.prometheus_path, *prometheus)
+
+    def flush(self):
+        """Write ``prometheus_path`` now if spans were recorded since its last write."""
+        if self.prometheus_path:
+            self.write_prometheus(self.prometheus_path)
+
+    def recent_jsonl(self):
+        """The retained spans as JSON lines."""
+        with self._lock:
+            spans = list(self.recent)
+        return "".join(json.dumps(span.as_dict(), ensure_ascii=False) + "\n" for span in spans)
+
+    def prometheus_text(self):
+        """The aggregates in the Prometheus text exposition format."""
+        with self._lock:
+            return self._prometheus_text()
+
+    def _prometheus_text(self):
+        lines = []
+
+        def histogram(name, help_text, histograms):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for (stage, template_id), observed in sorted(histograms.items()):
+                labels = _labels(stage=stage, template_id=template_id)
+                for bound, count in zip(self.buckets, observed.counts):
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {observed.count}')
+                lines.append(f"{name}_sum{{{labels}}} {_number(observed.sum)}")
+                lines.append(f"{name}_count{{{labels}}} {observed.count}")
+
+        def counter(name, help_text, counts, label_names=('stage', 'template_id')):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in sorted(counts.items()):
+                lines.append(f"{name}{{{_labels(**dict(zip(label_names, key)))}}} {_number(value)}")
+
+        histogram(f"{METRIC_PREFIX}_stage_duration_seconds", "Time spent in each pipeline stage.", self._durations)
+        histogram(f"{METRIC_PREFIX}_time_to_first_token_seconds", "Time until the first streamed model chunk.",
+                  self._first_tokens)
+        counter(f"{METRIC_PREFIX}_stage_errors_total", "Stages that ended with an exception.", self._errors)
+        counter(f"{METRIC_PREFIX}_tokens_total", "Model tokens by kind (prompt, cached, response).", self._tokens,
+                ('stage', 'template_id', 'kind'))
+        counter(f"{METRIC_PREFIX}_model_call_events_total", "Model call retries, hedged requests and timeouts.",
+                self._call_events, ('stage', 'template_id', 'event'))
+        counter(f"{METRIC_PREFIX}_transcript_chars_total", "Transcript characters processed per stage.",
+                self._transcript_chars)
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        with self._lock:
+            version, text = self._version, self._prometheus_text()
+        self._write_prometheus(path, version, text)
+
+    def _write_prometheus(self, path, version, text):
+        with self._write_lock:
+            # A slower writer holding older aggregates must not replace a newer file.
+            if path == self.prometheus_path:
+                if version <= self._written_version and os.path.exists(path):
+                    return
+                self._written_version = version
+            # Written to a temporary file and renamed, so scrapers never read a partial file.
+            temporary = f"{path}.tmp"
+            with open(temporary, 'w', encoding='utf-8') as prometheus_file:
+                prometheus_file.write(text)
+            os.replace(temporary, path)
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serve ``/metrics`` (Prometheus text) and ``/spans`` (recent spans as JSON lines) from a daemon thread."""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        if self._server is not None:
+            return self._server
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                if path == "/metrics":
+                    body, content_type = metrics.prometheus_text(), "text/plain; version=0.0.4; charset=utf-8"
+                elif path == "/spans":
+                    body, content_type = metrics.recent_jsonl(), "application/x-ndjson"
+                else:
+                    self.send_error(404)
+                    return
+                payload = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="chart-notes-metrics", daemon=True).start()
+        return self._server
@@ -0,0 +1,181 @@
+"""The chart note pipeline stages, without Streamlit.
+
+The apps, batch workers and services run the same stages: prepare an upload, generate
+the chart notes (streamed, or in map-reduce mode for long transcripts), parse the notes
+and their citations, and resolve the citations to transcript spans. Each stage records a
+span in the resources' StageMetrics under the caller's trace id. Progress is reported
+through optional callbacks, so a UI can show the notes while they stream in, and errors
+are raised for the caller to present.
+"""
+
+from .citations import (
+    citations_from_note_citations,
+    extract_note_citations,
+    iter_note_citations,
+    json_generation_config,
+    parse_stats,
+)
+from .index import resolve_citations
+from .llm import response_text
+from .mapreduce import generate_chart_notes_map_reduce
+from .metrics import usage_tokens
+from .prefix_cache import template_version
+from .prompts import (
+    DEFAULT_CITATION_VARIANT,
+    chart_notes_system_instruction,
+    chart_notes_user_prompt,
+    citation_structuring_prompt,
+)
+from .streaming import StreamTimings, render_stream
+from .transcript import Transcript
+
+GENERATION_CONFIG = {
+    "temperature": 0,
+    "top_p": 1.0,
+    "top_k": 34,
+    "max_output_tokens": 8192,
+    "response_mime_type": "text/plain",
+}
+
+
+def _ignore(*args):
+    pass
+
+
+def _marking_first_token(chunks, span):
+    """Yield ``chunks``, marking the span's time to first token when the first one arrives."""
+    for chunk in chunks:
+        span.first_token()
+        yield chunk
+
+
+class ChartNotesPipeline:
+    """The pipeline stages over one PipelineResources (backend, client, caches and metrics).
+
+    ``citation_variant`` names the citation-structuring prompt used when the chart notes
+    cannot be parsed locally (see prompts.CITATION_STRUCTURING_INSTRUCTIONS).
+    """
+
+    def __init__(self, resources, citation_variant=DEFAULT_CITATION_VARIANT):
+        self.resources = resources
+        self.citation_variant = citation_variant
+
+    @property
+    def metrics(self):
+        return self.resources.metrics
+
+    def prepare_upload(self, data, content_type, trace_id=None):
+        """(PreparedTranscript, whether it was cached) for uploaded bytes, parsed and indexed once per distinct upload."""
+        with self.metrics.span("extract", trace_id) as span:
+            prepared, cached = self.resources.uploads.get_or_prepare(data, content_type)
+            span.set(cached=cached, transcript_chars=len(prepared.text), turns=len(prepared.transcript))
+        return prepared, cached
+
+    def generate_text(self, prompt, usage=None, call_stats=None):
+        """Send one prompt to the model and return the text of the first candidate, through the response cache."""
+        resources = self.resources
+        return resources.response_cache.get_or_generate(
+            "generate", [prompt], resources.backend.model_name, resources.generation_config,
+            lambda: response_text(resources.llm_client.generate_content_sync([prompt], usage, call_stats)),
+        )
+
+    def generate_chart_notes(self, transcript, template, trace_id=None, on_text=None):
+        """Chart notes with citations for ``transcript`` (a Transcript or its text), and their StreamTimings.
+
+        The notes are streamed, calling ``on_text(text_so_far)`` as sections complete.
+        Transcripts longer than the resources' long_transcript_chars are generated in
+        map-reduce mode, in windows of window_chars, which calls ``on_text`` once with the
+        merged notes and has no time to first token.
+        """
+        if isinstance(transcript, str):
+            transcript = Transcript.from_text(transcript)
+        text = transcript.text
+        on_text = on_text or _ignore
+        resources = self.resources
+
+        with self.metrics.span("prompt_build", trace_id, transcript_chars=len(text)) as span:
+            system_instruction = chart_notes_system_instruction(template)
+            prompt = chart_notes_user_prompt(text)
+            template_id = template_version(system_instruction)
+            span.set(template_id=template_id, prompt_chars=len(system_instruction) + len(prompt))
+
+        usage = []
+        call_stats = {}
+        if len(text) > resources.long_transcript_chars:
+            timings = StreamTimings()
+            with self.metrics.span("model_call", trace_id, call="chart_notes_map_reduce", template_id=template_id,
+                                   transcript_chars=len(text)) as call_span:
+                chart_notes = generate_chart_notes_map_reduce(
+                    transcript, template, lambda prompt: self.generate_text(prompt, usage, call_stats),
+                    max_chars=resources.window_chars)
+                call_span.set(**usage_tokens(usage), **call_stats)
+            on_text(chart_notes)
+            timings.total = call_span.duration
+            return chart_notes.strip(), timings
+
+        cache_key = resources.response_cache.key("generate", [system_instruction, prompt], resources.backend.model_name,
+                                                 resources.generation_config)
+        chunks = resources.response_cache.iter_cached(
+            cache_key,
+            lambda: resources.llm_client.with_backend(resources.template_prefixes.backend_for(system_instruction))
+            .stream_text_sync(prompt, usage=usage, call_stats=call_stats),
+        )
+        with self.metrics.span("model_call", trace_id, call="chart_notes", template_id=template_id,
+                               transcript_chars=len(text)) as call_span:
+            chart_notes, timings = render_stream(_marking_first_token(chunks, call_span), on_text)
+            call_span.set(**usage_tokens(usage), **call_stats)
+        return chart_notes.strip(), timings
+
+    def parse_citations(self, chart_notes, trace_id=None, on_note=None, errors=None, fallback=True):
+        """(notes, citations_dict) parsed locally, falling back to the citation-structuring model call.
+
+        ``on_note`` and ``errors`` are passed to structure_citations when the fallback runs.
+        With ``fallback`` false no model call is made, and chart notes without usable
+        citations give ([], {}).
+        """
+        with self.metrics.span("citation_parse", trace_id, response_chars=len(chart_notes)) as span:
+            notes, citations_dict = extract_note_citations(chart_notes)
+            if notes or fallback:
+                parse_stats.record(fallback=not notes)
+            if not notes and fallback:
+                notes, citations_dict = self.structure_citations(chart_notes, trace_id, on_note, errors)
+            span.set(notes=len(notes))
+        return notes, citations_dict
+
+    def structure_citations(self, chart_notes, trace_id=None, on_note=None, errors=None):
+        """(notes, citations_dict) restructured by a second model call returning schema-constrained JSON.
+
+        ``on_note(note_citation, count)`` is called as each note of the streamed JSON
+        completes. A malformed response keeps the notes parsed before the error, which is
+        appended to ``errors`` if given, otherwise raised.
+        """
+        resources = self.resources
+        prompt = citation_structuring_prompt(chart_notes, self.citation_variant)
+        generation_config = json_generation_config(resources.generation_config)
+        cache_key = resources.response_cache.key("citations", [prompt], resources.backend.model_name, generation_config)
+        usage = []
+        call_stats = {}
+        chunks = resources.response_cache.iter_cached(
+            cache_key,
+            lambda: resources.llm_client.stream_text_sync(prompt, usage=usage, call_stats=call_stats,
+                                                          generation_config=generation_config),
+        )
+
+        on_note = on_note or _ignore
+        note_citations = []
+        with self.metrics.span("model_call", trace_id, call="citations") as call_span:
+            for note_citation in iter_note_citations(_marking_first_token(chunks, call_span), errors=errors):
+                note_citations.append(note_citation)
+                on_note(note_citation, len(note_citations))
+            call_span.set(notes=len(note_citations), **usage_tokens(usage), **call_stats)
+        return citations_from_note_citations(note_citations)
+
+    def resolve_spans(self, prepared, citations_dict, trace_id=None, all_occurrences=False):
+        """((start, end), score) pairs of each note's citations, found in the PreparedTranscript's index.
+
+        Citations not found verbatim are aligned fuzzily; alignments scoring below the
+        resources' citation_min_score are left out.
+        """
+        with self.metrics.span("highlight", trace_id, transcript_chars=len(prepared.text), notes=len(citations_dict)):
+            return resolve_citations(prepared.index, citations_dict, all_occurrences=all_occurrences,
+                                     aligner=prepared.aligner, min_score=self.resources.citation_min_score)
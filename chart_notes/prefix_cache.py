@@ -0,0 +1,84 @@
+"""Template prefixes sent once per template version, as a system instruction or cached content.
+
+The chart notes prompt starts with the template (template_2 alone is about 200 lines), and
+that prefix is the same for every transcript. Putting it in a system instruction keeps it
+out of each request body. Storing it as cached content on the server means its tokens are
+billed at the cached rate and are not reprocessed on every call.
+"""
+
+import threading
+import time
+
+from .cache import content_hash
+
+DEFAULT_CACHE_TTL = 3600
+
+
+def template_version(system_instruction):
+    """Short content hash identifying one version of a template prefix."""
+    return content_hash("system_instruction", system_instruction)[:16]
+
+
+class TemplatePrefixCache:
+    """Backends carrying a template prefix, created once per template version and shared by all sessions.
+
+    Prefixes are attached with ``backend.with_system_instruction``. With
+    ``use_cached_content``, ``backend.with_cached_content`` is tried first; when it fails
+    (e.g. the prefix is below the backend's minimum cacheable size) the system instruction
+    is used instead. Cached content expires on the server, so those backends are recreated
+    after ``ttl`` seconds.
+    """
+
+    def __init__(self, backend, use_cached_content=False, ttl=DEFAULT_CACHE_TTL):
+        self.backend = backend
+        self.use_cached_content = use_cached_content
+        self.ttl = ttl
+        self.stats = {"created": 0, "reused": 0, "cached_content": 0, "system_instruction": 0, "cache_errors": 0}
+        self._backends = {}
+        # One lock per template version, so a slow create blocks only the sessions waiting for that template.
+        self._creating = {}
+        self._lock = threading.Lock()
+
+    def backend_for(self, system_instruction):
+        version = template_version(system_instruction)
+        backend = self._reuse(version)
+        if backend is not None:
+            return backend
+        with self._lock:
+            creating = self._creating.setdefault(version, threading.Lock())
+        with creating:
+            # Another session may have created it while this one waited.
+            backend = self._reuse(version)
+            if backend is not None:
+                return backend
+            backend, expires = self._create(system_instruction)
+            with self._lock:
+                self._backends[version] = (backend, expires)
+                self.stats["created"] += 1
+            return backend
+
+    def _reuse(self, version):
+        with self._lock:
+            entry = self._backends.get(version)
+            if entry is not None and (entry[1] is None or time.monotonic() < entry[1]):
+                self.stats["reused"] += 1
+                return entry[0]
+        return None
+
+    def _create(self, system_instruction):
+        # Called without the cache lock held: with_cached_content makes a network call.
+        if self.use_cached_content:
+            try:
+                backend = self.backend.with_cached_content(system_instruction, self.ttl)
+            except Exception:
+                self._count("cache_errors")
+            else:
+                self._count("cached_content")
+                # Recreate a little before the server drops the cached content.
+                return backend, time.monotonic() + self.ttl * 0.9
+        self._count("system_instruction")
+        return self.backend.with_system_instruction(system_instruction), None
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
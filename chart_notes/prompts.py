@@ -0,0 +1,104 @@
+"""Prompts sent to the model."""
+
+CITATION_RULES = """Include citations for specific information extracted from the transcript, strictly referencing all the exact statements throughout the transcript. The citations must follow these rules:
+    1. Number the references sequentially in the order they first appear in the text.
+    2. Use a unique citation number for each unique statement. If the same statement is cited again, use the existing citation number.
+    3. Format citations as: {References: [1]: "citation text", [2]: "citation text"}."""
+
+
+def chart_notes_prompt(transcript, template):
+    """Prompt for chart notes with citations over a whole transcript, with the template inline.
+
+    The same wording as the system instruction and user prompt below, so the transcript
+    always follows a ``Transcript:`` label.
+    """
+    return f"""{chart_notes_system_instruction(template)}
+
+{chart_notes_user_prompt(transcript)}"""
+
+
+def partial_chart_notes_prompt(transcript_part, template, part_number, part_count):
+    """Prompt for the notes covering one window of a transcript that is too long for one call."""
+    return f"""The following is part {part_number} of {part_count} of one encounter transcript. Consecutive parts overlap by a few speaker turns.
+    Create partial chart notes as per the {template} using only the information in this part: {transcript_part}
+    Leave out sections of the template for which this part has no information. {CITATION_RULES}"""
+
+
+def merge_chart_notes_prompt(partial_notes, template):
+    """Prompt that merges partial chart notes into one note following the template."""
+    parts = "\n\n".join(f"Partial chart notes {i}:\n{notes}" for i, notes in enumerate(partial_notes, start=1))
+    return f"""Merge the partial chart notes below, written from consecutive overlapping parts of one encounter transcript, into a single chart note that follows the {template}.
+    1. Combine the information for the same section of the template into that section, in the order of the template.
+    2. Remove information duplicated by the overlap between parts.
+    3. Keep every {{References: ...}} block exactly as written, including its citation numbers and citation text. Do not add new citations.
+
+    {parts}"""
+
+
+def chart_notes_system_instruction(template):
+    """The template and citation rules as a prefix that is sent (or cached) once per template version."""
+    return f"""Create chart notes as per the following template for the transcript you are given. {CITATION_RULES}
+
+Template:
+{template}"""
+
+
+def chart_notes_user_prompt(transcript):
+    """The per-request part of the chart notes prompt when the template is in the system instruction."""
+    return f"""Transcript: {transcript}"""
+
+
+# Instructions of the citation-structuring prompt, by variant. "validated" checks each
+# reference against its note and drops single-word references; "concise" and "plain" are
+# the shorter instruction sets the stable apps used.
+CITATION_STRUCTURING_INSTRUCTIONS = {
+    "validated": (
+        "Avoid Notes without reference and single word reference.",
+        "Each note is permitted to have a maximum of 5 key (critical) references.",
+        "Strictly Eliminate STOP WORDS and CONJUCTIONS",
+        "Remove filler words like 'so','um', 'yeah', 'okay','well','thank you', 'hello','just','you know'etc, "
+        "as they are not necessary.",
+        "Repeat this for all the subheadings.",
+    ),
+    "concise": (
+        "Avoid Notes without reference.",
+        "Each note is permitted to have a maximum of 5 key (critical) references.",
+        "Strictly Eliminate stop words and filler words like 'um', 'yeah', 'okay','well','thank you', 'hello',"
+        "'just','you know' etc.",
+        "Repeat this for all the subheadings.",
+    ),
+    "plain": (
+        "Avoid Notes without reference.",
+        "Each note is permitted to have a maximum of 5 key (critical) references.",
+        "Strictly Eliminate stop words and conjunctions",
+        "Do not refer any filler words like 'so','um', 'yeah', 'okay','well','thank you', 'hello','just','you know'etc.",
+        "Repeat this for all the subheadings.",
+    ),
+}
+DEFAULT_CITATION_VARIANT = "validated"
+CITATION_OUTPUT_FORMAT = """[
+      {
+        "note": "note text",
+        "Reference": [
+          "reference text 1",
+          "reference text 2",
+          "reference text 3",
+          "reference text 4",
+          "reference text 5"
+        ]
+      }]"""
+
+
+def citation_structuring_prompt(chart_notes, variant=DEFAULT_CITATION_VARIANT):
+    """Prompt that restructures chart notes into a JSON list of notes and their references."""
+    validate = "\n    Validate the correctness of the reference with the notes." if variant == "validated" else ""
+    instructions = list(CITATION_STRUCTURING_INSTRUCTIONS[variant])
+    instructions.append(f"Structure the output as:\n    {CITATION_OUTPUT_FORMAT}")
+    numbered = "\n    ".join(f"{number}. {instruction}" for number, instruction in enumerate(instructions, start=1))
+    return f"""In the response {chart_notes}, you'll observe structured content with subheadings, notes, and references.
+    Remove the subheadings, and retain only the important notes and their references.{validate}
+    Ensure you follow the instructions below:
+    {numbered}
+    Response:
+    {chart_notes}
+    """
@@ -0,0 +1,147 @@
+"""Process-wide pipeline resources, each created on first use.
+
+The Streamlit apps re-run their whole script on every interaction, so anything built at
+the top of the script must be cheap to look up again. PipelineResources holds the model
+backend, the rate-limited client, the response cache, the template prefixes, the prepared
+uploads and the stage metrics for the whole process. The apps keep one instance in
+``st.cache_resource``, and each resource is built the first time it is used.
+"""
+
+import threading
+
+from .align import DEFAULT_MIN_SCORE
+from .backends import DEFAULT_MODEL_NAME, make_backend
+from .cache import ResponseCache
+from .llm import DEFAULT_TIMEOUT, AsyncLLMClient
+from .mapreduce import context_tokens, long_transcript_chars
+from .metrics import StageMetrics
+from .prefix_cache import TemplatePrefixCache
+from .uploads import UPLOAD_CACHE_ENTRIES, UploadCache
+
+DEFAULT_RESPONSE_CACHE_DIR = ".cache/responses"
+
+
+class PipelineResources:
+    """Backend, client, caches and metrics configured from a settings mapping (the apps pass ``st.secrets``).
+
+    Settings read: model_backend, api_key, record_cassette, replay_cassette,
+    replay_latency, stub_latency, requests_per_minute, tokens_per_minute,
+    max_concurrency, call_timeout, call_deadline, max_retries, hedge_requests, hedge_delay,
+    response_cache_dir, cache_template_context, upload_cache_entries, citation_min_score,
+    model_context_tokens, long_transcript_chars, window_chars,
+    metrics_jsonl, metrics_prometheus_file and metrics_port. Creation is thread-safe, so sessions
+    starting together share one instance of each resource.
+    """
+
+    def __init__(self, settings=None, generation_config=None, model_name=DEFAULT_MODEL_NAME):
+        self.settings = settings if settings is not None else {}
+        self.generation_config = generation_config or {}
+        self.model_name = model_name
+        self._resources = {}
+        self._lock = threading.RLock()
+
+    def _optional_float(self, name):
+        value = self.settings.get(name)
+        return float(value) if value is not None else None
+
+    def _get(self, name, create):
+        resource = self._resources.get(name)
+        if resource is None:
+            with self._lock:
+                resource = self._resources.get(name)
+                if resource is None:
+                    resource = self._resources[name] = create()
+        return resource
+
+    @property
+    def created(self):
+        """Names of the resources built so far."""
+        return sorted(self._resources)
+
+    @property
+    def backend(self):
+        """The model backend: Gemini or the offline stub, optionally recording to or replaying a cassette."""
+        return self._get("backend", self._create_backend)
+
+    @property
+    def llm_client(self):
+        """One rate-limited client for the process, shared by every session."""
+        return self._get("llm_client", lambda: AsyncLLMClient(
+            self.backend,
+            requests_per_minute=self.settings.get("requests_per_minute"),
+            tokens_per_minute=self.settings.get("tokens_per_minute"),
+            max_concurrency=int(self.settings.get("max_concurrency", 8)),
+            max_retries=int(self.settings.get("max_retries", 5)),
+            timeout=float(self.settings.get("call_timeout", DEFAULT_TIMEOUT)),
+            deadline=self._optional_float("call_deadline"),
+            hedge=bool(self.settings.get("hedge_requests")),
+            hedge_delay=self._optional_float("hedge_delay"),
+        ))
+
+    @property
+    def response_cache(self):
+        """Model responses shared by every session, in memory and on disk."""
+        return self._get("response_cache", lambda: ResponseCache(
+            directory=self.settings.get("response_cache_dir", DEFAULT_RESPONSE_CACHE_DIR)
+        ))
+
+    @property
+    def template_prefixes(self):
+        """Backends carrying a template as their system instruction (or cached content), one per template version."""
+        return self._get("template_prefixes", lambda: TemplatePrefixCache(
+            self.backend, use_cached_content=bool(self.settings.get("cache_template_context"))
+        ))
+
+    @property
+    def uploads(self):
+        """Uploaded transcripts with their indexes, prepared once per distinct file."""
+        return self._get("uploads", lambda: UploadCache(
+            int(self.settings.get("upload_cache_entries", UPLOAD_CACHE_ENTRIES))
+        ))
+
+    @property
+    def context_tokens(self):
+        """Input token limit of the model, looked up by model name unless set."""
+        return int(self.settings.get("model_context_tokens") or context_tokens(self.model_name))
+
+    @property
+    def long_transcript_chars(self):
+        """Transcripts longer than this are generated in map-reduce mode; by default half the model's context."""
+        return int(self.settings.get("long_transcript_chars") or long_transcript_chars(self.context_tokens))
+
+    @property
+    def window_chars(self):
+        """Largest map-reduce window, by default half of long_transcript_chars."""
+        return int(self.settings.get("window_chars") or self.long_transcript_chars // 2)
+
+    @property
+    def citation_min_score(self):
+        """Lowest score of a fuzzily aligned citation that is still highlighted."""
+        min_score = self._optional_float("citation_min_score")
+        return DEFAULT_MIN_SCORE if min_score is None else min_score
+
+    @property
+    def metrics(self):
+        """Stage spans for the process, exported as JSON lines and Prometheus text."""
+        return self._get("metrics", self._create_metrics)
+
+    def _create_backend(self):
+        name = self.settings.get("model_backend", "gemini")
+        return make_backend(
+            name, self.model_name, self.generation_config,
+            api_key=self.settings.get("api_key") if name == "gemini" and not self.settings.get("replay_cassette") else None,
+            record=self.settings.get("record_cassette"),
+            replay=self.settings.get("replay_cassette"),
+            replay_latency=self.settings.get("replay_latency", "original"),
+            latency=self.settings.get("stub_latency", 0.5),
+            chunk_interval=0.02,
+        )
+
+    def _create_metrics(self):
+        metrics = StageMetrics(
+            jsonl_path=self.settings.get("metrics_jsonl"),
+            prometheus_path=self.settings.get("metrics_prometheus_file"),
+        )
+        if self.settings.get("metrics_port"):
+            metrics.serve(int(self.settings["metrics_port"]))
+        return metrics
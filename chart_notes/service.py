@@ -0,0 +1,386 @@
+"""ASGI service that generates chart notes for transcripts submitted over HTTP.
+
+    python -m chart_notes serve --backend stub --port 8000
+
+    curl -X POST --data-binary @transcript.json -H 'Content-Type: application/json' \\
+        'http://127.0.0.1:8000/jobs?template_id=template_1'
+    curl http://127.0.0.1:8000/jobs/<job_id>              # poll the status and chart notes
+    curl -N http://127.0.0.1:8000/jobs/<job_id>/stream    # server-sent events as the notes stream in
+    curl http://127.0.0.1:8000/jobs/<job_id>/citations    # notes, references and transcript spans
+
+A job runs the same ChartNotesPipeline stages as the apps: prepare the upload, generate
+the chart notes, parse their citations and resolve them to transcript spans. At most
+``max_in_flight`` jobs run at once, each on a worker thread; the client's concurrency
+limit bounds the model calls they make. Up to ``queue_size`` more jobs wait in the
+queue, and submissions beyond that are answered with 429 and a Retry-After header.
+Every response carries a Server-Timing header with the time spent handling it and, for
+jobs, the time spent in the queue and in each stage.
+
+The application is plain ASGI with no framework; any ASGI server runs it (the ``serve``
+command uses uvicorn, which is installed separately).
+"""
+
+import asyncio
+import collections
+import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from .metrics import new_trace_id
+from .templates import TEMPLATES_BY_ID
+from .uploads import JSON_CONTENT_TYPE
+
+DEFAULT_MAX_IN_FLIGHT = 4
+DEFAULT_QUEUE_SIZE = 16
+MAX_FINISHED_JOBS = 1000
+MAX_BODY_BYTES = 32 * 1024 * 1024
+RETRY_AFTER_SECONDS = 1
+
+
+class HTTPError(Exception):
+    """An error answered with ``status`` and a JSON body holding ``message``."""
+
+    def __init__(self, status, message, headers=()):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = list(headers)
+
+
+class Job:
+    """One submitted transcript and its progress through the pipeline.
+
+    ``status`` is queued, running, done or failed; ``stage`` the stage being run.
+    ``chart_notes`` grows while the notes stream in. ``timings`` holds the seconds spent
+    in the queue and in each stage.
+    """
+
+    def __init__(self, data, content_type, template_id, template):
+        self.id = uuid.uuid4().hex
+        self.trace_id = new_trace_id()
+        self.data = data
+        self.content_type = content_type
+        self.template_id = template_id
+        self.template = template
+        self.status = "queued"
+        self.stage = None
+        self.error = None
+        self.chart_notes = ""
+        self.prepared = None
+        self.notes = []
+        self.citations_dict = {}
+        self.citation_spans = {}
+        self.timings = {}
+        self.submitted = time.perf_counter()
+        self.changed = asyncio.Event()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    def as_dict(self):
+        result = {
+            "job_id": self.id,
+            "trace_id": self.trace_id,
+            "status": self.status,
+            "stage": self.stage,
+            "template_id": self.template_id,
+            "timings": {name: round(seconds, 6) for name, seconds in self.timings.items()},
+        }
+        if self.status == "done":
+            result["chart_notes"] = self.chart_notes
+            result["notes"] = len(self.notes)
+        if self.error:
+            result["error"] = self.error
+        return result
+
+    def citations(self):
+        """Each note with its references, the (start, end) transcript spans they resolved to and their match scores."""
+        return [
+            {
+                "note": note,
+                "references": self.citations_dict[note],
+                "spans": [[start, end] for (start, end), _ in self.citation_spans.get(note, ())],
+                "scores": [round(score, 3) for _, score in self.citation_spans.get(note, ())],
+            }
+            for note in self.notes
+        ]
+
+
+def server_timing(durations):
+    """Server-Timing header value for {name: seconds}."""
+    return ", ".join(f"{name};dur={seconds * 1e3:.1f}" for name, seconds in durations.items())
+
+
+class ChartNotesService:
+    """The ASGI application over a ChartNotesPipeline.
+
+    Routes: ``POST /jobs?template_id=...`` with the transcript as the body (JSON or plain
+    text, by Content-Type), ``GET /jobs/{id}``, ``GET /jobs/{id}/stream``,
+    ``GET /jobs/{id}/citations``, ``GET /templates``, ``GET /healthz`` and ``GET /metrics``.
+    Finished jobs are kept in memory, up to ``max_finished_jobs`` of them.
+    """
+
+    def __init__(self, pipeline, max_in_flight=DEFAULT_MAX_IN_FLIGHT, queue_size=DEFAULT_QUEUE_SIZE,
+                 max_finished_jobs=MAX_FINISHED_JOBS, max_body_bytes=MAX_BODY_BYTES, templates=None):
+        # asyncio.Queue(0) is unbounded, which would turn off the 429 backpressure.
+        if queue_size < 1:
+            raise ValueError(f"queue_size must be at least 1, not {queue_size}")
+        if max_in_flight < 1:
+            raise ValueError(f"max_in_flight must be at least 1, not {max_in_flight}")
+        self.pipeline = pipeline
+        self.max_in_flight = max_in_flight
+        self.queue_size = queue_size
+        self.max_finished_jobs = max_finished_jobs
+        self.max_body_bytes = max_body_bytes
+        self.templates = templates if templates is not None else TEMPLATES_BY_ID
+        self.jobs = collections.OrderedDict()
+        self._finished = collections.deque()
+        self.stats = {"submitted": 0, "rejected": 0, "done": 0, "failed": 0}
+        self._queue = None
+        self._loop = None
+        self._workers = []
+        self._executor = None
+
+    @property
+    def running(self):
+        return sum(job.status == "running" for job in self.jobs.values())
+
+    @property
+    def queued(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _start(self):
+        # The queue and workers belong to the event loop of the server running the app.
+        if self._queue is None:
+            self._loop = asyncio.get_running_loop()
+            self._queue = asyncio.Queue(self.queue_size)
+            self._executor = ThreadPoolExecutor(self.max_in_flight, thread_name_prefix="chart-notes-job")
+            self._workers = [asyncio.ensure_future(self._work()) for _ in range(self.max_in_flight)]
+
+    async def shutdown(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        # No worker is left to run the jobs still queued; fail them rather than leave them queued.
+        while self._queue is not None and not self._queue.empty():
+            job = self._queue.get_nowait()
+            job.status, job.error = "failed", "CancelledError: the service shut down before the job ran"
+            self._finish(job)
+        self._queue = None
+        self._workers = []
+
+    def submit(self, data, content_type, template_id):
+        """Queue a job for the transcript bytes, or raise HTTPError (400 or 429)."""
+        self._start()
+        template = self.templates.get(template_id)
+        if template is None:
+            raise HTTPError(400, f"unknown template_id {template_id!r}; expected one of {sorted(self.templates)}")
+        if not data:
+            raise HTTPError(400, "the request body must hold the transcript")
+        job = Job(data, content_type, template_id, template)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            raise HTTPError(429, "too many transcripts are queued; retry later",
+                            [(b"retry-after", str(RETRY_AFTER_SECONDS).encode())])
+        self.stats["submitted"] += 1
+        self.jobs[job.id] = job
+        return job
+
+    def _notify(self, job):
+        changed, job.changed = job.changed, asyncio.Event()
+        changed.set()
+
+    def _notify_threadsafe(self, job):
+        # A job still running on the executor when the service shuts down outlives the loop,
+        # which may also close between the check and the call.
+        if not self._loop.is_closed():
+            try:
+                self._loop.call_soon_threadsafe(self._notify, job)
+            except RuntimeError:
+                pass
+
+    def _finish(self, job):
+        job.data = None
+        self.stats[job.status] += 1
+        self._notify(job)
+        self._finished.append(job.id)
+        while len(self._finished) > self.max_finished_jobs:
+            del self.jobs[self._finished.popleft()]
+
+    async def _work(self):
+        while True:
+            job = await self._queue.get()
+            job.timings["queue"] = time.perf_counter() - job.submitted
+            job.status = "running"
+            self._notify(job)
+            try:
+                await self._loop.run_in_executor(self._executor, self._run, job)
+                job.status = "done"
+            except Exception as e:
+                job.status, job.error = "failed", f"{type(e).__name__}: {e}"
+            except asyncio.CancelledError:
+                job.status, job.error = "failed", "CancelledError: the service shut down"
+                raise
+            finally:
+                self._finish(job)
+
+    def _run(self, job):
+        """Run the pipeline stages for ``job`` on a worker thread."""
+        pipeline = self.pipeline
+
+        def timed(name, run):
+            job.stage = name
+            self._notify_threadsafe(job)
+            start = time.perf_counter()
+            result = run()
+            job.timings[name] = time.perf_counter() - start
+            return result
+
+        def on_text(text):
+            job.chart_notes = text
+            self._notify_threadsafe(job)
+
+        job.prepared, _ = timed("extract", lambda: pipeline.prepare_upload(job.data, job.content_type, job.trace_id))
+        job.chart_notes, _ = timed("generate", lambda: pipeline.generate_chart_notes(
+            job.prepared.transcript, job.template, job.trace_id, on_text=on_text))
+        job.notes, job.citations_dict = timed("citations", lambda: pipeline.parse_citations(
+            job.chart_notes, job.trace_id))
+        job.citation_spans = timed("align", lambda: pipeline.resolve_spans(
+            job.prepared, job.citations_dict, job.trace_id))
+        job.stage = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        start = time.perf_counter()
+        method, path = scope["method"], scope["path"].rstrip("/") or "/"
+        try:
+            if path == "/jobs":
+                if method != "POST":
+                    raise HTTPError(405, "use POST to submit a transcript")
+                await self._submit(scope, receive, send, start)
+                return
+            if method != "GET":
+                raise HTTPError(405, f"{method} is not allowed on {path}")
+            if path == "/healthz":
+                body = {"status": "ok", "queued": self.queued, "running": self.running, **self.stats}
+                await self._send_json(send, 200, body, start)
+            elif path == "/templates":
+                await self._send_json(send, 200, {"template_ids": sorted(self.templates)}, start)
+            elif path == "/metrics":
+                await self._send(send, 200, self.pipeline.metrics.prometheus_text().encode("utf-8"),
+                                 b"text/plain; version=0.0.4; charset=utf-8", start)
+            elif path.startswith("/jobs/"):
+                await self._job_route(path[len("/jobs/"):], send, start)
+            else:
+                raise HTTPError(404, f"no route for {path}")
+        except HTTPError as e:
+            await self._send_json(send, e.status, {"error": e.message}, start, headers=e.headers)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self._start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _submit(self, scope, receive, send, start):
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        template_id = query.get("template_id", [""])[0]
+        content_type = b""
+        for name, value in scope.get("headers", ()):
+            if name == b"content-type":
+                content_type = value
+        content_type = content_type.decode("latin-1").split(";", 1)[0].strip().lower()
+        data = await self._read_body(receive)
+        job = self.submit(data, JSON_CONTENT_TYPE if content_type == JSON_CONTENT_TYPE else "text/plain", template_id)
+        await self._send_json(send, 202, job.as_dict(), start, headers=[(b"location", f"/jobs/{job.id}".encode())])
+
+    async def _read_body(self, receive):
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                raise HTTPError(400, "the client disconnected before sending the body")
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > self.max_body_bytes:
+                raise HTTPError(413, f"the transcript is larger than {self.max_body_bytes} bytes")
+            chunks.append(chunk)
+            if not message.get("more_body"):
+                return b"".join(chunks)
+
+    async def _job_route(self, rest, send, start):
+        job_id, _, action = rest.partition("/")
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise HTTPError(404, f"no job {job_id!r}")
+        if action == "":
+            await self._send_json(send, 200, job.as_dict(), start, job=job)
+        elif action == "stream":
+            await self._stream(job, send, start)
+        elif action == "citations":
+            if job.status != "done":
+                # Not ready yet (202) or never will be (409); the body tells which.
+                await self._send_json(send, 409 if job.finished else 202, job.as_dict(), start, job=job)
+                return
+            body = {"job_id": job.id, "transcript_chars": len(job.prepared.text), "notes": job.citations()}
+            await self._send_json(send, 200, body, start, job=job)
+        else:
+            raise HTTPError(404, f"no route for /jobs/{rest}")
+
+    async def _stream(self, job, send, start):
+        """Server-sent events: ``notes`` events carry the new text, a final ``status`` event the job."""
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache"),
+                        (b"server-timing", server_timing({"total": time.perf_counter() - start}).encode())],
+        })
+        sent = 0
+        while True:
+            changed = job.changed
+            text = job.chart_notes
+            if len(text) > sent:
+                await self._send_event(send, "notes", {"text": text[sent:]})
+                sent = len(text)
+            if job.finished:
+                await self._send_event(send, "status", job.as_dict())
+                break
+            await changed.wait()
+        await send({"type": "http.response.body", "body": b""})
+
+    async def _send_event(self, send, event, data):
+        payload = f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+        await send({"type": "http.response.body", "body": payload, "more_body": True})
+
+    async def _send_json(self, send, status, body, start, headers=(), job=None):
+        await self._send(send, status, json.dumps(body, ensure_ascii=False).encode("utf-8"), b"application/json",
+                         start, headers, job)
+
+    async def _send(self, send, status, payload, content_type, start, headers=(), job=None):
+        timings = {"total": time.perf_counter() - start}
+        if job is not None:
+            timings.update((f"job_{name}", seconds) for name, seconds in job.timings.items())
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", content_type), (b"content-length", str(len(payload)).encode()),
+                        (b"server-timing", server_timing(timings).encode()), *headers],
+        })
+        await send({"type": "http.response.body", "body": payload})
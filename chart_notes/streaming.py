@@ -0,0 +1,43 @@
+"""Incremental rendering of streamed model output."""
+
+import time
+
+
+class StreamTimings:
+    """Time to first token and total time of one streamed generation, in seconds."""
+
+    __slots__ = ('start', 'first_token', 'total')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_token = None
+        self.total = None
+
+    def as_dict(self):
+        return {"time_to_first_token": self.first_token, "total_time": self.total}
+
+
+def render_stream(chunks, render, min_interval=0.15, timings=None):
+    """Consume text chunks, calling ``render(text_so_far)`` as sections complete.
+
+    The text is re-rendered when a chunk ends a line (a section or bullet is complete) or
+    at most every ``min_interval`` seconds, and once more at the end. Returns the full text
+    and the StreamTimings, whose clock starts when ``timings`` is created (by default, now).
+    """
+    timings = timings or StreamTimings()
+    received = []
+    last_render = 0.0
+
+    for chunk in chunks:
+        now = time.perf_counter()
+        if timings.first_token is None:
+            timings.first_token = now - timings.start
+        received.append(chunk)
+        if '\n' in chunk or now - last_render >= min_interval:
+            render("".join(received))
+            last_render = now
+
+    text = "".join(received)
+    render(text)
+    timings.total = time.perf_counter() - timings.start
+    return text, timings
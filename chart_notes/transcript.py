@@ -0,0 +1,238 @@
+"""Transcript ingestion and the structured transcript model."""
+
+import math
+import re
+from array import array
+
+from .jsonstream import iter_items
+
+SPEAKER_TURNS_PATH = 'transcripts.item.speakerTurns.item'
+
+# Keys seen for speaker identity and turn start time in transcript JSON exports.
+SPEAKER_KEYS = ('speakerId', 'speakerTag', 'speakerLabel', 'speaker', 'channelTag')
+START_TIME_KEYS = ('startTime', 'startOffset', 'startTimeOffset', 'start')
+
+# "Doctor: ...", "[00:01:23] Patient: ...", "(12:05) Dr. Smith: ..." at the start of a line.
+SPEAKER_LABEL_PATTERN = re.compile(
+    r"^[ \t]*(?:[\[(](?P<time>\d{1,2}:\d{2}(?::\d{2})?(?:\.\d+)?)[\])][ \t]*)?"
+    r"(?P<speaker>[A-Za-z][A-Za-z0-9.'_-]*(?: [A-Za-z0-9.'_-]+){0,2})[ \t]*:[ \t]*",
+    re.MULTILINE,
+)
+
+
+def iter_turns(json_file, chunk_size=65536):
+    """Yield speaker turns one at a time without loading the whole JSON document."""
+    return iter_items(json_file, SPEAKER_TURNS_PATH, chunk_size=chunk_size)
+
+
+def iter_recognized_text(json_file, chunk_size=65536):
+    """Yield the recognizedText of every alternative in every speaker turn."""
+    for turn in iter_turns(json_file, chunk_size=chunk_size):
+        for alt in turn['alternatives']:
+            yield alt['recognizedText']
+
+
+def extract_transcript_text(json_file, chunk_size=65536):
+    """Extract recognizedText from the JSON file, joining all turns once at the end."""
+    return " ".join(iter_recognized_text(json_file, chunk_size=chunk_size)).strip()
+
+
+def parse_seconds(value):
+    """Convert a JSON time value ("12.5s", 12.5, {"seconds": 12, "nanos": 5e8}, "01:02") to seconds.
+
+    A missing or unparsable value, such as "1:xx", is unknown: NaN.
+    """
+    if value is None:
+        return math.nan
+    try:
+        if isinstance(value, (int, float)):
+            return float(value)
+        if isinstance(value, dict):
+            return float(value.get('seconds', 0)) + float(value.get('nanos', 0)) / 1e9
+        value = str(value).strip()
+        if ':' in value:
+            seconds = 0.0
+            for part in value.split(':'):
+                seconds = seconds * 60 + float(part)
+            return seconds
+        return float(value.rstrip('s'))
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class Turn:
+    """A lightweight view of one speaker turn inside a Transcript."""
+
+    __slots__ = ('transcript', 'index')
+
+    def __init__(self, transcript, index):
+        self.transcript = transcript
+        self.index = index
+
+    @property
+    def speaker(self):
+        return self.transcript.speakers[self.transcript.speaker_ids[self.index]]
+
+    @property
+    def start(self):
+        return self.transcript.starts[self.index]
+
+    @property
+    def end(self):
+        return self.transcript.ends[self.index]
+
+    @property
+    def time(self):
+        return self.transcript.times[self.index]
+
+    @property
+    def text(self):
+        return self.transcript.text[self.start:self.end]
+
+    def __repr__(self):
+        return f"Turn({self.index}, {self.speaker!r}, {self.start}:{self.end})"
+
+
+class Transcript:
+    """One shared text buffer plus parallel per-turn arrays.
+
+    Turn ``i`` was spoken by ``speakers[speaker_ids[i]]``, covers ``text[starts[i]:ends[i]]``
+    and started ``times[i]`` seconds into the encounter (NaN when unknown).
+    """
+
+    __slots__ = ('text', 'speakers', 'speaker_ids', 'starts', 'ends', 'times')
+
+    def __init__(self, text, speakers, speaker_ids, starts, ends, times):
+        self.text = text
+        self.speakers = speakers
+        self.speaker_ids = speaker_ids
+        self.starts = starts
+        self.ends = ends
+        self.times = times
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return Turn(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield Turn(self, index)
+
+    def as_dict(self):
+        """The transcript as JSON-serializable lists (unknown times become None)."""
+        return {
+            "text": self.text,
+            "speakers": list(self.speakers),
+            "speaker_ids": list(self.speaker_ids),
+            "starts": list(self.starts),
+            "ends": list(self.ends),
+            "times": [None if math.isnan(time) else time for time in self.times],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a Transcript from ``as_dict`` output."""
+        return cls(
+            data["text"],
+            list(data["speakers"]),
+            array('H', data["speaker_ids"]),
+            array('q', data["starts"]),
+            array('q', data["ends"]),
+            array('d', (math.nan if time is None else time for time in data["times"])),
+        )
+
+    @classmethod
+    def from_json(cls, json_file, chunk_size=65536):
+        """Build a Transcript from the transcripts/speakerTurns/alternatives JSON schema.
+
+        The text buffer is identical to what extract_transcript_text returns.
+        """
+        builder = _Builder()
+        pieces = []
+        offset = 0
+
+        for turn in iter_turns(json_file, chunk_size=chunk_size):
+            speaker = next((turn[key] for key in SPEAKER_KEYS if key in turn), '')
+            start_time = next((turn[key] for key in START_TIME_KEYS if key in turn), None)
+            texts = [alt['recognizedText'] for alt in turn['alternatives']]
+            if not texts:
+                continue
+            if pieces:
+                offset += 1  # the joining space
+            turn_text = " ".join(texts)
+            builder.add(speaker, offset, offset + len(turn_text), start_time)
+            pieces.append(turn_text)
+            offset += len(turn_text)
+
+        text = " ".join(pieces)
+        stripped = text.strip()
+        shift = len(text) - len(text.lstrip())
+        return builder.build(stripped, shift)
+
+    @classmethod
+    def from_text(cls, text):
+        """Build a Transcript from plain text with "Doctor:"/"Patient:" style speaker labels.
+
+        Offsets point into ``text`` unchanged, with labels excluded from the turns. Text
+        before the first label, or a transcript without any labels, becomes a turn with an
+        empty speaker.
+        """
+        builder = _Builder()
+        matches = list(SPEAKER_LABEL_PATTERN.finditer(text))
+
+        if not matches or text[:matches[0].start()].strip():
+            first_label = matches[0].start() if matches else len(text)
+            start, end = _trimmed_span(text, 0, first_label)
+            builder.add('', start, end, None)
+
+        for i, match in enumerate(matches):
+            next_label = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+            start, end = _trimmed_span(text, match.end(), next_label)
+            builder.add(match.group('speaker'), start, end, match.group('time'))
+
+        return builder.build(text, 0)
+
+
+class _Builder:
+    """Accumulates turns into the parallel arrays of a Transcript."""
+
+    def __init__(self):
+        self.speakers = []
+        self.speaker_index = {}
+        self.speaker_ids = array('H')
+        self.starts = array('q')
+        self.ends = array('q')
+        self.times = array('d')
+
+    def add(self, speaker, start, end, start_time):
+        speaker = str(speaker)
+        if speaker not in self.speaker_index:
+            self.speaker_index[speaker] = len(self.speakers)
+            self.speakers.append(speaker)
+        self.speaker_ids.append(self.speaker_index[speaker])
+        self.starts.append(start)
+        self.ends.append(end)
+        self.times.append(parse_seconds(start_time))
+
+    def build(self, text, shift):
+        if shift:
+            self.starts = array('q', (max(start - shift, 0) for start in self.starts))
+            self.ends = array('q', (max(end - shift, 0) for end in self.ends))
+        limit = len(text)
+        if self.ends and self.ends[-1] > limit:
+            self.ends = array('q', (min(end, limit) for end in self.ends))
+        return Transcript(text, self.speakers, self.speaker_ids, self.starts, self.ends, self.times)
+
+
+def _trimmed_span(text, start, end):
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
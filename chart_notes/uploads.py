@@ -0,0 +1,80 @@
+"""Uploaded transcripts, prepared once per distinct file content.
+
+Streamlit re-runs the app script on every interaction with the uploaded file still
+attached. Parsing the upload and building its index and aligner again on each run
+makes every click on a large transcript slow. UploadCache keys the prepared transcript
+by a hash of the uploaded bytes, so only a new file is processed.
+"""
+
+import hashlib
+import io
+
+from .align import CitationAligner
+from .cache import LRUCache, content_hash
+from .highlight import astral_offsets
+from .index import TranscriptIndex
+from .transcript import Transcript
+
+UPLOAD_CACHE_ENTRIES = 8
+JSON_CONTENT_TYPE = "application/json"
+
+
+def upload_hash(data, content_type):
+    """SHA-256 of the uploaded bytes and how they are to be read."""
+    digest = hashlib.sha256(content_type.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(data)
+    return digest.hexdigest()
+
+
+class PreparedTranscript:
+    """An uploaded transcript with everything derived from it.
+
+    ``transcript`` is the structured Transcript, ``text_hash`` the content hash of its
+    text (the key for highlighted renderings), ``index`` its TranscriptIndex (normalized
+    tokens, n-grams and case-folded text), ``aligner`` the CitationAligner over it and
+    ``astral_offsets`` the positions the transcript viewer's UTF-16 offsets shift at.
+    """
+
+    __slots__ = ('upload_hash', 'transcript', 'text_hash', 'index', 'aligner', 'astral_offsets')
+
+    def __init__(self, upload_hash, transcript):
+        self.upload_hash = upload_hash
+        self.transcript = transcript
+        self.text_hash = content_hash(transcript.text)
+        self.index = TranscriptIndex(transcript.text)
+        self.aligner = CitationAligner(self.index)
+        self.astral_offsets = astral_offsets(transcript.text)
+
+    @property
+    def text(self):
+        return self.transcript.text
+
+    @classmethod
+    def from_upload(cls, data, content_type):
+        """Parse JSON uploads (``application/json``) with the streaming extractor and anything else as UTF-8 text."""
+        if content_type == JSON_CONTENT_TYPE:
+            transcript = Transcript.from_json(io.BytesIO(data))
+        else:
+            transcript = Transcript.from_text(data.decode("utf-8"))
+        return cls(upload_hash(data, content_type), transcript)
+
+
+class UploadCache:
+    """The most recently prepared uploads, shared by every session of the process."""
+
+    def __init__(self, max_entries=UPLOAD_CACHE_ENTRIES):
+        self.prepared = LRUCache(max_entries)
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get_or_prepare(self, data, content_type):
+        """(PreparedTranscript, whether it came from the cache) for the uploaded bytes."""
+        key = upload_hash(data, content_type)
+        prepared = self.prepared.get(key)
+        if prepared is not None:
+            self.stats["hits"] += 1
+            return prepared, True
+        self.stats["misses"] += 1
+        prepared = PreparedTranscript.from_upload(data, content_type)
+        self.prepared.put(key, prepared)
+        return prepared, False
@@ -0,0 +1,56 @@
+from chart_notes.align import CitationAligner
+from chart_notes.index import TranscriptIndex, resolve_citations
+
+TRANSCRIPT = """Doctor: So, um, what brings you in today?
+Patient: Yeah, I've had this, you know, sharp pain in my lower back for about three weeks.
+Doctor: Does the pain go down your leg at all?
+Patient: Sometimes it shoots down the left leg when I bend over to pick things up.
+Doctor: Okay. I'd like to get an MRI of the lumbar spine and start physical therapy.
+"""
+
+
+def aligner():
+    return CitationAligner(TranscriptIndex(TRANSCRIPT))
+
+
+def test_verbatim_citation_scores_one():
+    alignment = aligner().align("sharp pain in my lower back")
+    assert alignment.score == 1.0
+    assert TRANSCRIPT[alignment.start:alignment.end] == "sharp pain in my lower back"
+
+
+def test_citation_without_stop_words_aligns_to_the_transcript():
+    alignment = aligner().align("sharp pain lower back three weeks")
+    assert alignment.score == 1.0
+    assert alignment.distance == 0
+    assert TRANSCRIPT[alignment.start:alignment.end] == "sharp pain in my lower back for about three weeks"
+
+
+def test_near_citation_scores_below_one():
+    alignment = aligner().align("shoots down left leg bend pick stuff")
+    assert alignment.distance == 1
+    assert alignment.score == 1 - 1 / 6
+    assert TRANSCRIPT[alignment.start:alignment.end].startswith("shoots down the left leg")
+
+
+def test_unrelated_citation_is_rejected():
+    assert aligner().align("patient denies chest pain shortness breath") is None
+    assert aligner().align("um, yeah, you know") is None
+
+
+def test_resolve_citations_keeps_scores_and_drops_weak_alignments():
+    index = TranscriptIndex(TRANSCRIPT)
+    citations_dict = {
+        "Lower back pain": ["sharp pain in my lower back"],
+        "Radiating pain": ["shoots down left leg bend pick stuff"],
+        "Imaging": ["MRI lumbar spine chest"],
+    }
+    resolved = resolve_citations(index, citations_dict, aligner=CitationAligner(index), min_score=0.8)
+    [(span, score)] = resolved["Lower back pain"]
+    assert TRANSCRIPT[span[0]:span[1]] == "sharp pain in my lower back" and score == 1.0
+    [(span, score)] = resolved["Radiating pain"]
+    assert 0.8 <= score < 1.0
+    # Three of four content tokens match (score 0.75), which is below the threshold.
+    assert resolved["Imaging"] == []
+    lenient = resolve_citations(index, citations_dict, aligner=CitationAligner(index), min_score=0.5)
+    assert [score for _, score in lenient["Imaging"]] == [0.75]
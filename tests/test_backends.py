@@ -0,0 +1,39 @@
+import pytest
+
+from chart_notes.backends import StubBackend
+from chart_notes.citations import extract_note_citations
+from chart_notes.llm import response_text
+from chart_notes.prompts import chart_notes_prompt, chart_notes_system_instruction, chart_notes_user_prompt
+from chart_notes.templates import TEMPLATES
+
+TRANSCRIPT = """Doctor: Good morning, what brings you in for the visit today?
+Patient: I have had a dry cough for about two weeks now.
+Doctor: Any fever or shortness of breath with the cough?
+Patient: A low fever at night, but my breathing has been fine.
+Doctor: I will order a chest X-ray for the cough and start you on an inhaler.
+"""
+
+
+def stub_notes(template, inline):
+    backend = StubBackend()
+    if inline:
+        return response_text(backend.generate([chart_notes_prompt(TRANSCRIPT, template)]))
+    backend = backend.with_system_instruction(chart_notes_system_instruction(template))
+    return response_text(backend.generate([chart_notes_user_prompt(TRANSCRIPT)]))
+
+
+@pytest.mark.parametrize("inline", [True, False], ids=["inline template", "system instruction"])
+@pytest.mark.parametrize("template_name", sorted(TEMPLATES))
+def test_stub_citations_resolve_in_the_transcript(template_name, inline):
+    notes, citations_dict = extract_note_citations(stub_notes(TEMPLATES[template_name], inline))
+    assert notes
+    for note in notes:
+        for reference in citations_dict[note]:
+            assert reference in TRANSCRIPT, reference
+
+
+def test_inline_and_system_instruction_prompts_cover_the_same_sections():
+    template = TEMPLATES[sorted(TEMPLATES)[0]]
+    inline = stub_notes(template, inline=True)
+    assert inline.count("**") == stub_notes(template, inline=False).count("**")
+    assert inline.count("**") > 4
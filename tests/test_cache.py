@@ -0,0 +1,95 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from chart_notes.cache import DiskCache, LRUCache, ResponseCache, content_hash, is_cacheable
+
+CONFIG = {"temperature": 0, "top_k": 34}
+
+
+@pytest.mark.parametrize("config", [None, {}, {"top_k": 34}, {"temperature": 0.7}, {"temperature": 1}])
+def test_only_temperature_zero_is_cacheable(config):
+    assert not is_cacheable(config)
+    cache = ResponseCache()
+    assert cache.key("generate", ["prompt"], "model", config) is None
+    cache.put(None, "value")
+    assert cache.get(None) is None
+    assert cache.stats["uncacheable"] == 1 and cache.stats["stores"] == 0
+
+
+def test_key_depends_on_every_input():
+    cache = ResponseCache()
+    key = cache.key("generate", ["prompt"], "model", CONFIG)
+    assert key == cache.key("generate", ["prompt"], "model", dict(reversed(list(CONFIG.items()))))
+    assert key == content_hash("generate", ["prompt"], "model", CONFIG)
+    others = [cache.key("citations", ["prompt"], "model", CONFIG), cache.key("generate", ["prompt 2"], "model", CONFIG),
+              cache.key("generate", ["prompt"], "model-2", CONFIG),
+              cache.key("generate", ["prompt"], "model", {**CONFIG, "top_k": 1})]
+    assert key not in others and len(set(others)) == len(others)
+
+
+def test_lru_evicts_the_least_recently_used():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert "b" not in cache and cache.get("a") == 1 and cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_disk_cache_round_trips_gzipped_json(tmp_path):
+    disk = DiskCache(str(tmp_path))
+    value = {"text": "Chest pain — two weeks \U0001F622", "numbers": [1, 2.5]}
+    disk.put("key", value)
+    with gzip.open(tmp_path / "key.json.gz", "rt", encoding="utf-8") as cache_file:
+        assert json.load(cache_file) == {"value": value}
+    assert DiskCache(str(tmp_path)).get("key") == value
+    assert disk.get("missing") is None
+
+
+def test_disk_cache_evicts_the_least_recently_used_beyond_max_bytes(tmp_path):
+    value = os.urandom(2000).hex()
+    disk = DiskCache(str(tmp_path))
+    for age, key in enumerate(["old", "used", "new"]):
+        disk.put(key, value)
+        os.utime(tmp_path / f"{key}.json.gz", (1000 + age, 1000 + age))
+        if age == 0:
+            disk.max_bytes = int(disk.total_bytes * 2.5)  # room for two entries
+    assert sorted(os.listdir(tmp_path)) == ["new.json.gz", "used.json.gz"]
+    assert disk.get("used") == value  # refreshes its last-used time
+    disk.put("newest", value)
+    assert sorted(os.listdir(tmp_path)) == ["newest.json.gz", "used.json.gz"]
+    assert disk.total_bytes == sum(os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path))
+    assert DiskCache(str(tmp_path)).total_bytes == disk.total_bytes
+
+
+def test_hits_and_misses_are_counted_per_tier(tmp_path):
+    cache = ResponseCache(directory=str(tmp_path))
+    calls = []
+
+    def generate():
+        calls.append(1)
+        return "notes"
+
+    assert cache.get_or_generate("generate", ["prompt"], "model", CONFIG, generate) == "notes"
+    assert cache.get_or_generate("generate", ["prompt"], "model", CONFIG, generate) == "notes"
+    assert ResponseCache(directory=str(tmp_path)).get(cache.key("generate", ["prompt"], "model", CONFIG)) == "notes"
+    assert len(calls) == 1
+    assert cache.stats == {"memory_hits": 1, "disk_hits": 0, "misses": 1, "stores": 1, "uncacheable": 0}
+    fresh = ResponseCache(directory=str(tmp_path))
+    fresh.get(cache.key("generate", ["prompt"], "model", CONFIG))
+    assert fresh.stats["disk_hits"] == 1
+
+
+def test_a_stream_is_stored_only_once_consumed(tmp_path):
+    cache = ResponseCache()
+    key = cache.key("generate", ["prompt"], "model", CONFIG)
+    chunks = cache.iter_cached(key, lambda: iter(["Chest ", "pain"]))
+    assert next(chunks) == "Chest "
+    chunks.close()
+    assert cache.get(key) is None
+    assert list(cache.iter_cached(key, lambda: iter(["Chest ", "pain"]))) == ["Chest ", "pain"]
+    assert list(cache.iter_cached(key, lambda: iter(["other"]))) == ["Chest pain"]
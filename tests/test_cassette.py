@@ -0,0 +1,43 @@
+import os
+
+from chart_notes.backends import StubBackend
+from chart_notes.cassette import Cassette, RecordingBackend, ReplayBackend
+from chart_notes.llm import response_text
+
+PROMPTS = ["Transcript: Doctor: How long has the cough lasted?\nPatient: About two weeks now, mostly at night.",
+           "Transcript: Doctor: Any allergies to medications?\nPatient: None that I know of at this time.",
+           "Transcript: Doctor: Are you taking anything for the pain?\nPatient: Just ibuprofen twice a day."]
+
+
+def record(path, prompts):
+    backend = RecordingBackend(StubBackend(), Cassette(path))
+    return [response_text(backend.generate([prompt])) for prompt in prompts]
+
+
+def test_replay_returns_the_recorded_responses(tmp_path):
+    path = str(tmp_path / "calls.jsonl.gz")
+    recorded = record(path, PROMPTS)
+    replay = ReplayBackend(Cassette(path), latency="zero")
+    assert [response_text(replay.generate([prompt])) for prompt in PROMPTS] == recorded
+
+
+def test_truncated_recording_keeps_the_completed_calls(tmp_path):
+    path = str(tmp_path / "calls.jsonl.gz")
+    record(path, PROMPTS[:2])
+    complete_size = os.path.getsize(path)
+    recorded = record(path, PROMPTS[2:])
+    with open(path, 'rb') as cassette_file:
+        data = cassette_file.read()
+
+    truncated = str(tmp_path / "truncated.jsonl.gz")
+    for size in range(complete_size, len(data)):
+        with open(truncated, 'wb') as cassette_file:
+            cassette_file.write(data[:size])
+        cassette = Cassette(truncated)
+        # A cut near the end of the last member may leave its line whole; it is never partial.
+        assert len(cassette) in (2, 3), size
+        last = [entries[0]["text"] for entries in cassette.entries.values()][2:]
+        assert last in ([], recorded), size
+        replay = ReplayBackend(cassette, latency="zero")
+        assert response_text(replay.generate([PROMPTS[0]]))
+    assert len(Cassette(path)) == 3
@@ -0,0 +1,44 @@
+from chart_notes.citations import clean_note, extract_note_citations, format_citations_dictionary, numbered_citations
+from chart_notes.pipeline import GENERATION_CONFIG, ChartNotesPipeline
+from chart_notes.resources import PipelineResources
+
+
+def test_reused_number_keeps_each_notes_own_text():
+    chart_notes = """**Chief Complaint:**
+- Dry cough for two weeks. {References: [1]: "dry cough for about two weeks"}
+- Low fever at night. {References: [1]: "a low fever at night"}
+"""
+    notes, citations_dict = extract_note_citations(chart_notes)
+    assert notes == ["Dry cough for two weeks", "Low fever at night"]
+    assert citations_dict["Dry cough for two weeks"] == ["dry cough for about two weeks"]
+    assert citations_dict["Low fever at night"] == ["a low fever at night"]
+
+
+def test_repeated_reference_appears_once_per_note():
+    chart_notes = '- Cough. {References: [1]: "dry cough at night", [1]: "dry cough at night", [2]: "cough"}'
+    assert extract_note_citations(chart_notes)[1] == {"Cough": ["dry cough at night"]}
+
+
+def test_only_bold_template_labels_are_stripped():
+    assert clean_note("- **Chief Complaint:** Chest pain") == "Chest pain"
+    assert clean_note("**Vitals**: Blood pressure elevated") == "Blood pressure elevated"
+    assert clean_note("- Blood pressure: 120/80.") == "Blood pressure: 120/80"
+    assert clean_note("Follow up: in two weeks") == "Follow up: in two weeks"
+
+
+def test_numbered_citations_share_one_numbering_across_notes():
+    citations_dict = {"Cough": ["dry cough at night", "low fever"], "Fever": ["low fever", "chills since Monday"]}
+    numbered = numbered_citations(citations_dict)
+    assert numbered == {
+        "Cough": ['[1]: "dry cough at night"', '[2]: "low fever"'],
+        "Fever": ['[2]: "low fever"', '[3]: "chills since Monday"'],
+    }
+    assert format_citations_dictionary(numbered).splitlines()[:3] == [
+        "Note: Cough", '  [1]: "dry cough at night"', '  [2]: "low fever"']
+
+
+def test_parse_citations_without_fallback_makes_no_model_call(tmp_path):
+    settings = {"model_backend": "stub", "stub_latency": 0.0, "response_cache_dir": str(tmp_path)}
+    pipeline = ChartNotesPipeline(PipelineResources(settings, GENERATION_CONFIG))
+    assert pipeline.parse_citations("Chief complaint: cough, no references.", fallback=False) == ([], {})
+    assert pipeline.resources.backend.calls == 0
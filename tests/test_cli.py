@@ -0,0 +1,47 @@
+import json
+
+from chart_notes.cli import main
+
+TRANSCRIPT = """Doctor: What brings you in today?
+Patient: I have had a dry cough for about two weeks now.
+Doctor: I will order a chest X-ray and start you on an inhaler.
+"""
+
+
+def run_batch_command(tmp_path, inputs):
+    template = tmp_path / "template.txt"
+    template.write_text("**Chief Complaint:**\n**Plan:**\n", encoding="utf-8")
+    out = tmp_path / "out"
+    rc = main(["batch", *map(str, inputs), "--template", str(template), "--out", str(out), "--workers", "2",
+               "--backend", "stub", "--stub-latency", "0", "--response-cache-dir", str(tmp_path / "cache")])
+    return rc, out, json.loads((out / "summary.json").read_text(encoding="utf-8"))
+
+
+def test_batch_writes_the_outputs_and_summary(tmp_path):
+    transcripts = tmp_path / "transcripts"
+    transcripts.mkdir()
+    for name in ("visit-1", "visit-2"):
+        (transcripts / f"{name}.txt").write_text(TRANSCRIPT, encoding="utf-8")
+
+    rc, out, summary = run_batch_command(tmp_path, [transcripts])
+    assert rc == 0
+    assert (summary["files"], summary["succeeded"], summary["failed"]) == (2, 2, 0)
+    assert [result["status"] for result in summary["results"]] == ["ok", "ok"]
+    for name in ("visit-1", "visit-2"):
+        assert "{References:" in (out / f"{name}.chart_notes_with_references.txt").read_text(encoding="utf-8")
+        assert "{References:" not in (out / f"{name}.chart_notes_without_references.txt").read_text(encoding="utf-8")
+        assert (out / f"{name}.citations.txt").read_text(encoding="utf-8").startswith("Note: ")
+
+
+def test_batch_exits_1_when_a_transcript_fails(tmp_path):
+    good, bad = tmp_path / "good.txt", tmp_path / "bad.json"
+    good.write_text(TRANSCRIPT, encoding="utf-8")
+    bad.write_text('{"transcripts": [', encoding="utf-8")
+
+    rc, out, summary = run_batch_command(tmp_path, [good, bad])
+    assert rc == 1
+    assert (summary["files"], summary["succeeded"], summary["failed"]) == (2, 1, 1)
+    failed = next(result for result in summary["results"] if result["status"] == "failed")
+    assert failed["file"] == str(bad)
+    assert failed["error"].startswith("ValueError")
+    assert not (out / "bad.citations.txt").exists()
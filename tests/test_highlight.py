@@ -0,0 +1,74 @@
+from chart_notes.highlight import CitationMatcher, HighlightCache, astral_offsets, fold_case, merge_spans, utf16_spans
+
+TEXT = "Patient: my chest hurts \U0001F622 since Monday. Doctor: \U0001D4D7ow bad, 1–5? Patient: a 7."
+
+
+def utf16_slice(text, start, end):
+    return text.encode("utf-16-le")[2 * start:2 * end].decode("utf-16-le")
+
+
+def test_matcher_reports_overlapping_patterns():
+    matcher = CitationMatcher(["he", "she", "hers", "his"])
+    text = "Ushers"
+    found = sorted((matcher.patterns[index], start, end) for index, start, end in matcher.find(text))
+    assert found == [("he", 2, 4), ("hers", 2, 6), ("she", 1, 4)]
+    assert all(text[start:end].lower() == pattern for pattern, start, end in found)
+
+
+def test_matcher_folds_case_without_moving_offsets():
+    text = "Seen in İSTANBUL; ISTANBUL clinic. Straße"
+    assert len(fold_case(text)) == len(text)
+    matcher = CitationMatcher(["istanbul", "İstanbul", "STRASSE", "straße"])
+    found = sorted((matcher.patterns[index], text[start:end]) for index, start, end in matcher.find(text))
+    # "İ" lower-cases to two characters, so it is kept as is; "ß" is already lower case.
+    assert found == [("istanbul", "ISTANBUL"), ("straße", "Straße"), ("İstanbul", "İSTANBUL")]
+
+
+def test_matcher_ignores_empty_and_whitespace_patterns():
+    matcher = CitationMatcher(["", "   ", "\n", " cough "])
+    assert matcher.patterns == [" cough "]
+    assert matcher.find("a dry cough, a wet cough") == [(0, 6, 11), (0, 19, 24)]
+    assert CitationMatcher([]).find("anything") == []
+
+
+def test_merge_spans_joins_overlapping_and_touching_spans():
+    assert merge_spans([(10, 12), (0, 3), (2, 5), (5, 7)]) == [(0, 7), (10, 12)]
+
+
+def test_utf16_spans_select_the_same_text_after_astral_characters():
+    spans = [(TEXT.index(word), TEXT.index(word) + len(word)) for word in ("chest", "since Monday", "\U0001D4D7ow", "7")]
+    for (start, end), (utf16_start, utf16_end) in zip(spans, utf16_spans(astral_offsets(TEXT), spans)):
+        assert utf16_slice(TEXT, utf16_start, utf16_end) == TEXT[start:end]
+
+
+def test_utf16_spans_are_unchanged_without_astral_characters():
+    text = "café – ok"
+    assert astral_offsets(text) == []
+    assert utf16_spans(astral_offsets(text), [(0, 4), (5, 6)]) == [(0, 4), (5, 6)]
+
+
+def test_span_starting_right_after_an_emoji_skips_both_of_its_code_units():
+    text = "pain \U0001F622since Monday"
+    start = text.index("since")
+    assert astral_offsets(text) == [start - 1]
+    [(utf16_start, utf16_end)] = utf16_spans(astral_offsets(text), [(start, len(text))])
+    assert (utf16_start, utf16_end) == (start + 1, len(text) + 1)
+    assert utf16_slice(text, utf16_start, utf16_end) == "since Monday"
+    # A span ending right after the emoji includes both of its code units.
+    assert utf16_spans(astral_offsets(text), [(0, start)]) == [(0, start + 1)]
+
+
+def test_highlight_cache_resolves_evicted_notes_again():
+    cache = HighlightCache(max_entries=2)
+    resolved = []
+
+    def resolve(note):
+        resolved.append(note)
+        return [(0, len(note))]
+
+    cache.put_all("hash", {"a": [(1, 2)], "bb": [(3, 4)], "ccc": [(5, 6)]})
+    assert len(cache.spans) == 2
+    assert cache.get("hash", "ccc", resolve) == [(5, 6)]
+    assert cache.get("hash", "a", resolve) == [(0, 1)]
+    assert cache.get("other hash", "ccc", resolve) == [(0, 3)]
+    assert resolved == ["a", "ccc"]
@@ -0,0 +1,49 @@
+from chart_notes.index import TranscriptIndex, resolve_citations
+
+TEXT = """Doctor: Any chest pain?
+Patient: Chest pain, yes. The CHEST PAIN comes and goes, and I've had it since May.
+Doctor: Does the chest pain wake you up?
+"""
+
+
+def occurrences(text, phrase):
+    folded, phrase, start, found = text.lower(), phrase.lower(), 0, []
+    while (start := folded.find(phrase, start)) != -1:
+        found.append((start, start + len(phrase)))
+        start += 1
+    return found
+
+
+def test_find_all_folds_case_and_returns_every_occurrence_in_order():
+    index = TranscriptIndex(TEXT)
+    assert index.find_all("chest pain comes and goes") == occurrences(TEXT, "chest pain comes and goes")
+    assert index.find_all("Chest Pain") == occurrences(TEXT, "chest pain")
+    assert len(index.find_all("chest pain")) == 4
+
+
+def test_limit_and_find_return_the_first_occurrences():
+    index = TranscriptIndex(TEXT)
+    assert index.find_all("chest pain", limit=2) == occurrences(TEXT, "chest pain")[:2]
+    assert index.find("CHEST PAIN") == occurrences(TEXT, "chest pain")[0]
+    assert index.find("chest pain radiates") is None
+
+
+def test_queries_shorter_than_the_ngram_use_single_tokens():
+    index = TranscriptIndex(TEXT, n=3)
+    assert index.find_all("wake") == occurrences(TEXT, "wake")
+    assert index.find("I've had") == occurrences(TEXT, "i've had")[0]
+    assert index.find("ive had") == occurrences(TEXT, "i've had")[0]
+    assert index.find_all("...") == []
+
+
+def test_resolve_citations_first_or_all_occurrences():
+    index = TranscriptIndex(TEXT)
+    citations_dict = {"Chest pain": ['[1]: "chest pain"', "since May"], "Fever": ["fever at night"]}
+    first = resolve_citations(index, citations_dict)
+    assert first["Chest pain"] == [(occurrences(TEXT, "chest pain")[0], 1.0),
+                                   (occurrences(TEXT, "since may")[0], 1.0)]
+    assert first["Fever"] == []
+    every = resolve_citations(index, citations_dict, all_occurrences=True)
+    assert [span for span, _ in every["Chest pain"]] == sorted(occurrences(TEXT, "chest pain")
+                                                                + occurrences(TEXT, "since may"))
+    assert every["Fever"] == []
@@ -0,0 +1,44 @@
+from chart_notes.jobs import JobStore, work
+from chart_notes.pipeline import GENERATION_CONFIG, ChartNotesPipeline
+from chart_notes.resources import PipelineResources
+
+TRANSCRIPT = """Doctor: What brings you in today?
+Patient: I have had a dry cough for about two weeks now.
+Doctor: I will order a chest X-ray and start you on an inhaler.
+"""
+
+
+def job_row(store, job_id):
+    return store.connection.execute(
+        "SELECT status, attempts, error, lease_owner, lease_expires FROM jobs WHERE id = ?", (job_id,)
+    ).fetchone()
+
+
+def test_retry_failed_clears_the_error_and_lease(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"), max_attempts=1)
+    job_id, added = store.add(str(tmp_path / "missing.txt"), "Chief Complaint:")
+    assert added
+    job = store.lease("worker-1")
+    store.fail(job.id, "worker-1", "OSError: no such file")
+    assert job_row(store, job_id)[0] == "failed"
+    assert store.failures() == [(str(tmp_path / "missing.txt"), 1, "OSError: no such file")]
+
+    assert store.retry_failed() == 1
+    assert job_row(store, job_id) == ("pending", 0, None, None, None)
+    assert store.failures() == []
+    assert store.counts()["status"] == {"pending": 1}
+
+
+def test_work_runs_each_job_to_done(tmp_path):
+    source = tmp_path / "visit.txt"
+    source.write_text(TRANSCRIPT, encoding="utf-8")
+    store = JobStore(str(tmp_path / "jobs.db"))
+    store.add(str(source), "**Chief Complaint:**\n**Plan:**")
+    settings = {"model_backend": "stub", "stub_latency": 0.0, "response_cache_dir": str(tmp_path / "cache")}
+    pipeline = ChartNotesPipeline(PipelineResources(settings, GENERATION_CONFIG))
+
+    assert work(store, pipeline) == (1, 0)
+    [(result_source, generated, structured)] = list(store.results())
+    assert result_source == str(source)
+    assert "{References:" in generated["chart_notes"]
+    assert structured["notes"]
@@ -0,0 +1,64 @@
+import io
+import json
+
+import pytest
+
+from chart_notes.jsonstream import ItemParser, iter_items
+
+FIXTURES = [
+    ('transcripts.item.speakerTurns.item', {
+        "c": 0.93,
+        "transcripts": [{
+            "confidence": -1.5e-3,
+            "speakerTurns": [
+                {"speakerId": 1, "startTime": "0.5s", "alternatives": [{"recognizedText": "Hello \"doctor\""}]},
+                {"speakerId": 2, "startTime": 12.25, "final": True, "alternatives": [{"recognizedText": "Hi é \U0001F600"}]},
+            ],
+            "language": None,
+        }],
+        "duration": 1E+2,
+    }),
+    ('item', [0.5, -12, 3e10, 1.25E-2, True, False, None, "x", [1.0], {"a": 0.}]),
+    ('transcripts.item', {"transcripts": [10, 2.5e-1, "s", {"nested": [0.1, 2]}], "after": -0.0}),
+    ('item.value', [{"value": 0.93, "other": 1.5}, {"other": 2e3, "value": 100}]),
+]
+
+
+def expected_items(document, path):
+    values = [document]
+    for key in path.split('.'):
+        values = [item for value in values for item in value] if key == 'item' else [value[key] for value in values]
+    return values
+
+
+@pytest.mark.parametrize("path, document", FIXTURES)
+def test_items_split_at_every_offset(path, document):
+    text = json.dumps(document, ensure_ascii=False)
+    expected = expected_items(document, path)
+    for offset in range(len(text) + 1):
+        parser = ItemParser(path)
+        items = parser.feed(text[:offset]) + parser.feed(text[offset:]) + parser.close()
+        assert items == expected, offset
+
+
+@pytest.mark.parametrize("path, document", FIXTURES)
+def test_iter_items_reads_bytes_in_small_chunks(path, document):
+    data = json.dumps(document, ensure_ascii=False).encode('utf-8')
+    for chunk_size in (1, 2, 3, 7):
+        assert list(iter_items(io.BytesIO(data), path, chunk_size=chunk_size)) == expected_items(document, path)
+
+
+def test_number_split_after_decimal_point():
+    parser = ItemParser('transcripts.item')
+    assert parser.feed('{"c": 0.') == []
+    assert parser.feed('93, "transcripts": [1.') == []
+    assert parser.feed('5e') == []
+    assert parser.feed('3]}') == [1500.0]
+    assert parser.close() == []
+
+
+def test_incomplete_document_raises():
+    parser = ItemParser('item')
+    parser.feed('[1, 2')
+    with pytest.raises(ValueError):
+        parser.close()
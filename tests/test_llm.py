@@ -0,0 +1,161 @@
+import asyncio
+import time
+
+import pytest
+
+from chart_notes.backends import StubBackend
+from chart_notes.llm import AdaptiveConcurrency, AsyncLLMClient, TokenBucket
+from chart_notes.metrics import percentile
+
+
+class SlowFirstBackend(StubBackend):
+    """A StubBackend whose first call hangs for ``first_latency`` seconds; counts cancelled calls."""
+
+    def __init__(self, first_latency, **kwargs):
+        super().__init__(**kwargs)
+        self.first_latency = first_latency
+        self.cancelled = 0
+
+    async def generate_async(self, contents, **kwargs):
+        if self.calls == 0:
+            self.calls += 1
+            try:
+                await asyncio.sleep(self.first_latency)
+            except asyncio.CancelledError:
+                self.cancelled += 1
+                raise
+        return await super().generate_async(contents, **kwargs)
+
+
+def test_adaptive_concurrency_halves_on_overload_and_grows_only_on_success():
+    async def run():
+        limit = AdaptiveConcurrency(8, minimum=1, maximum=8)
+        await limit.acquire()
+        await limit.release(overloaded=True)
+        assert limit.limit == 4
+        await limit.acquire()
+        await limit.release(succeeded=True)
+        assert limit.limit == 4.25
+        await limit.acquire()
+        await limit.release()
+        assert limit.limit == 4.25
+
+    asyncio.run(run())
+
+
+def test_limit_shrinks_when_the_service_answers_429():
+    model = StubBackend(latency=0.05, max_concurrent=2)
+    client = AsyncLLMClient(model, max_concurrency=8, max_retries=20, backoff=0.01)
+
+    async def run():
+        return await asyncio.gather(*(client.generate_text(f"prompt {i}") for i in range(8)))
+
+    assert len(asyncio.run(run())) == 8
+    assert model.rejected > 0
+    assert client.stats["rate_limited"] == model.rejected
+    assert client.concurrency_limit < 8
+    assert model.peak_in_flight == 2
+
+
+def test_token_bucket_waits_for_refill():
+    async def run():
+        bucket = TokenBucket(600)  # 10 tokens per second
+        await bucket.acquire(600)
+        started = time.monotonic()
+        await bucket.acquire(5)
+        return time.monotonic() - started
+
+    assert 0.4 <= asyncio.run(run()) < 1.5
+
+
+def test_retries_are_counted_per_call():
+    model = StubBackend(error_rate=0.3, seed=1)
+    client = AsyncLLMClient(model, max_retries=10, backoff=0.0001)
+    call_stats = {}
+    for i in range(10):
+        client.generate_text_sync(f"prompt {i}", call_stats=call_stats)
+    assert call_stats["retries"] == model.rejected > 0
+    assert client.stats["retries"] == model.rejected
+
+
+def test_timeouts_are_retried_then_raised():
+    client = AsyncLLMClient(StubBackend(latency=1.0), max_concurrency=8, timeout=0.05, max_retries=2, backoff=0.001)
+    call_stats = {}
+    with pytest.raises(TimeoutError):
+        client.generate_text_sync("prompt", call_stats=call_stats)
+    assert call_stats == {"timeouts": 3, "retries": 2}
+    assert client.stats["failed"] == 1
+    # Timeouts back off like rate limits.
+    assert client.concurrency_limit == 1
+
+
+def test_other_errors_leave_the_limit_unchanged():
+    client = AsyncLLMClient(StubBackend(error_rate=1.0, error=ValueError), max_concurrency=8, initial_concurrency=4)
+    with pytest.raises(ValueError):
+        client.generate_text_sync("prompt")
+    assert client.concurrency_limit == 4
+    client.backend = StubBackend()
+    client.generate_text_sync("prompt")
+    assert client._limits[0][2].limit == 4.25
+
+
+def test_deadline_stops_retrying():
+    client = AsyncLLMClient(StubBackend(latency=1.0), timeout=0.2, deadline=0.5, max_retries=10,
+                            backoff=0.05)
+    call_stats = {}
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        client.generate_text_sync("prompt", call_stats=call_stats)
+    assert time.monotonic() - started < 0.9
+    assert 2 <= call_stats["timeouts"] < 11
+
+
+def test_hedged_request_wins_and_cancels_the_slow_one():
+    model = SlowFirstBackend(first_latency=5.0, latency=0.01)
+    client = AsyncLLMClient(model, hedge=True, hedge_delay=0.1, hedge_budget=1.0)
+    call_stats = {}
+    started = time.monotonic()
+    client.generate_text_sync("prompt", call_stats=call_stats)
+    assert time.monotonic() - started < 1.0
+    assert call_stats == {"hedges": 1}
+    assert client.stats["hedge_wins"] == 1
+    assert model.calls == 2
+    assert model.cancelled == 1
+    # Both attempts count towards the hedge delay, the cancelled one with the time it ran.
+    samples = sorted(client._latencies["generate"])
+    assert len(samples) == 2
+    assert samples[1] >= 0.1
+
+
+def test_hedge_is_not_sent_without_a_free_concurrency_slot():
+    model = SlowFirstBackend(first_latency=0.3, latency=0.01)
+    client = AsyncLLMClient(model, max_concurrency=1, hedge=True, hedge_delay=0.05, hedge_budget=1.0)
+    call_stats = {}
+    client.generate_text_sync("prompt", call_stats=call_stats)
+    assert call_stats == {}
+    assert client.stats["hedges"] == 0
+    assert client._limits[0][2].in_flight == 0
+
+
+def test_hedge_delay_is_the_nearest_rank_quantile():
+    client = AsyncLLMClient(StubBackend(), hedge=True, hedge_quantile=0.95)
+    for latency in range(1, 21):
+        client._record_latency("generate", float(latency))
+    assert client.hedge_delay_for("generate") == 19.0
+    assert percentile(range(1, 21), 0.95) == 19
+    assert percentile([3, 1, 2], 0.5) == 2
+    assert percentile([], 0.5) is None
+
+
+def test_closing_a_stream_early_releases_its_slot():
+    client = AsyncLLMClient(StubBackend(chunk_chars=5, chunk_interval=0.5), max_concurrency=1)
+    prompt = "Transcript: Doctor: How long has the cough lasted?\nPatient: About two weeks now, mostly at night."
+    chunks = client.stream_text_sync(prompt)
+    assert next(chunks)
+    chunks.close()
+    started = time.monotonic()
+    while client._limits[0][2].in_flight and time.monotonic() - started < 1.0:
+        time.sleep(0.01)
+    assert client._limits[0][2].in_flight == 0
+    client.generate_text_sync(prompt)
+    assert time.monotonic() - started < 1.0
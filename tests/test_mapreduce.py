@@ -0,0 +1,73 @@
+from chart_notes.mapreduce import context_tokens, long_transcript_chars, split_windows
+from chart_notes.pipeline import GENERATION_CONFIG, ChartNotesPipeline
+from chart_notes.resources import PipelineResources
+from chart_notes.transcript import Transcript
+
+TURNS = [
+    "Doctor: What brings you in today?",
+    "Patient: I have had a dry cough for about two weeks now.",
+    "Doctor: Any fever or shortness of breath with the cough?",
+    "Patient: A low fever at night, but my breathing has been fine.",
+    "Doctor: Have you been around anyone who was sick recently?",
+    "Patient: My daughter had a cold last month, nothing since.",
+    "Doctor: I will order a chest X-ray and start you on an inhaler.",
+]
+TRANSCRIPT = Transcript.from_text("\n".join(TURNS))
+
+
+def turn_of(offset, boundaries):
+    return next(index for index, boundary in enumerate(boundaries) if boundary == offset)
+
+
+def test_windows_end_on_turn_boundaries_and_cover_every_turn():
+    windows = split_windows(TRANSCRIPT, max_chars=150, overlap_turns=1)
+    assert len(windows) > 1
+    starts, ends = list(TRANSCRIPT.starts), list(TRANSCRIPT.ends)
+    for start, end in windows:
+        assert start in starts and end in ends
+        assert end - start <= 150
+    assert windows[0][0] == starts[0] and windows[-1][1] == ends[-1]
+    for (previous_start, previous_end), (start, _) in zip(windows, windows[1:]):
+        assert previous_start < start < previous_end
+
+
+def test_overlap_repeats_at_most_overlap_turns():
+    for overlap_turns in (0, 1, 2):
+        windows = split_windows(TRANSCRIPT, max_chars=150, overlap_turns=overlap_turns)
+        starts, ends = list(TRANSCRIPT.starts), list(TRANSCRIPT.ends)
+        for (_, previous_end), (start, _) in zip(windows, windows[1:]):
+            repeated = turn_of(previous_end, ends) - turn_of(start, starts) + 1
+            assert 0 <= repeated <= overlap_turns
+
+
+def test_a_turn_longer_than_the_window_is_split_at_whitespace():
+    long_turn = "Patient: " + " ".join(f"word{i}" for i in range(100))
+    transcript = Transcript.from_text(f"Doctor: Tell me more.\n{long_turn}\nDoctor: Thank you.")
+    windows = split_windows(transcript, max_chars=120, overlap_turns=1)
+    text = transcript.text
+    assert all(end - start <= 120 for start, end in windows)
+    for start, end in windows:
+        assert text[start] != " " and text[end - 1] != " "
+        assert start == 0 or text[start - 1].isspace()
+    covered = " ".join(text[start:end] for start, end in windows)
+    assert all(f"word{i}" in covered.split() for i in range(100))
+
+
+def test_threshold_follows_the_model_context_and_settings():
+    assert context_tokens("models/gemini-1.5-pro") == 2 * context_tokens("gemini-1.5-flash")
+    assert long_transcript_chars(1000) == 2000
+    resources = PipelineResources({"model_context_tokens": 1000})
+    assert (resources.long_transcript_chars, resources.window_chars) == (2000, 1000)
+    resources = PipelineResources({"long_transcript_chars": 300, "window_chars": 120})
+    assert (resources.long_transcript_chars, resources.window_chars) == (300, 120)
+
+
+def test_pipeline_uses_map_reduce_above_the_configured_threshold(tmp_path):
+    settings = {"model_backend": "stub", "stub_latency": 0.0, "response_cache_dir": str(tmp_path),
+                "long_transcript_chars": 200, "window_chars": 150}
+    pipeline = ChartNotesPipeline(PipelineResources(settings, GENERATION_CONFIG))
+    chart_notes, timings = pipeline.generate_chart_notes(TRANSCRIPT, "**Chief Complaint:**\n**Plan:**")
+    assert "{References:" in chart_notes
+    assert timings.first_token is None
+    calls = [span for span in pipeline.metrics.recent if span.name == "model_call"]
+    assert [span.attributes["call"] for span in calls] == ["chart_notes_map_reduce"]
@@ -0,0 +1,43 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from chart_notes.metrics import StageMetrics, percentile
+from chart_notes.pipeline import GENERATION_CONFIG, ChartNotesPipeline
+from chart_notes.resources import PipelineResources
+
+
+def test_percentile_is_nearest_rank():
+    assert percentile([], 0.95) is None
+    assert percentile(range(1, 21), 0.95) == 19
+    assert percentile([3.0, 1.0, 2.0], 0.5) == 2.0
+
+
+def test_concurrent_spans_are_all_written(tmp_path):
+    jsonl_path, prometheus_path = tmp_path / "spans.jsonl", tmp_path / "metrics.prom"
+    metrics = StageMetrics(str(jsonl_path), str(prometheus_path), prometheus_interval=60)
+
+    def run(index):
+        with metrics.span("model_call", template_id="soap", retries=index % 2):
+            pass
+
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(run, range(200)))
+    # The first span writes the file; later ones wait for the interval.
+    assert 'chart_notes_stage_duration_seconds_count{stage="model_call",template_id="soap"} 200' not in \
+        prometheus_path.read_text(encoding="utf-8")
+
+    metrics.flush()
+    text = prometheus_path.read_text(encoding="utf-8")
+    assert 'chart_notes_stage_duration_seconds_count{stage="model_call",template_id="soap"} 200' in text
+    assert 'chart_notes_model_call_events_total{stage="model_call",template_id="soap",event="retry"} 100' in text
+    spans = [json.loads(line) for line in jsonl_path.read_text(encoding="utf-8").splitlines()]
+    assert len(spans) == 200
+
+
+def test_streamed_model_call_records_time_to_first_token(tmp_path):
+    settings = {"model_backend": "stub", "stub_latency": 0.0, "response_cache_dir": str(tmp_path)}
+    pipeline = ChartNotesPipeline(PipelineResources(settings, GENERATION_CONFIG))
+    pipeline.generate_chart_notes("Doctor: What brings you in?\nPatient: A dry cough.", "**Chief Complaint:**")
+    [call_span] = [span for span in pipeline.metrics.recent if span.name == "model_call"]
+    assert 0 <= call_span.attributes["time_to_first_token"] <= call_span.duration
+    assert "chart_notes_time_to_first_token_seconds_count{" in pipeline.metrics.prometheus_text()
@@ -0,0 +1,47 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from chart_notes.backends import StubBackend
+from chart_notes.prefix_cache import TemplatePrefixCache
+
+
+class SlowCachingBackend(StubBackend):
+    """A StubBackend whose cached content takes ``create_latency`` seconds to create; counts the creates."""
+
+    def __init__(self, create_latency, **kwargs):
+        super().__init__(**kwargs)
+        self.create_latency = create_latency
+        self.creates = 0
+
+    def with_cached_content(self, system_instruction, ttl):
+        self.creates += 1
+        time.sleep(self.create_latency)
+        return super().with_cached_content(system_instruction, ttl)
+
+
+def test_each_template_is_created_once_without_blocking_the_others():
+    backend = SlowCachingBackend(create_latency=0.3)
+    cache = TemplatePrefixCache(backend, use_cached_content=True)
+    templates = [f"Template {i}" for i in range(4)] * 3
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(len(templates)) as executor:
+        backends = list(executor.map(cache.backend_for, templates))
+    # Serialized creates would take 4 * 0.3 seconds.
+    assert time.monotonic() - started < 0.9
+    assert backend.creates == 4
+    assert cache.stats["created"] == 4
+    assert cache.stats["reused"] == 8
+    assert all(created is backends[i % 4] for i, created in enumerate(backends))
+    assert backends[0].system_instruction == "Template 0"
+
+
+def test_failed_cached_content_falls_back_to_the_system_instruction():
+    class FailingBackend(StubBackend):
+        def with_cached_content(self, system_instruction, ttl):
+            raise ValueError("below the minimum cacheable size")
+
+    cache = TemplatePrefixCache(FailingBackend(), use_cached_content=True)
+    assert cache.backend_for("Template").system_instruction == "Template"
+    assert cache.stats["cache_errors"] == 1
+    assert cache.stats["system_instruction"] == 1
@@ -0,0 +1,163 @@
+import asyncio
+import json
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from chart_notes.pipeline import GENERATION_CONFIG, ChartNotesPipeline
+from chart_notes.resources import PipelineResources
+from chart_notes.service import ChartNotesService
+
+TRANSCRIPT = """Doctor: Good morning, what brings you in today?
+Patient: I have had a dry cough for about two weeks now.
+Doctor: Any fever or shortness of breath with the cough?
+Patient: A low fever at night, but my breathing has been fine.
+Doctor: I will order a chest X-ray and start you on an inhaler.
+"""
+
+
+def make_service(tmp_path, stub_latency=0.0, **options):
+    settings = {"model_backend": "stub", "stub_latency": stub_latency, "response_cache_dir": str(tmp_path)}
+    pipeline = ChartNotesPipeline(PipelineResources(settings, GENERATION_CONFIG))
+    return ChartNotesService(pipeline, **options)
+
+
+def client_for(service):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=service), base_url="http://test")
+
+
+def parse_events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+async def submit(client, transcript=TRANSCRIPT):
+    return await client.post("/jobs", params={"template_id": "template_1"}, content=transcript,
+                             headers={"content-type": "text/plain"})
+
+
+def test_job_streams_notes_and_resolves_citations(tmp_path):
+    service = make_service(tmp_path)
+
+    async def run():
+        async with client_for(service) as client:
+            response = await submit(client)
+            assert response.status_code == 202
+            job_id = response.json()["job_id"]
+            assert response.headers["location"] == f"/jobs/{job_id}"
+            assert "total;dur=" in response.headers["server-timing"]
+
+            stream = await client.get(f"/jobs/{job_id}/stream")
+            assert stream.headers["content-type"] == "text/event-stream"
+            events = parse_events(stream.text)
+            citations = await client.get(f"/jobs/{job_id}/citations")
+        await service.shutdown()
+        return events, citations
+
+    events, citations = asyncio.run(run())
+    streamed = "".join(data["text"] for event, data in events if event == "notes")
+    assert events[-1][0] == "status"
+    assert events[-1][1]["status"] == "done"
+    assert streamed.strip() == events[-1][1]["chart_notes"]
+
+    assert citations.status_code == 200
+    notes = citations.json()["notes"]
+    assert notes
+    for note in notes:
+        assert note["spans"]
+        assert note["scores"] == [1.0] * len(note["spans"])
+        for start, end in note["spans"]:
+            assert TRANSCRIPT[start:end].strip()
+
+
+def test_full_queue_answers_429(tmp_path):
+    service = make_service(tmp_path, stub_latency=0.5, max_in_flight=1, queue_size=1)
+
+    async def run():
+        async with client_for(service) as client:
+            responses = [await submit(client, f"{TRANSCRIPT}Patient: visit {i}.\n") for i in range(4)]
+            health = (await client.get("/healthz")).json()
+        await service.shutdown()
+        return responses, health
+
+    responses, health = asyncio.run(run())
+    statuses = [response.status_code for response in responses]
+    assert statuses[0] == 202
+    assert 429 in statuses
+    rejected = [response for response in responses if response.status_code == 429]
+    assert all(response.headers["retry-after"] for response in rejected)
+    assert health["rejected"] == len(rejected)
+
+
+def test_unknown_template_is_rejected(tmp_path):
+    service = make_service(tmp_path)
+
+    async def run():
+        async with client_for(service) as client:
+            response = await client.post("/jobs", params={"template_id": "nope"}, content=TRANSCRIPT)
+        await service.shutdown()
+        return response
+
+    assert asyncio.run(run()).status_code == 400
+
+
+def test_cancelled_job_is_counted_as_failed(tmp_path):
+    service = make_service(tmp_path, stub_latency=2.0, max_in_flight=1)
+
+    async def run():
+        async with client_for(service) as client:
+            job_id = (await submit(client)).json()["job_id"]
+            while service.jobs[job_id].status != "running":
+                await asyncio.sleep(0.01)
+        await service.shutdown()
+        return service.jobs[job_id]
+
+    job = asyncio.run(run())
+    assert job.status == "failed"
+    assert service.stats["failed"] == 1
+
+
+def test_shutdown_fails_queued_jobs_and_outlives_the_loop(tmp_path):
+    service = make_service(tmp_path, stub_latency=2.0, max_in_flight=1, queue_size=2)
+
+    async def run():
+        async with client_for(service) as client:
+            job_ids = [(await submit(client)).json()["job_id"]]
+            while service.jobs[job_ids[0]].status != "running":
+                await asyncio.sleep(0.01)
+            for i in range(2):
+                job_ids.append((await submit(client, f"{TRANSCRIPT}Patient: visit {i}.\n")).json()["job_id"])
+        await service.shutdown()
+        return [service.jobs[job_id] for job_id in job_ids]
+
+    jobs = asyncio.run(run())
+    assert [job.status for job in jobs] == ["failed"] * 3
+    assert "before the job ran" in jobs[2].error
+    assert service.stats["failed"] == 3
+    # The job left running on the executor reports progress after the loop has closed.
+    service._notify_threadsafe(jobs[0])
+
+
+def test_only_the_latest_finished_jobs_are_kept(tmp_path):
+    service = make_service(tmp_path, max_finished_jobs=2)
+
+    async def run():
+        async with client_for(service) as client:
+            job_ids = [(await submit(client, f"{TRANSCRIPT}Patient: visit {i}.\n")).json()["job_id"] for i in range(4)]
+            while service.stats["done"] < 4:
+                await asyncio.sleep(0.01)
+        await service.shutdown()
+        return job_ids
+
+    job_ids = asyncio.run(run())
+    assert len(service.jobs) == 2
+    assert set(service.jobs) <= set(job_ids)
+
+
+def test_queue_size_must_be_positive(tmp_path):
+    with pytest.raises(ValueError):
+        make_service(tmp_path, queue_size=0)
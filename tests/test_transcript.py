@@ -0,0 +1,22 @@
+import io
+import json
+import math
+
+from chart_notes.transcript import Transcript, parse_seconds
+
+
+def test_unparsable_times_are_unknown():
+    assert parse_seconds("01:02") == 62.0
+    assert parse_seconds({"seconds": "12", "nanos": 5e8}) == 12.5
+    for value in ("1:xx", "soon", {"seconds": "?"}, [1], None):
+        assert math.isnan(parse_seconds(value))
+
+
+def test_json_upload_with_a_malformed_time_keeps_the_turn():
+    data = {"transcripts": [{"speakerTurns": [
+        {"speakerTag": 1, "startTime": "00:05", "alternatives": [{"recognizedText": "What brings you in?"}]},
+        {"speakerTag": 2, "startTime": "0a:07", "alternatives": [{"recognizedText": "A dry cough."}]},
+    ]}]}
+    transcript = Transcript.from_json(io.BytesIO(json.dumps(data).encode("utf-8")))
+    assert [turn.text for turn in transcript] == ["What brings you in?", "A dry cough."]
+    assert transcript.as_dict()["times"] == [5.0, None]
@@ -0,0 +1,47 @@
+"""Streamlit component that shows a transcript and highlights citation spans in the browser.
+
+The transcript text is sent to the browser once per upload. After that, each note switch
+sends only the selected note's span offsets, so the websocket payload per interaction is
+O(spans) instead of O(transcript). The frontend (frontend/index.html, plain JavaScript
+with no build step) applies the highlights, renders only the blocks of text near the
+visible area, and scrolls to the first highlighted span.
+
+The frontend reports the hash of the text it holds as the component value. The text is
+sent again only when that hash differs from the current transcript's, for example after
+a new upload or when the browser has remounted the component.
+"""
+
+import os
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+from chart_notes.highlight import astral_offsets, merge_spans, utf16_spans
+
+_FRONTEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "frontend")
+_component = components.declare_component("transcript_viewer", path=_FRONTEND_DIR)
+
+DEFAULT_HEIGHT = 600
+
+
+def transcript_viewer(text, text_hash, spans=(), astral=None, height=DEFAULT_HEIGHT, key="transcript_viewer"):
+    """Show ``text`` with ``spans`` ((start, end) character offsets) highlighted; returns True if the text was sent.
+
+    ``text_hash`` identifies the text (e.g. PreparedTranscript.text_hash). ``key`` must be
+    stable across reruns, so the browser keeps the text it has already received. The
+    offsets are sent in UTF-16 code units, which is how the browser indexes the text;
+    pass the text's ``astral`` offsets (PreparedTranscript.astral_offsets) so they are
+    not searched for again on every rerun.
+    """
+    if astral is None:
+        astral = astral_offsets(text)
+    send_text = st.session_state.get(key) != text_hash
+    _component(
+        text=text if send_text else None,
+        text_hash=text_hash,
+        spans=[[start, end] for start, end in utf16_spans(astral, merge_spans(spans))],
+        height=height,
+        key=key,
+        default=None,
+    )
+    return send_text